@@ -0,0 +1,60 @@
+"""Потоковое чтение Excel против pd.read_excel: время и пиковая память
+
+Запуск: python -m benchmarks.bench_excel_stream [--sizes 10000 100000]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from src.services.table_reader import ExcelReader
+
+
+def make_workbook(path: str, rows: int, extra_columns: int = 5) -> None:
+    """Создает книгу с датами, значениями и лишними столбцами, которые читать не нужно"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["Date", "Value"] + [f"Extra{i}" for i in range(extra_columns)])
+    start = date(2000, 1, 1)
+    for i in range(rows):
+        sheet.append([start + timedelta(days=i % 9000), i % 1000] + ["x" * 8] * extra_columns)
+    workbook.save(path)
+
+
+def _measure(reader: ExcelReader) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    reader.read()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--chunk-size", type=int, default=ExcelReader.DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'pandas, s':>10} {'stream, s':>10} {'pandas peak, MB':>16} {'stream peak, MB':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.xlsx")
+            make_workbook(path, size)
+
+            full_time, full_peak = _measure(ExcelReader(path, streaming=False))
+            stream_time, stream_peak = _measure(
+                ExcelReader(path, streaming=True, chunk_size=args.chunk_size)
+            )
+            print(
+                f"{size:>10} {full_time:>10.2f} {stream_time:>10.2f} "
+                f"{full_peak / 2**20:>16.1f} {stream_peak / 2**20:>16.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Пропускная способность ImageGen против локального заменителя OpenRouter
+
+Запуск: python -m benchmarks.bench_image_gen [--images 32] [--latency 0.5] [--workers 8]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.fakes.openrouter_fake import FakeOpenRouterServer
+from src.services.image_generator import ImageGen
+from src.services.image_store import ImageStore
+from src.services.request_scheduler import RequestScheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--image-size", type=int, default=64, help="сторона PNG в пикселях")
+    args = parser.parse_args()
+
+    numbers = [str(n) for n in range(args.images)]
+    # Изображения пишутся во временное хранилище, а не в images/
+    with (
+        tempfile.TemporaryDirectory() as tmp_dir,
+        FakeOpenRouterServer(latency=args.latency, image_size=args.image_size) as server,
+    ):
+        store = ImageStore(root=Path(tmp_dir), db_path=Path(tmp_dir) / "store.sqlite3")
+        # Без лимита частоты планировщика: заменитель не ограничивает запросы
+        gen = ImageGen(
+            api_key="bench", url=server.url, max_workers=args.workers, store=store,
+            scheduler=RequestScheduler(rate=0, max_concurrency=args.workers),
+        )
+        paths = []
+        try:
+            start = time.perf_counter()
+            for number in numbers[: max(1, args.images // args.workers)]:
+                paths.append(gen.create(number))
+            sequential = (time.perf_counter() - start) / len(paths)
+
+            start = time.perf_counter()
+            results = gen.create_many(numbers)
+            elapsed = time.perf_counter() - start
+            paths += [r.image_path for r in results if r.ok]
+        finally:
+            gen.close()
+
+    failed = sum(not r.ok for r in results)
+    print(f"последовательно: {1 / sequential:.1f} изобр./с")
+    print(
+        f"параллельно ({args.workers} потоков): {len(numbers) / elapsed:.1f} изобр./с, "
+        f"ошибок: {failed}, пик одновременных запросов: {server.peak_in_flight}"
+    )
+    print(f"пиковый буфер на изображение: {gen.peak_buffer_bytes / 1024:.0f} КБ")
+
+
+if __name__ == "__main__":
+    main()
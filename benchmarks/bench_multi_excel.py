@@ -0,0 +1,37 @@
+"""Параллельная загрузка нескольких книг Excel в одну таблицу
+
+Запуск: python -m benchmarks.bench_multi_excel [--files 8] [--rows 50000] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.bench_excel_stream import make_workbook
+from src.services.multi_source import MultiSourceLoader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=50_000, help="строк в каждой книге")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"ядер: {os.process_cpu_count()}, книг: {args.files} по {args.rows} строк")
+    print(f"{'процессов':>10} {'время, с':>10} {'ускорение':>10} {'строк':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"book_{i:02d}.xlsx") for i in range(args.files)]
+        for path in paths:
+            make_workbook(path, args.rows, extra_columns=0)
+
+        base = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            table = MultiSourceLoader(max_workers=workers).load_excel(paths)
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print(f"{workers:>10} {elapsed:>10.2f} {base / elapsed:>9.2f}x {len(table):>10}")
+
+
+if __name__ == "__main__":
+    main()
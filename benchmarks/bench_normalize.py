@@ -0,0 +1,90 @@
+"""Сравнение нормализации таблицы: объекты date против колонок datetime64[D]
+
+Запуск: python -m benchmarks.bench_normalize [--sizes 1000 100000 1000000]
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from src.services.table_reader import TableReader
+
+
+class _BenchReader(TableReader):
+    def read(self):
+        raise NotImplementedError
+
+
+def make_raw_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Синтетическая «сырая» таблица: даты строками в формате dd.mm.YYYY"""
+    rng = np.random.default_rng(seed)
+    days = np.datetime64("2000-01-01") + rng.integers(0, 365 * 25, rows)
+    dates = pd.Series(days.astype("datetime64[s]")).dt.strftime("%d.%m.%Y")
+    values = rng.integers(0, 1000, rows).astype(str)
+    return pd.DataFrame({"Date": dates, "Value": values})
+
+
+def legacy_normalize(reader: TableReader, df: pd.DataFrame) -> pd.DataFrame:
+    """Прежняя реализация: колонка Python-объектов date"""
+    df = df.copy()
+    df[df.columns[0]] = pd.to_datetime(
+        df.iloc[:, 0], errors="coerce", format=reader.date_format
+    ).apply(lambda x: x.date() if pd.notna(x) else None)
+    df[df.columns[1]] = pd.to_numeric(df.iloc[:, 1], errors="coerce").fillna(0).astype("int64")
+    return df
+
+
+def _measure(func, *args) -> tuple[float, int, object]:
+    """Время измеряется отдельно от пиковой памяти: tracemalloc сильно замедляет код"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def run(sizes: list[int]) -> list[dict]:
+    reader = _BenchReader()
+    rows = []
+    for size in sizes:
+        raw = make_raw_table(size)
+
+        legacy_time, legacy_peak, legacy = _measure(legacy_normalize, reader, raw)
+        typed_time, typed_peak, typed = _measure(reader._normalize_table, raw)
+
+        rows.append(
+            {
+                "rows": size,
+                "legacy_seconds": legacy_time,
+                "typed_seconds": typed_time,
+                "legacy_peak_bytes": legacy_peak,
+                "typed_peak_bytes": typed_peak,
+                "legacy_result_bytes": int(legacy.memory_usage(deep=True).sum()),
+                "typed_result_bytes": typed.nbytes,
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy, s':>10} {'typed, s':>10} {'speedup':>8} "
+          f"{'legacy, MB':>11} {'typed, MB':>10} {'legacy peak':>12} {'typed peak':>11}")
+    for row in run(args.sizes):
+        print(
+            f"{row['rows']:>10} {row['legacy_seconds']:>10.3f} {row['typed_seconds']:>10.3f} "
+            f"{row['legacy_seconds'] / row['typed_seconds']:>7.1f}x "
+            f"{row['legacy_result_bytes'] / 2**20:>11.1f} {row['typed_result_bytes'] / 2**20:>10.1f} "
+            f"{row['legacy_peak_bytes'] / 2**20:>12.1f} {row['typed_peak_bytes'] / 2**20:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Устойчивая пропускная способность ImageGen против заменителя OpenRouter с квотами
+
+Сервер пропускает не больше --quota запросов в секунду и --max-concurrent
+одновременных, остальным отвечает 429 с Retry-After. Сравниваются планировщик
+без ограничения частоты (подстраивается только по отказам: Retry-After и AIMD),
+с частотой по заголовкам X-RateLimit-* (rate не задан) и с ограничением --rate.
+
+Запуск: python -m benchmarks.bench_rate_limit [--images 120] [--quota 20] [--rate 18]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.fakes.openrouter_fake import FakeOpenRouterServer
+from src.services.image_generator import ImageGen
+from src.services.image_store import ImageStore
+from src.services.request_scheduler import RequestScheduler
+
+
+def run(args, rate: float | None) -> dict:
+    with (
+        tempfile.TemporaryDirectory() as tmp_dir,
+        FakeOpenRouterServer(
+            latency=args.latency,
+            quota=args.quota,
+            quota_burst=args.burst,
+            max_concurrent=args.max_concurrent,
+        ) as server,
+    ):
+        store = ImageStore(root=Path(tmp_dir), db_path=Path(tmp_dir) / "store.sqlite3")
+        scheduler = RequestScheduler(rate=rate, burst=args.burst, max_concurrency=args.workers)
+        gen = ImageGen(
+            api_key="bench", url=server.url, max_workers=args.workers, store=store, scheduler=scheduler
+        )
+        try:
+            start = time.perf_counter()
+            results = gen.create_many(str(n) for n in range(args.images))
+            elapsed = time.perf_counter() - start
+        finally:
+            gen.close()
+
+    return {
+        "throughput": sum(r.ok for r in results) / elapsed,
+        "failed": sum(not r.ok for r in results),
+        "throttled": server.throttled,
+        "peak": server.peak_in_flight,
+        "limit": scheduler.limiter.limit,
+        "rate": scheduler.bucket.rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--quota", type=float, default=20.0, help="квота сервера, запросов в секунду")
+    parser.add_argument("--burst", type=int, default=8, help="запас квоты сервера")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="квота одновременных запросов")
+    parser.add_argument("--rate", type=float, default=None, help="лимит планировщика (по умолчанию 0.9 квоты)")
+    args = parser.parse_args()
+    rate = args.rate if args.rate is not None else args.quota * 0.9
+
+    print(f"квота сервера: {args.quota:g} запр./с, {args.max_concurrent} одновременно")
+    for name, limit in (
+        ("без лимита частоты", 0),
+        ("по заголовкам X-RateLimit", None),
+        (f"лимит {rate:g} запр./с", rate),
+    ):
+        stats = run(args, limit)
+        print(
+            f"{name}: {stats['throughput']:.1f} изобр./с, ответов 429: {stats['throttled']}, "
+            f"ошибок: {stats['failed']}, пик одновременных: {stats['peak']}, "
+            f"предел AIMD в конце: {stats['limit']:.1f}, частота в конце: {stats['rate'] or 0:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
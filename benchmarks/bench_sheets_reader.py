@@ -0,0 +1,59 @@
+"""GoogleSheetsReader против локального заменителя gspread: полная, повторная и дозагрузка
+
+Запуск: python -m benchmarks.bench_sheets_reader [--rows 100000] [--extra-columns 10]
+"""
+import argparse
+import tempfile
+import time
+from benchmarks.fakes.gspread_fake import FakeClient
+from src.services.table_reader import GoogleSheetsReader
+
+
+def make_rows(rows: int, extra_columns: int, offset: int = 0) -> list[list[str]]:
+    return [
+        [f"{(i % 28) + 1:02d}.{(i % 12) + 1:02d}.2025", str(i % 1000)] + ["x"] * extra_columns
+        for i in range(offset, offset + rows)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--extra-columns", type=int, default=10)
+    parser.add_argument("--appended", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    client = FakeClient(latency=args.latency)
+    header = ["Date", "Value"] + [f"Extra{i}" for i in range(args.extra_columns)]
+    sheet = client.add_spreadsheet("bench", [header] + make_rows(args.rows, args.extra_columns))
+
+    start = time.perf_counter()
+    sheet.get_all_values()
+    legacy = time.perf_counter() - start
+    legacy_cells = sheet.cells_sent
+    print(f"{'get_all_values (прежний способ)':<34} {legacy:>8.3f} s {legacy_cells:>10} cells")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        reader = GoogleSheetsReader("bench", client=client, cache_dir=cache_dir)
+
+        def measure(title: str) -> None:
+            sheet.requests = sheet.cells_sent = 0
+            start = time.perf_counter()
+            table = reader.read()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{title:<34} {elapsed:>8.3f} s {sheet.cells_sent:>10} cells "
+                f"{sheet.requests:>3} req  [{reader.last_fetch}, {len(table)} rows]"
+            )
+
+        measure("первая загрузка")
+        measure("без изменений")
+        sheet.append_rows(make_rows(args.appended, args.extra_columns, offset=args.rows))
+        measure(f"добавлено {args.appended} строк")
+        sheet.update_row(len(sheet.rows) - 1, ["01.01.2025", "1"] + ["x"] * args.extra_columns)
+        measure("изменена последняя строка")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Время запуска: импорт модуля в чистом интерпретаторе и разбор -X importtime
+
+Запуск: python -m benchmarks.bench_startup [--module src.ui.app_ui] [--runs 5] [--top 15]
+Проверка в CI: --max-ms 300 --forbid pandas neo4j requests gspread PIL (код выхода 1)
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("pandas", "neo4j", "requests", "gspread", "google.oauth2", "PIL", "numpy", "dotenv")
+
+
+def _run(module: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    args = [sys.executable]
+    if importtime:
+        args += ["-X", "importtime"]
+    # Список загруженных модулей печатается после импорта, чтобы не влиять на замер
+    code = f"import sys; import {module}; print('\\n'.join(sys.modules))"
+    env = {**os.environ, "PYTHONPATH": str(PROJECT_ROOT)}
+    return subprocess.run(
+        args + ["-c", code], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def measure_wall(module: str, runs: int) -> float:
+    """Медианное время запуска интерпретатора с импортом модуля, мс"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        _run(module)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, float, float]]:
+    """Строки "import time: self | cumulative | module" -> [(модуль, self мс, cumulative мс)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="src.ui.app_ui")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="сколько самых дорогих импортов показать")
+    parser.add_argument("--max-ms", type=float, help="предельное медианное время запуска")
+    parser.add_argument("--forbid", nargs="*", default=[], help="модули, которые не должны загружаться")
+    args = parser.parse_args()
+
+    baseline = measure_wall("sys", args.runs)
+    wall = measure_wall(args.module, args.runs)
+
+    result = _run(args.module, importtime=True)
+    loaded = set(result.stdout.split())
+    rows = parse_importtime(result.stderr)
+    total = next((cumulative for name, _, cumulative in rows if name == args.module), 0.0)
+
+    print(f"запуск с импортом {args.module}: {wall:.0f} мс (пустой интерпретатор: {baseline:.0f} мс)")
+    print(f"импорт по -X importtime: {total:.0f} мс, модулей: {len(rows)}")
+    print(f"\n{'модуль':<50} {'self, мс':>9} {'всего, мс':>10}")
+    for name, self_ms, cumulative_ms in sorted(rows, key=lambda row: -row[2])[: args.top]:
+        print(f"{name:<50} {self_ms:>9.1f} {cumulative_ms:>10.1f}")
+
+    heavy = [name for name in HEAVY_MODULES if name in loaded]
+    print(f"\nзагружены тяжелые модули: {', '.join(heavy) or 'нет'}")
+
+    failures = []
+    if args.max_ms is not None and wall > args.max_ms:
+        failures.append(f"время запуска {wall:.0f} мс больше {args.max_ms:.0f} мс")
+    failures += [f"загружен запрещенный модуль {name}" for name in args.forbid if name in loaded]
+    for failure in failures:
+        print(f"ОШИБКА: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Задержка поиска похожих изображений во встроенном ANN-индексе (VectorIndex)
+
+Запуск: python -m benchmarks.bench_vector_search [--size 100000] [--queries 200]
+"""
+import argparse
+import time
+import numpy as np
+from src.services.image_embedding import EMBEDDING_DIM
+from src.services.vector_index import VectorIndex
+
+
+def make_vectors(size: int, clusters: int = 500, seed: int = 0) -> np.ndarray:
+    """Синтетические нормированные векторы, сгруппированные вокруг центров кластеров"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, EMBEDDING_DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)]
+    vectors += 0.35 * rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _latencies(search, queries: np.ndarray, k: int) -> tuple[np.ndarray, list]:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query, k))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.size)
+    ids = [str(i) for i in range(args.size)]
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.size, args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    ann = VectorIndex(EMBEDDING_DIM)
+    exact = VectorIndex(EMBEDDING_DIM, brute_force_below=args.size + 1)
+    start = time.perf_counter()
+    ann.add(ids, vectors)
+    ann.search(queries[0], args.k)
+    build = time.perf_counter() - start
+    exact.add(ids, vectors)
+
+    ann_ms, ann_results = _latencies(ann.search, queries, args.k)
+    exact_ms, exact_results = _latencies(exact.search, queries, args.k)
+    recall = np.mean([
+        len({i for i, _ in a} & {i for i, _ in e}) / args.k
+        for a, e in zip(ann_results, exact_results)
+    ])
+
+    print(f"векторов: {args.size}, размерность: {EMBEDDING_DIM}, построение индекса: {build:.2f} с")
+    for title, ms in (("LSH", ann_ms), ("перебор", exact_ms)):
+        print(f"{title:>8}: p50 {np.percentile(ms, 50):.2f} мс, p95 {np.percentile(ms, 95):.2f} мс")
+    print(f"recall@{args.k}: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Локальные заменители внешних сервисов для офлайн-бенчмарков"""
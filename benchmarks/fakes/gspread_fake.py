@@ -0,0 +1,113 @@
+"""Офлайн-заменитель клиента gspread.
+
+Реализует только методы, которые использует GoogleSheetsReader:
+Client.open_by_key, Spreadsheet.values_batch_get, Spreadsheet.worksheets и
+Spreadsheet.get_lastUpdateTime.
+Каждый «сетевой» вызов засыпает на latency секунд и учитывается в счетчиках.
+"""
+import re
+import time
+from datetime import datetime, timezone
+
+_RANGE_RE = re.compile(r"^(?:(?:'((?:[^']|'')+)'|([^!']+))!)?([A-Z]+)(\d*):([A-Z]+)(\d*)$")
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - ord("A") + 1
+    return index - 1
+
+
+class FakeWorksheet:
+    def __init__(self, title: str):
+        self.title = title
+
+
+class FakeSpreadsheet:
+    def __init__(
+        self,
+        sheet_id: str,
+        rows: list[list[str]],
+        latency: float = 0.0,
+        worksheets: dict[str, list[list[str]]] | None = None,
+    ):
+        """rows - первый лист "Sheet1", worksheets - дополнительные листы"""
+        self.id = sheet_id
+        self.rows = rows
+        self.sheets = {"Sheet1": rows, **(worksheets or {})}
+        self.latency = latency
+        self.requests = 0
+        self.cells_sent = 0
+        self._touch()
+
+    def _touch(self) -> None:
+        self._modified = datetime.now(timezone.utc).isoformat()
+
+    def _network(self) -> None:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def append_rows(self, rows: list[list[str]]) -> None:
+        self.rows.extend(rows)
+        self._touch()
+
+    def update_row(self, index: int, row: list[str]) -> None:
+        self.rows[index] = row
+        self._touch()
+
+    def get_lastUpdateTime(self) -> str:
+        self._network()
+        return self._modified
+
+    def worksheets(self) -> list[FakeWorksheet]:
+        self._network()
+        return [FakeWorksheet(title) for title in self.sheets]
+
+    def get_all_values(self) -> list[list[str]]:
+        self._network()
+        self.cells_sent += sum(len(row) for row in self.rows)
+        return [list(row) for row in self.rows]
+
+    def values_batch_get(self, ranges: list[str], params: dict | None = None) -> dict:
+        self._network()
+        value_ranges = []
+        for range_name in ranges:
+            match = _RANGE_RE.match(range_name)
+            if match is None:
+                raise ValueError(f"Неподдерживаемый диапазон: {range_name}")
+            quoted, plain, first_col, first_row, last_col, last_row = match.groups()
+            title = quoted.replace("''", "'") if quoted else plain
+            rows = self.sheets[title] if title else self.rows
+            start = int(first_row or 1) - 1
+            stop = int(last_row) if last_row else len(rows)
+            col_from, col_to = _column_index(first_col), _column_index(last_col) + 1
+
+            values = [row[col_from:col_to] for row in rows[start:stop]]
+            self.cells_sent += sum(len(row) for row in values)
+            value_ranges.append({"range": range_name, "values": values})
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+
+class FakeClient:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.spreadsheets: dict[str, FakeSpreadsheet] = {}
+
+    def add_spreadsheet(
+        self,
+        sheet_id: str,
+        rows: list[list[str]],
+        worksheets: dict[str, list[list[str]]] | None = None,
+    ) -> FakeSpreadsheet:
+        sheet = FakeSpreadsheet(sheet_id, rows, self.latency, worksheets)
+        self.spreadsheets[sheet_id] = sheet
+        return sheet
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        if key not in self.spreadsheets:
+            raise KeyError(f"Таблица {key} не найдена")
+        sheet = self.spreadsheets[key]
+        sheet._network()
+        return sheet
@@ -0,0 +1,264 @@
+"""Офлайн-заменитель драйвера Neo4j для GraphDBService.
+
+Понимает только запросы из src.services.graph_service (сопоставление по
+тексту запроса) и хранит узлы Image в памяти с упорядоченным индексом по сумме
+и корзинами SumBucket, поэтому сложность операций близка к серверной с
+индексами. Остальные запросы (схема, EXPLAIN) возвращают пустой результат.
+Каждый вызов run() засыпает на latency секунд, имитируя сетевой обмен.
+
+    service = GraphDBService(driver=FakeNeo4jDriver(latency=0.001), ensure_schema=False)
+"""
+import bisect
+import threading
+import time
+import numpy as np
+from neo4j.exceptions import ClientError
+from src.services import graph_service as gs
+
+
+class FakeRecord:
+    def __init__(self, data: dict):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def data(self) -> dict:
+        return dict(self._data)
+
+
+class FakeResult:
+    def __init__(self, rows: list[dict]):
+        self._records = [FakeRecord(row) for row in rows]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def consume(self):
+        return FakeSummary()
+
+    def single(self) -> FakeRecord | None:
+        return self._records[0] if self._records else None
+
+
+class FakeSummary:
+    plan = None
+
+
+class FakeSession:
+    def __init__(self, driver: "FakeNeo4jDriver"):
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def run(self, query: str, parameters: dict | None = None, **params) -> FakeResult:
+        return self._driver._execute(query, {**(parameters or {}), **params})
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class FakeNeo4jDriver:
+    def __init__(self, latency: float = 0.0, vector_index: bool = True):
+        """vector_index=False - сервер без векторных индексов (GraphDBService
+        переходит на VectorIndex в памяти процесса)"""
+        self.latency = latency
+        self.vector_index = vector_index
+        self.requests = 0
+        self.images: dict[str, dict] = {}
+        self._by_sum: list[tuple[float, str]] = []
+        self._buckets: dict[tuple[int, int], set[str]] = {}
+        self._by_sum_key: dict[int, set[str]] = {}
+        self._embedded_cache: tuple[list[str], np.ndarray] | None = None
+        self._lock = threading.Lock()
+        self._handlers = {
+            gs.PUSH_IMAGE_NODES_QUERY: self._push,
+            gs.FIND_BY_SUM_RANGE_QUERY: self._sum_range,
+            gs.FIND_IN_BUCKETS_QUERY: self._in_buckets,
+            gs.FIND_NEAREST_ABOVE_QUERY: self._nearest_above,
+            gs.FIND_NEAREST_BELOW_QUERY: self._nearest_below,
+            gs.FIND_BY_EMBEDDING_QUERY: self._by_embedding,
+            gs.FIND_BY_IDS_QUERY: self._by_ids,
+            gs.FIND_SIMILAR_BY_SUM_PAGE_QUERY: self._similar_by_sum_page,
+            gs.COUNT_SIMILAR_BY_SUM_QUERY: self._count_similar_by_sum,
+            gs.LOAD_EMBEDDINGS_QUERY: self._load_embeddings,
+            gs.IMAGE_PATHS_QUERY: self._image_paths,
+            gs.SET_EMBEDDINGS_QUERY: self._set_embeddings,
+        }
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self)
+
+    def close(self) -> None:
+        pass
+
+    def _execute(self, query: str, params: dict) -> FakeResult:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if query.lstrip().startswith("CREATE VECTOR INDEX") and not self.vector_index:
+            raise ClientError("Vector indexes are not supported")
+
+        handler = self._handlers.get(query)
+        if handler is None:
+            return FakeResult([])
+        with self._lock:
+            return FakeResult(handler(**params))
+
+    @staticmethod
+    def _fields(image: dict, target_sum: float | None = None) -> dict:
+        fields = {
+            key: image[key]
+            for key in ("id", "sum", "image_path", "period_start", "period_end", "created")
+        }
+        if target_sum is not None:
+            fields["difference"] = abs(image["sum"] - target_sum)
+        return fields
+
+    def _push(self, rows: list[dict]) -> list[dict]:
+        self._embedded_cache = None
+        for row in rows:
+            previous = self.images.get(row["id"])
+            if previous is not None:
+                self._by_sum.remove((previous["sum"], row["id"]))
+                self._by_sum_key[previous["sum_key"]].discard(row["id"])
+            embedding = row["embedding"]
+            if embedding is None and previous is not None:
+                embedding = previous["embedding"]
+            self.images[row["id"]] = {
+                "id": row["id"],
+                "sum": row["sum"],
+                "sum_key": row["sum_key"],
+                "image_path": row["path"],
+                "period_start": row["period_start"],
+                "period_end": row["period_end"],
+                "created": row["created"],
+                "embedding": embedding,
+            }
+            bisect.insort(self._by_sum, (row["sum"], row["id"]))
+            self._by_sum_key.setdefault(row["sum_key"], set()).add(row["id"])
+            for bucket in row["buckets"]:
+                key = (bucket["resolution"], bucket["value"])
+                self._buckets.setdefault(key, set()).add(row["id"])
+        return []
+
+    def _excluded(self, image_id: str, exclude_id: str | None) -> bool:
+        return exclude_id is not None and image_id == exclude_id
+
+    def _sum_range(self, min_sum, max_sum, target_sum, exclude_id, limit) -> list[dict]:
+        lo = bisect.bisect_left(self._by_sum, (min_sum, ""))
+        hi = bisect.bisect_right(self._by_sum, (max_sum, "\uffff"))
+        found = [
+            self._fields(self.images[image_id], target_sum)
+            for _, image_id in self._by_sum[lo:hi]
+            if not self._excluded(image_id, exclude_id)
+        ]
+        return sorted(found, key=lambda image: image["difference"])[:limit]
+
+    def _in_buckets(self, resolution, bucket_values, target_sum, exclude_id, limit) -> list[dict]:
+        found = [
+            self._fields(self.images[image_id], target_sum)
+            for value in bucket_values
+            for image_id in self._buckets.get((resolution, value), ())
+            if not self._excluded(image_id, exclude_id)
+        ]
+        return sorted(found, key=lambda image: image["difference"])[:limit]
+
+    def _walk(self, positions: range, target_sum, exclude_id, limit) -> list[dict]:
+        found = []
+        for position in positions:
+            if len(found) == limit:
+                break
+            image_id = self._by_sum[position][1]
+            if not self._excluded(image_id, exclude_id):
+                found.append(self._fields(self.images[image_id], target_sum))
+        return found
+
+    def _nearest_above(self, target_sum, exclude_id, limit) -> list[dict]:
+        start = bisect.bisect_left(self._by_sum, (target_sum, ""))
+        return self._walk(range(start, len(self._by_sum)), target_sum, exclude_id, limit)
+
+    def _nearest_below(self, target_sum, exclude_id, limit) -> list[dict]:
+        end = bisect.bisect_left(self._by_sum, (target_sum, ""))
+        return self._walk(range(end - 1, -1, -1), target_sum, exclude_id, limit)
+
+    def _embedded(self) -> tuple[list[str], np.ndarray]:
+        """Матрица эмбеддингов; перестраивается только после изменений"""
+        if self._embedded_cache is None:
+            ids = [i for i, image in self.images.items() if image["embedding"] is not None]
+            vectors = np.array([self.images[i]["embedding"] for i in ids], dtype=np.float32)
+            self._embedded_cache = (ids, vectors)
+        return self._embedded_cache
+
+    def _by_embedding(self, k, embedding, exclude_id) -> list[dict]:
+        ids, vectors = self._embedded()
+        if not ids:
+            return []
+        scores = vectors @ np.asarray(embedding, dtype=np.float32)
+        best = np.argsort(-scores)[:k]
+        return [
+            {**self._fields(self.images[ids[i]]), "score": float(scores[i])}
+            for i in best
+            if not self._excluded(ids[i], exclude_id)
+        ]
+
+    def _same_sum(self, image_id: str) -> list[str]:
+        image = self.images.get(image_id)
+        if image is None:
+            return []
+        return [other for other in self._by_sum_key[image["sum_key"]] if other != image_id]
+
+    def _similar_by_sum_page(self, id, after_created, after_id, fields, limit) -> list[dict]:
+        keys = sorted(
+            ((self.images[other]["created"], other) for other in self._same_sum(id)), reverse=True
+        )
+        if after_created is not None:
+            keys = [key for key in keys if key < (after_created, after_id)]
+        sum_key = self.images[id]["sum_key"] if keys else None
+        return [
+            {
+                "id": other,
+                "created": created,
+                "values": [self.images[other][f] for f in fields],
+                "sum_key": sum_key,
+            }
+            for created, other in keys[:limit]
+        ]
+
+    def _count_similar_by_sum(self, id) -> list[dict]:
+        if id not in self.images:
+            return []
+        return [{"total": len(self._same_sum(id)), "sum_key": self.images[id]["sum_key"]}]
+
+    def _by_ids(self, ids) -> list[dict]:
+        return [self._fields(self.images[i]) for i in ids if i in self.images]
+
+    def _image_paths(self) -> list[dict]:
+        return [{"path": image["image_path"]} for image in self.images.values()]
+
+    def _load_embeddings(self) -> list[dict]:
+        return [
+            {"id": image["id"], "embedding": image["embedding"]}
+            for image in self.images.values()
+            if image["embedding"] is not None
+        ]
+
+    def _set_embeddings(self, rows) -> list[dict]:
+        self._embedded_cache = None
+        by_path = {image["image_path"]: image for image in self.images.values()}
+        updated = []
+        for row in rows:
+            image = by_path.get(row["path"])
+            if image is not None:
+                image["embedding"] = row["embedding"]
+                updated.append({"id": image["id"], "path": row["path"]})
+        return updated
@@ -0,0 +1,176 @@
+"""Локальный заменитель OpenRouter chat/completions с настраиваемой задержкой.
+
+Отвечает в формате OpenRouter: изображение передается data URL в
+choices[0].message.images[0].image_url.url. Использование:
+
+    with FakeOpenRouterServer(latency=0.5) as server:
+        gen = ImageGen(api_key="test", url=server.url)
+
+Квоты как у провайдера: quota - запросов в секунду (с запасом quota_burst),
+max_concurrent - одновременных запросов. Сверх квоты сервер отвечает 429
+с Retry-After (целые секунды до появления свободного запроса). Квота
+частоты сообщается в каждом ответе заголовками X-RateLimit-Limit (запросов
+в секунду), X-RateLimit-Remaining и X-RateLimit-Reset (мс от эпохи).
+"""
+import base64
+import json
+import math
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_png(width: int = 64, height: int = 64, seed: int = 0) -> bytes:
+    """Создает валидный RGB PNG без сторонних библиотек"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    row = bytes((x * 7 + seed * 31 + c * 85) % 256 for x in range(width) for c in range(3))
+    raw = b"".join(b"\x00" + row for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeOpenRouterServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        fake = self.server
+        retry_after = fake.admit()
+        if retry_after is not None:
+            self._send_json(
+                429,
+                {"error": {"code": 429, "message": "Rate limit exceeded"}},
+                {**fake.rate_limit_headers(), "Retry-After": str(retry_after)},
+            )
+            return
+        try:
+            time.sleep(fake.latency)
+            prompt = request.get("messages", [{}])[0].get("content", "")
+            image = base64.b64encode(fake.make_image(prompt)).decode()
+            self._send_json(200, {
+                "id": f"fake-{fake.requests}",
+                "model": request.get("model"),
+                "choices": [{
+                    "message": {
+                        "role": "assistant",
+                        "content": "",
+                        "images": [{
+                            "type": "image_url",
+                            "image_url": {"url": f"data:image/png;base64,{image}"},
+                        }],
+                    }
+                }],
+            }, fake.rate_limit_headers())
+        finally:
+            with fake.lock:
+                fake.in_flight -= 1
+                fake.served += 1
+
+
+class FakeOpenRouterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        image_size: int = 64,
+        port: int = 0,
+        quota: float | None = None,
+        quota_burst: int = 1,
+        max_concurrent: int | None = None,
+    ):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.image_size = image_size
+        self.quota = quota
+        self.quota_burst = quota_burst
+        self.max_concurrent = max_concurrent
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.served = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._tokens = float(quota_burst)
+        self._updated = time.monotonic()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def admit(self) -> int | None:
+        """Учитывает запрос в квоте; None - принят (и учтен в in_flight),
+        иначе Retry-After в секундах"""
+        with self.lock:
+            now = time.monotonic()
+            if self.quota is not None:
+                self._tokens = min(self.quota_burst, self._tokens + (now - self._updated) * self.quota)
+            self._updated = now
+            if self.max_concurrent is not None and self.in_flight >= self.max_concurrent:
+                self.throttled += 1
+                return max(1, math.ceil(self.latency))
+            if self.quota is not None:
+                if self._tokens < 1:
+                    self.throttled += 1
+                    return max(1, math.ceil((1 - self._tokens) / self.quota))
+                self._tokens -= 1
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return None
+
+    def rate_limit_headers(self) -> dict[str, str]:
+        """Квота частоты в заголовках как у OpenRouter (окно - одна секунда)"""
+        if self.quota is None:
+            return {}
+        with self.lock:
+            remaining = max(0, int(self._tokens))
+        return {
+            "X-RateLimit-Limit": str(max(1, int(self.quota))),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str((int(time.time()) + 1) * 1000),
+        }
+
+    def make_image(self, prompt: str) -> bytes:
+        return make_png(self.image_size, self.image_size, seed=len(prompt))
+
+    def start(self) -> "FakeOpenRouterServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeOpenRouterServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,392 @@
+"""Набор бенчмарков на синтетических данных с результатами в JSON
+
+Таблицы от 1e3 до 1e7 строк (нормализация, индекс сумм, даты контроллера),
+GraphDBService на офлайн-заменителе драйвера Neo4j и ImageGen на локальном
+заменителе OpenRouter. Данные генерируются с фиксированным seed.
+
+Запуск:
+    python -m benchmarks.suite run [--quick] [--only table graph images] [--output base.json]
+    python -m benchmarks.suite compare base.json new.json [--threshold 0.15]
+
+compare завершается с кодом 1, если есть регрессии сильнее порога.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+import numpy as np
+import pandas as pd
+from benchmarks.bench_normalize import _BenchReader
+from src.config.config import PROJECT_ROOT
+from src.services.similarity_cache import SimilarityCache
+from src.services.table_analyzer import TableAnalyzer
+from src.services.table_data import TableData, TableDelta
+
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+QUICK_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_THRESHOLD = 0.15
+TIME_BUDGET = 2.0
+
+
+def measure(func: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> float:
+    """Лучшее время из repeat запусков; медленные случаи (дольше TIME_BUDGET) запускаются меньше раз"""
+    best = float("inf")
+    spent = 0.0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent > TIME_BUDGET:
+            break
+    return best
+
+
+def result(name: str, params: dict, value: float, unit: str, higher_is_better: bool = False) -> dict:
+    return {
+        "name": name,
+        "params": params,
+        "value": value,
+        "unit": unit,
+        "higher_is_better": higher_is_better,
+    }
+
+
+def result_id(item: dict) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(item["params"].items()))
+    return f"{item['name']}[{params}]"
+
+
+def make_raw_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    """«Сырая» таблица как из Excel: даты строками dd.mm.YYYY, значения строками.
+
+    Строки берутся из справочника уникальных значений, поэтому 1e7 строк
+    генерируются за секунды.
+    """
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64("2000-01-01"), np.datetime64("2025-01-01"))
+    labels = pd.Series(days.astype("datetime64[s]")).dt.strftime("%d.%m.%Y").to_numpy(dtype=object)
+    numbers = np.array([str(n) for n in range(1000)], dtype=object)
+    return pd.DataFrame({
+        "Date": labels[rng.integers(0, len(days), rows)],
+        "Value": numbers[rng.integers(0, 1000, rows)],
+    })
+
+
+def make_table(rows: int, seed: int = 0) -> TableData:
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64("2000-01-01") + rng.integers(0, 365 * 25, rows)
+    return TableData.from_arrays(dates, rng.integers(0, 1000, rows))
+
+
+def bench_table(sizes: list[int], repeat: int) -> list[dict]:
+    from src.controllers.app_controller import TableController
+
+    results = []
+    reader = _BenchReader()
+    rng = np.random.default_rng(1)
+    for rows in sizes:
+        params = {"rows": rows}
+
+        raw = make_raw_table(rows)
+        seconds = measure(lambda: reader._normalize_table(raw), repeat)
+        results.append(result("table.normalize", params, seconds, "s"))
+        del raw
+
+        table = make_table(rows)
+        seconds = measure(lambda: TableAnalyzer(table).dates, repeat)
+        results.append(result("table.analyzer_build", params, seconds, "s"))
+
+        analyzer = TableAnalyzer(table)
+        analyzer.dates  # индекс строится отдельно, измеряются только запросы
+        starts = np.datetime64("2000-01-01") + rng.integers(0, 365 * 24, 1000)
+        periods = np.stack([starts, starts + rng.integers(0, 365, 1000)], axis=1)
+        seconds = measure(lambda: [analyzer.sum_by_period(a, b) for a, b in periods], repeat)
+        results.append(result("table.sum_by_period", params, seconds / len(periods) * 1e6, "us"))
+        seconds = measure(lambda: analyzer.sum_by_periods(periods), repeat)
+        results.append(result("table.sum_by_periods_1000", params, seconds, "s"))
+        for unit in ("day", "month"):
+            seconds = measure(lambda: analyzer.sum_by_calendar(unit), repeat)
+            results.append(result(f"table.sum_by_calendar_{unit}", params, seconds, "s"))
+        seconds = measure(lambda: analyzer.rolling_sums(30), repeat)
+        results.append(result("table.rolling_sums_30d", params, seconds, "s"))
+
+        # Инкрементальное обновление: 10 новых строк и запрос по обновленному индексу
+        appended = TableDelta(make_table(10, seed=rows), TableData.empty_table())
+
+        def refresh():
+            analyzer.apply_delta(appended)
+            return analyzer.sum_by_period(starts[0], periods[0][1])
+
+        seconds = measure(refresh, repeat)
+        results.append(result("table.apply_delta_10", params, seconds * 1e6, "us"))
+
+        controller = TableController()
+        seconds = measure(
+            controller.get_all_dates,
+            repeat,
+            setup=lambda: controller._set_table(table, "bench"),
+        )
+        results.append(result("controller.get_all_dates", params, seconds, "s"))
+        del table, analyzer, controller
+    return results
+
+
+def bench_graph(nodes: int, queries: int, latency: float, repeat: int) -> list[dict]:
+    from benchmarks.bench_vector_search import make_vectors
+    from benchmarks.fakes.neo4j_fake import FakeNeo4jDriver
+    from src.services.graph_service import GraphDBService, ImageNode
+
+    rng = np.random.default_rng(2)
+    sums = rng.integers(0, 1_000_000, nodes)
+    vectors = make_vectors(nodes)
+    image_nodes = [
+        ImageNode(
+            sum=int(total),
+            period_start="2024-01-01",
+            period_end="2024-01-31",
+            image_path=f"images/{i}.png",
+            embedding=vector.tolist(),
+            id=str(i),
+        )
+        for i, (total, vector) in enumerate(zip(sums, vectors))
+    ]
+
+    results = []
+    params = {"nodes": nodes, "latency_ms": latency * 1000}
+    service = None
+
+    def ingest():
+        nonlocal service
+        service = GraphDBService(driver=FakeNeo4jDriver(latency=latency), ensure_schema=False)
+        service.push_image_nodes(image_nodes)
+
+    seconds = measure(ingest, repeat)
+    results.append(result("graph.ingest", params, nodes / seconds, "nodes/s", higher_is_better=True))
+
+    targets = rng.integers(0, 1_000_000, queries)
+    cases = {
+        "graph.find_by_sum_range": lambda t: service.find_by_sum_range(int(t), tolerance=500),
+        "graph.find_nearest_by_sum": lambda t: service.find_nearest_by_sum(int(t), k=10),
+    }
+    for name, query in cases.items():
+        seconds = measure(lambda: [query(t) for t in targets], repeat)
+        results.append(result(name, params, seconds / queries * 1000, "ms"))
+
+    # Повторные запросы тех же сумм отвечаются из кэша без обращения к серверу
+    service.cache = SimilarityCache()
+    [service.find_by_sum_range(int(t), tolerance=500) for t in targets]
+    seconds = measure(lambda: [service.find_by_sum_range(int(t), tolerance=500) for t in targets], repeat)
+    results.append(result("graph.find_by_sum_range_cached", params, seconds / queries * 1e6, "us"))
+    service.cache = None
+
+    # Популярная сумма: все совпадения читаются страницами по keyset-курсору
+    popular = [
+        ImageNode(sum=-1, period_start="2024-01-01", period_end="2024-01-31",
+                  image_path=f"images/same-{i}.png", id=f"same-{i}")
+        for i in range(min(nodes, 10_000))
+    ]
+    service.push_image_nodes(popular)
+    seconds = measure(
+        lambda: sum(1 for _ in service.iter_similar_by_sum("same-0", fields=("image_path",))), repeat
+    )
+    pages = -(-(len(popular) - 1) // service.DEFAULT_PAGE_SIZE)
+    results.append(result("graph.similar_by_sum_page", params, seconds / pages * 1000, "ms"))
+
+    for vector_index in (True, False):
+        service = GraphDBService(
+            driver=FakeNeo4jDriver(latency=latency, vector_index=vector_index), ensure_schema=False
+        )
+        service.push_image_nodes(image_nodes)
+        service.find_similar_by_embedding(vectors[0], k=10)
+        picks = vectors[rng.integers(0, nodes, queries)]
+        seconds = measure(lambda: [service.find_similar_by_embedding(v, k=10) for v in picks], repeat)
+        name = "graph.find_similar_by_embedding" + ("" if vector_index else "_fallback")
+        results.append(result(name, params, seconds / queries * 1000, "ms"))
+    return results
+
+
+def bench_images(images: int, workers: int, latency: float, repeat: int) -> list[dict]:
+    from benchmarks.fakes.openrouter_fake import FakeOpenRouterServer
+    from src.services.image_generator import ImageGen
+    from src.services.image_store import ImageStore
+    from src.services.request_scheduler import RequestScheduler
+
+    results = []
+    params = {"images": images, "workers": workers, "latency_ms": latency * 1000}
+    numbers = [str(n) for n in range(images)]
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeOpenRouterServer(latency=latency) as server:
+        store = ImageStore(root=Path(tmp_dir), db_path=Path(tmp_dir) / "store.sqlite3")
+        # Без лимита частоты: измеряется сам конвейер запроса и декодирования
+        gen = ImageGen(
+            api_key="bench", url=server.url, max_workers=workers, store=store,
+            scheduler=RequestScheduler(rate=0, max_concurrency=workers),
+        )
+        try:
+            sequential = numbers[: max(1, images // workers)]
+            seconds = measure(lambda: [gen.generate(n) for n in sequential], repeat)
+            results.append(result(
+                "images.sequential", params, len(sequential) / seconds, "images/s", higher_is_better=True
+            ))
+
+            seconds = measure(lambda: gen.create_many(numbers), repeat)
+            results.append(result(
+                "images.parallel", params, images / seconds, "images/s", higher_is_better=True
+            ))
+        finally:
+            gen.close()
+
+    # Квота сервера - половина того, что успели бы workers потоков; планировщик
+    # без лимита частоты подстраивается только по ответам 429, без явного
+    # rate - еще и по заголовкам X-RateLimit-*. Изображений больше, чтобы
+    # мерить установившийся режим, а не первые отказы
+    quota = workers / latency / 2
+    params = {"images": images * 4, "workers": workers, "latency_ms": latency * 1000, "quota": quota}
+    numbers = [str(n) for n in range(images * 4)]
+    for name, rate in (("images.quota_adaptive", 0), ("images.quota_headers", None)):
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            FakeOpenRouterServer(
+                latency=latency, quota=quota, quota_burst=workers, max_concurrent=workers
+            ) as server,
+        ):
+            store = ImageStore(root=Path(tmp_dir), db_path=Path(tmp_dir) / "store.sqlite3")
+            gen = ImageGen(
+                api_key="bench", url=server.url, max_workers=workers, store=store,
+                scheduler=RequestScheduler(rate=rate, max_concurrency=workers),
+            )
+            try:
+                seconds = measure(lambda: gen.create_many(numbers), repeat)
+                results.append(result(
+                    name, params, len(numbers) / seconds, "images/s", higher_is_better=True
+                ))
+            finally:
+                gen.close()
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> int:
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    nodes = args.nodes or (2_000 if args.quick else 20_000)
+    images = args.images or (16 if args.quick else 64)
+
+    results = []
+    if "table" in args.only:
+        results += bench_table(sizes, args.repeat)
+    if "graph" in args.only:
+        results += bench_graph(nodes, args.queries, args.neo4j_latency, args.repeat)
+    if "images" in args.only:
+        results += bench_images(images, args.workers, args.openrouter_latency, args.repeat)
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU",
+            "args": {key: value for key, value in vars(args).items() if key != "func"},
+        },
+        "results": results,
+    }
+
+    output = Path(args.output or RESULTS_DIR / f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    for item in results:
+        print(f"{result_id(item):<70} {item['value']:>14.4f} {item['unit']}")
+    print(f"Результаты сохранены в {output}")
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    if base["meta"].get("machine") != new["meta"].get("machine"):
+        print("Внимание: запуски выполнены на разных машинах")
+
+    base_results = {result_id(item): item for item in base["results"]}
+    regressions = 0
+    print(f"{'бенчмарк':<70} {'база':>12} {'новый':>12} {'изменение':>10}")
+    for item in new["results"]:
+        key = result_id(item)
+        before = base_results.pop(key, None)
+        if before is None:
+            print(f"{key:<70} {'-':>12} {item['value']:>12.4f} {'новый':>10}")
+            continue
+
+        # change > 0 - стало хуже, независимо от направления метрики
+        ratio = item["value"] / before["value"] if before["value"] else 1.0
+        change = (1 / ratio - 1) if item["higher_is_better"] and ratio else ratio - 1
+        status = ""
+        if change > args.threshold:
+            status = "РЕГРЕССИЯ"
+            regressions += 1
+        elif change < -args.threshold:
+            status = "улучшение"
+        print(f"{key:<70} {before['value']:>12.4f} {item['value']:>12.4f} {change:>+9.1%} {status}")
+
+    for key in base_results:
+        print(f"{key:<70} {'нет в новом запуске':>36}")
+
+    print(f"Регрессий (порог {args.threshold:.0%}): {regressions}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="запустить бенчмарки")
+    run_parser.add_argument("--only", nargs="+", choices=["table", "graph", "images"],
+                            default=["table", "graph", "images"])
+    run_parser.add_argument("--quick", action="store_true", help="уменьшенные размеры данных")
+    run_parser.add_argument("--sizes", type=int, nargs="+", help="число строк таблиц")
+    run_parser.add_argument("--nodes", type=int, help="узлов в графе")
+    run_parser.add_argument("--queries", type=int, default=200)
+    run_parser.add_argument("--images", type=int, help="изображений на прогон")
+    run_parser.add_argument("--workers", type=int, default=8)
+    run_parser.add_argument("--neo4j-latency", type=float, default=0.0005, help="секунд на запрос")
+    run_parser.add_argument("--openrouter-latency", type=float, default=0.2, help="секунд на запрос")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--output", help="файл результатов (по умолчанию benchmarks/results/)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="сравнить два запуска")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="допустимое ухудшение (доля)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
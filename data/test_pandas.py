@@ -1,6 +1,7 @@
 import pandas as pd
+from src.config.config import DATA_DIR
 
-df = pd.read_excel(r'data\test_table.xlsx')
+df = pd.read_excel(DATA_DIR / 'test_table.xlsx')
 
 # print(df.columns.tolist())
 
@@ -0,0 +1,187 @@
+"""Пакетный режим без интерфейса: периоды -> суммы -> изображения -> Neo4j.
+
+Примеры:
+    python -m src.cli --excel data/table.xlsx --every month
+    python -m src.cli --sheet-id <ID> --every week --from 2024-01-01 --to 2024-06-30
+    python -m src.cli --excel data/table.xlsx --periods 2024-01-01:2024-01-31 2024-02-01:2024-02-29
+    python -m src.cli --excel data/months/ --dedupe last --every month
+    python -m src.cli --sheet-id <ID> --worksheets Январь Февраль --every week
+    python -m src.cli --excel data/table.xlsx --every month --dry-run --watch 10
+"""
+import argparse
+import sys
+import time
+from src.config.config import DATA_DIR
+from src.controllers.app_controller import TableController
+from src.services.batch_pipeline import (
+    PERIOD_STEPS,
+    BatchPipeline,
+    PipelineCheckpoint,
+    parse_periods,
+    periods_every,
+)
+from src.services.graph_service import GraphDBService
+from src.services.multi_source import DEDUPE_RULES
+from src.services.image_cache import ImageCache
+from src.services.image_generator import ImageGen
+from src.services.request_scheduler import RequestScheduler
+
+DEFAULT_CHECKPOINT_PATH = DATA_DIR / "pipeline_checkpoint.jsonl"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--excel", nargs="+", help="Excel-файлы, каталоги или маски (книги читаются параллельно)"
+    )
+    source.add_argument("--sheet-id", help="ID таблицы Google Sheets")
+    parser.add_argument(
+        "--worksheets", nargs="*", help="листы Google Sheets (без имен - все листы)"
+    )
+    parser.add_argument(
+        "--dedupe", choices=DEDUPE_RULES, default="all",
+        help="чьи строки оставить, если дата есть в нескольких источниках",
+    )
+    parser.add_argument("--load-workers", type=int, default=None, help="процессов разбора книг")
+    parser.add_argument(
+        "--cred-path", help="учетные данные Google (по умолчанию GOOGLE_SHEETS_CREDENTIALS_PATH)"
+    )
+
+    periods = parser.add_mutually_exclusive_group(required=True)
+    periods.add_argument("--every", choices=PERIOD_STEPS, help="календарный шаг периодов")
+    periods.add_argument("--periods", nargs="+", metavar="FROM:TO", help="явный список периодов")
+    parser.add_argument("--from", dest="date_from", help="начало диапазона для --every")
+    parser.add_argument("--to", dest="date_to", help="конец диапазона для --every")
+
+    parser.add_argument("--workers", type=int, default=None, help="потоков генерации изображений")
+    parser.add_argument(
+        "--rate", type=float, default=None,
+        help="запросов к OpenRouter в секунду (0 - без ограничения; по умолчанию "
+        "OPENROUTER_RATE_LIMIT с уточнением по заголовкам X-RateLimit-*)",
+    )
+    parser.add_argument("--batch-size", type=int, default=None, help="узлов в пакете записи")
+    parser.add_argument("--queue-size", type=int, default=None, help="емкость очередей между стадиями")
+    parser.add_argument("--checkpoint", default=str(DEFAULT_CHECKPOINT_PATH))
+    parser.add_argument("--no-resume", action="store_true", help="не пропускать периоды из журнала")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать суммы")
+    parser.add_argument(
+        "--watch", type=float, metavar="SECONDS",
+        help="после обработки следить за источником и обрабатывать изменившиеся периоды",
+    )
+    return parser
+
+
+def _build_periods(args: argparse.Namespace, analyzer) -> list[tuple[str, str]]:
+    if args.periods:
+        return parse_periods(args.periods)
+    min_date, max_date = analyzer.get_min_max_date()
+    return periods_every(args.date_from or min_date, args.date_to or max_date, args.every)
+
+
+def _print_sums(periods: list[tuple[str, str]], sums, previous: dict) -> None:
+    """Печатает суммы периодов, изменившиеся с прошлого вывода"""
+    for period, total in zip(periods, sums):
+        if previous.get(period) != total:
+            print(f"{period[0]} - {period[1]}: {total}")
+            previous[period] = total
+
+
+def _watch(controller: TableController, interval: float, on_change) -> None:
+    """Проверяет источник каждые interval секунд до Ctrl+C"""
+    print(f"Слежение за изменениями каждые {interval:g} с, Ctrl+C - выход")
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                delta = controller.refresh()
+            except Exception as e:
+                print(f"Не удалось проверить источник: {e}", file=sys.stderr)
+                continue
+            if delta.changed:
+                print(f"Изменения: +{len(delta.added)} / -{len(delta.removed)} строк")
+                on_change()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.excel and args.worksheets is not None:
+        parser.error("--worksheets используется только с --sheet-id")
+
+    controller = TableController()
+    if args.excel:
+        controller.load_from_excel_files(
+            args.excel, dedupe=args.dedupe, max_workers=args.load_workers
+        )
+    else:
+        controller.load_from_google_sheets(
+            args.cred_path, args.sheet_id, worksheets=args.worksheets, dedupe=args.dedupe
+        )
+    print(f"Источник: {controller.get_source_info()}")
+    if args.watch is not None and not controller.can_refresh():
+        parser.error("--watch поддерживается для одного файла Excel или листа Google Sheets")
+
+    analyzer = controller.analyzer
+    try:
+        periods = _build_periods(args, analyzer)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.dry_run:
+        printed: dict = {}
+
+        def show() -> None:
+            current = _build_periods(args, analyzer)
+            _print_sums(current, analyzer.sum_by_periods(current), printed)
+
+        show()
+        if args.watch is not None:
+            _watch(controller, args.watch, show)
+        return 0
+
+    checkpoint = PipelineCheckpoint(args.checkpoint)
+    scheduler = None
+    if args.rate is not None:
+        scheduler = RequestScheduler(
+            rate=args.rate, max_concurrency=args.workers or ImageGen.DEFAULT_MAX_WORKERS
+        )
+    image_gen = ImageGen(max_workers=args.workers, cache=ImageCache(), scheduler=scheduler)
+    graph_service = GraphDBService(batch_size=args.batch_size)
+    failures = 0
+
+    def run(periods: list[tuple[str, str]], resume: bool) -> None:
+        nonlocal failures
+        pipeline = BatchPipeline(
+            analyzer,
+            image_gen,
+            graph_service,
+            checkpoint=checkpoint,
+            resume=resume,
+            image_workers=args.workers,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+        )
+        report = pipeline.run(periods)
+        print(report.format())
+        failures = len(report.failures)
+
+    try:
+        run(periods, resume=not args.no_resume)
+        if args.watch is not None:
+            # Журнал пропускает периоды с прежней суммой: обрабатываются только измененные
+            _watch(controller, args.watch, lambda: run(_build_periods(args, analyzer), resume=True))
+    finally:
+        image_gen.close()
+        graph_service.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
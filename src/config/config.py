@@ -1,5 +1,7 @@
 """Конфигурация приложения"""
 import os
+from dataclasses import dataclass
+from functools import cache
 from pathlib import Path
 
 # Базовый путь проекта
@@ -9,11 +11,66 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent
 GOOGLE_SHEETS_CREDENTIALS_PATH = PROJECT_ROOT / "src" / "config" / "googlesheets_credentials.json"
 ENV_FILE_PATH = PROJECT_ROOT / "src" / "config" / ".env"
 
-# Пути к директориям
+# Пути к директориям (создаются при первой записи, а не при импорте)
 IMAGES_DIR = PROJECT_ROOT / "images"
 DATA_DIR = PROJECT_ROOT / "data"
 
-# Создаем директории если их нет
-IMAGES_DIR.mkdir(exist_ok=True)
-DATA_DIR.mkdir(exist_ok=True)
 
+def _flag(value: str | None) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _number(name: str, value: str | None) -> float | None:
+    if not (value or "").strip():
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} должен быть числом, получено {value!r}") from None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Настройки из переменных окружения и .env, читаются один раз за процесс"""
+    google_sheets_credentials_path: Path
+    neo4j_uri: str | None
+    neo4j_user: str | None
+    neo4j_password: str | None
+    openrouter_api_key: str | None
+    openrouter_rate_limit: float | None
+    metrics_enabled: bool
+    metrics_file: Path
+    metrics_prometheus_file: Path
+    profile: str | None
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        env = os.environ
+        return cls(
+            google_sheets_credentials_path=Path(
+                env.get("GOOGLE_SHEETS_CREDENTIALS_PATH") or GOOGLE_SHEETS_CREDENTIALS_PATH
+            ),
+            neo4j_uri=env.get("NEO4j_URI"),
+            neo4j_user=env.get("NEO4j_USER"),
+            neo4j_password=env.get("NEO4j_PASSWORD"),
+            openrouter_api_key=env.get("OPENROUTER_API_KEY"),
+            openrouter_rate_limit=_number("OPENROUTER_RATE_LIMIT", env.get("OPENROUTER_RATE_LIMIT")),
+            metrics_enabled=_flag(env.get("GRAPHDB_METRICS")),
+            metrics_file=Path(env.get("GRAPHDB_METRICS_FILE") or DATA_DIR / "metrics.jsonl"),
+            metrics_prometheus_file=Path(env.get("GRAPHDB_METRICS_PROM") or DATA_DIR / "metrics.prom"),
+            profile=env.get("GRAPHDB_PROFILE") or None,
+        )
+
+
+@cache
+def get_settings() -> Settings:
+    """Загружает .env (корень проекта и src/config) и возвращает настройки.
+
+    Переменные окружения процесса имеют приоритет над .env.
+    """
+    from dotenv import load_dotenv
+
+    for env_file in (PROJECT_ROOT / ".env", ENV_FILE_PATH):
+        if env_file.exists():
+            load_dotenv(env_file)
+    return Settings.from_env()
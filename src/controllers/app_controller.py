@@ -1,12 +1,28 @@
-from src.services.table_reader import GoogleSheetsReader, ExcelReader
-from src.services.table_analyzer import TableAnalyzer
-from datetime import datetime
-from src.services.graph_service import ImageNode, GraphDBService
-from src.services.image_generator import ImageGen
+from src.services.table_analyzer import PeriodSums, TableAnalyzer
+from src.services.table_cache import TableCache
+from src.services.table_data import TableData, TableDelta, diff_tables
+from collections import OrderedDict
+from datetime import date
+from typing import TYPE_CHECKING
+import threading
+import numpy as np
+from src.services.metrics import count, timed
 import os
 
+# Тяжелые зависимости (pandas, gspread, neo4j, requests, PIL) импортируются
+# в методах при первом обращении, чтобы окно открывалось сразу
+if TYPE_CHECKING:
+    from src.services.graph_outbox import GraphOutbox
+    from src.services.graph_service import GraphDBService, ImagePage
+    from src.services.table_reader import ProgressCallback
+
 
 class TableController:
+    # Сколько поиск по той же сумме ждет записи узла из журнала в neo4j
+    SEARCH_FLUSH_TIMEOUT = 30.0
+    # Сколько последних сумм за период хранится в кэше (LRU)
+    SUM_CACHE_SIZE = 1024
+
     def __init__(self):
         self.table = None
         self.source_info = None
@@ -14,75 +30,334 @@ class TableController:
         self.current_sum = None
         self.image_generated = False
         self.image_node = None
+        self.image_thumbnail: str | None = None
         self._graph_service = None
+        self._outbox = None
+        self._queued_id: str | None = None
         self._image_gen = None
+        self._table_version = 0
+        self._sum_cache: OrderedDict[tuple[int, np.datetime64, np.datetime64], int] = OrderedDict()
+        self._table_cache = TableCache()
+        # Источник для refresh(): ("excel", путь, отпечаток) или ("sheets", reader)
+        self._source: tuple | None = None
+        self._lock = threading.RLock()
+
+    def _set_table(
+        self,
+        table: TableData,
+        source_info: str,
+        analyzer: TableAnalyzer | None = None,
+        source: tuple | None = None,
+    ) -> None:
+        """Устанавливает новую таблицу и сбрасывает кэш сумм"""
+        analyzer = analyzer or TableAnalyzer(table)
+        with self._lock:
+            self.table = table
+            self.analyzer = analyzer
+            self.source_info = source_info
+            self._source = source
+            self._table_version += 1
+            self._sum_cache.clear()
+
+    @timed("controller.load_from_google_sheets", profile=True)
+    def load_from_google_sheets(
+        self,
+        cred_path: str | None,
+        sheet_id: str,
+        worksheets: list[str] | None = None,
+        dedupe: str = "all",
+    ) -> None:
+        """Загружает таблицу из Google Sheets (cred_path=None - путь из настроек).
+
+        worksheets=None - только первый лист, [] - все листы, иначе листы по
+        именам; несколько листов сливаются в одну таблицу по правилу dedupe
+        (см. multi_source.merge_tables).
+        """
+        from src.services.table_reader import GoogleSheetsReader
 
-    def load_from_google_sheets(self, cred_path: str, sheet_id: str) -> None:
-        """Загружает таблицу из Google Sheets"""
         reader = GoogleSheetsReader(cred_path=cred_path, sheet_id=sheet_id)
-        self.table = reader.read()
-        self.analyzer = TableAnalyzer(self.table)
-        self.source_info = f"Google Sheets (ID: {sheet_id})"
+        if worksheets is None:
+            self._set_table(reader.read(), f"Google Sheets (ID: {sheet_id})", source=("sheets", reader))
+            return
+
+        from src.services.multi_source import MultiSourceLoader
+
+        loader = MultiSourceLoader(dedupe=dedupe)
+        table = loader.load_worksheets(reader, worksheets or None)
+        sheets = ", ".join(worksheets) if worksheets else "все листы"
+        self._set_table(table, f"Google Sheets (ID: {sheet_id}, {sheets})")
+
+    @timed("controller.load_from_excel", profile=True)
+    def load_from_excel(
+        self,
+        file_path: str,
+        streaming: bool | None = None,
+        progress: "ProgressCallback | None" = None,
+    ) -> None:
+        """Загружает таблицу из Excel (большие файлы - потоково, порциями).
+
+        Разобранная таблица кэшируется на диске, повторная загрузка того же файла
+        не требует повторного разбора.
+        """
+        from src.services.table_reader import ExcelReader
+
+        reader = ExcelReader(file_path=file_path, streaming=streaming)
+        source_info = f"Excel ({os.path.basename(file_path)})"
+        cache_key = reader.fingerprint()
+        source = ("excel", file_path, cache_key)
+
+        table = self._table_cache.get(cache_key)
+        count("graphdb_table_cache_total", result="miss" if table is None else "hit")
+        if table is not None:
+            self._set_table(table, source_info, source=source)
+            return
+
+        if not reader.streaming:
+            table = reader.read(progress)
+            self._set_table(table, source_info, source=source)
+            self._table_cache.put(cache_key, table)
+            return
+
+        # Порции сразу пишутся в кэш, и self.table открывается из него через
+        # memory map: в памяти остается только индекс анализатора
+        analyzer = TableAnalyzer()
+        with self._table_cache.writer(cache_key) as writer:
+            for chunk in reader.iter_chunks(progress):
+                analyzer.append(chunk)
+                writer.append(chunk)
+            table = writer.commit()
+        if table is None:
+            # Кэш недоступен (ошибка записи уже в журнале): таблица собирается в памяти
+            table = reader.read()
+        self._set_table(table, source_info, analyzer, source=source)
+
+    @timed("controller.load_from_excel_files", profile=True)
+    def load_from_excel_files(
+        self,
+        sources: list[str],
+        dedupe: str = "all",
+        max_workers: int | None = None,
+        progress: "ProgressCallback | None" = None,
+    ) -> None:
+        """Загружает несколько книг Excel (файлы, каталоги или маски) в одну таблицу.
+
+        Книги разбираются параллельно в пуле процессов, разобранные ранее
+        берутся из дискового кэша; progress(прочитано_книг, всего_книг).
+        """
+        from src.services.multi_source import MultiSourceLoader, expand_excel_paths
+
+        paths = expand_excel_paths(sources)
+        if len(paths) == 1:
+            self.load_from_excel(paths[0], progress=progress)
+            return
+
+        loader = MultiSourceLoader(max_workers=max_workers, dedupe=dedupe, cache=self._table_cache)
+        table = loader.load_excel(paths, progress)
+        self._set_table(table, f"Excel ({len(paths)} файлов)")
+
+    def can_refresh(self) -> bool:
+        """Поддерживает ли текущий источник инкрементальное обновление"""
+        return self._source is not None
+
+    @timed("controller.refresh")
+    def refresh(self) -> TableDelta:
+        """Проверяет источник и применяет изменения к индексу без перестроения.
+
+        Excel: изменение определяется по размеру и времени изменения файла,
+        новая версия сравнивается с предыдущей построчно. Google Sheets:
+        по ревизии таблицы, разбираются только новые и измененные строки
+        (self.table при этом остается последней полностью прочитанной версией).
+        Поддерживается для одного файла или одного листа.
+        """
+        source, table = self._source, self.table
+        if source is None:
+            raise ValueError("Обновление поддерживается для одного файла Excel или листа Google Sheets")
+
+        new_source = source
+        if source[0] == "excel":
+            delta, new_table, new_source = self._excel_changes(table, *source[1:])
+        else:
+            delta = source[1].read_changes()
+            new_table = delta.full if delta.full is not None else table
+
+        if not delta.changed:
+            return delta
+        with self._lock:
+            if self._source is not source:
+                # Пока проверялся источник, была загружена другая таблица
+                return TableDelta.unchanged()
+            self.table, self._source = new_table, new_source
+            self.analyzer.apply_delta(delta)
+            self._table_version += 1
+            self._sum_cache.clear()
+        count("graphdb_table_refresh_rows_total", len(delta.added), change="added")
+        count("graphdb_table_refresh_rows_total", len(delta.removed), change="removed")
+        return delta
+
+    def _excel_changes(
+        self, table: TableData, file_path: str, cache_key: str
+    ) -> tuple[TableDelta, TableData, tuple]:
+        from src.services.table_reader import ExcelReader
 
-    def load_from_excel(self, file_path: str) -> None:
-        """Загружает таблицу из Excel"""
         reader = ExcelReader(file_path=file_path)
-        self.table = reader.read()
-        self.analyzer = TableAnalyzer(self.table)
+        new_key = reader.fingerprint()
+        if new_key == cache_key:
+            return TableDelta.unchanged(), table, ("excel", file_path, cache_key)
 
-        self.source_info = f"Excel ({os.path.basename(file_path)})"
+        # Формат xlsx не позволяет прочитать только хвост: файл разбирается
+        # целиком, но индекс обновляется только измененными строками
+        new_table = self._table_cache.get(new_key)
+        if new_table is None:
+            new_table = reader.read()
+            self._table_cache.put(new_key, new_table)
+        return diff_tables(table, new_table), new_table, ("excel", file_path, new_key)
 
     def is_table_loaded(self) -> bool:
         """Проверяет загружена ли таблица"""
         return self.table is not None
 
-    def get_all_dates(self) -> list[str]:
-        """Возвращает все уникальные даты из таблицы"""
+    def get_all_dates(self) -> np.ndarray:
+        """Возвращает отсортированные даты из таблицы (datetime64[D])"""
         if not self.is_table_loaded() or self.analyzer is None:
-            return []
+            return np.array([], dtype="datetime64[D]")
 
-        dates = self.analyzer.dates.dropna() 
-        return [str(d) for d in sorted(dates)]
+        return self.analyzer.dates
 
-    def get_sum_for_period(self, date_from: str, date_to: str) -> int:
+    def get_unique_dates(self) -> np.ndarray:
+        """Возвращает отсортированные уникальные даты из таблицы (datetime64[D])"""
+        if not self.is_table_loaded() or self.analyzer is None:
+            return np.array([], dtype="datetime64[D]")
+
+        return self.analyzer.unique_dates
+
+    @timed("controller.get_sum_for_period")
+    def get_sum_for_period(
+        self, date_from: str | date | np.datetime64, date_to: str | date | np.datetime64
+    ) -> int:
         """Вычисляет сумму за период"""
         if not self.is_table_loaded() or self.analyzer is None:
             raise ValueError("Таблица не загружена")
 
-        date_from_parsed = datetime.fromisoformat(date_from).date()
-        date_to_parsed = datetime.fromisoformat(date_to).date()
+        date_from_parsed = np.datetime64(date_from, "D")
+        date_to_parsed = np.datetime64(date_to, "D")
+        with self._lock:
+            key = (self._table_version, date_from_parsed, date_to_parsed)
+            if key in self._sum_cache:
+                self._sum_cache.move_to_end(key)
+            else:
+                self._sum_cache[key] = self.analyzer.sum_by_period(date_from_parsed, date_to_parsed)
+                if len(self._sum_cache) > self.SUM_CACHE_SIZE:
+                    self._sum_cache.popitem(last=False)
+
+            self.current_sum = self._sum_cache[key]
+            return self.current_sum
+
+    def _get_analyzer(self) -> TableAnalyzer:
+        if not self.is_table_loaded() or self.analyzer is None:
+            raise ValueError("Таблица не загружена")
+        return self.analyzer
+
+    @timed("controller.get_calendar_sums")
+    def get_calendar_sums(
+        self,
+        unit: str,
+        date_from: str | date | np.datetime64 | None = None,
+        date_to: str | date | np.datetime64 | None = None,
+    ) -> PeriodSums:
+        """Суммы по календарным периодам (day, week, month, quarter, year);
+        без дат - по всему диапазону таблицы"""
+        return self._get_analyzer().sum_by_calendar(unit, date_from, date_to)
 
-        self.current_sum = self.analyzer.sum_by_period(date_from_parsed, date_to_parsed)
-        return self.current_sum
+    @timed("controller.get_rolling_sums")
+    def get_rolling_sums(
+        self,
+        window_days: int,
+        date_from: str | date | np.datetime64 | None = None,
+        date_to: str | date | np.datetime64 | None = None,
+    ) -> PeriodSums:
+        """Скользящие суммы за window_days дней на каждый день диапазона"""
+        return self._get_analyzer().rolling_sums(window_days, date_from, date_to)
+
+    @timed("controller.get_cumulative_sums")
+    def get_cumulative_sums(
+        self,
+        unit: str = "day",
+        date_from: str | date | np.datetime64 | None = None,
+        date_to: str | date | np.datetime64 | None = None,
+    ) -> PeriodSums:
+        """Нарастающий итог с начала таблицы на конец каждого периода"""
+        return self._get_analyzer().cumulative_sums(unit, date_from, date_to)
 
     def get_source_info(self) -> str:
         """Возвращает информацию об источнике данных"""
         return self.source_info or "Таблица не загружена"
 
+    @timed("controller.try_generate_image", profile=True)
     def try_generate_image(self, date_from: str, date_to: str) -> bool:
         """Генерирует изображение и создает ImageNode"""
         if self.current_sum is None:
             raise ValueError("Сначала получите сумму")
 
+        from src.services.graph_service import ImageNode
+        from src.services.image_embedding import compute_embedding
+
         if self._image_gen is None:
-            self._image_gen = ImageGen()
+            from src.services.image_cache import ImageCache
+            from src.services.image_generator import ImageGen
 
-        self._image_gen.create(str(self.current_sum))
-        image_path = self._image_gen.get_image_path()
+            self._image_gen = ImageGen(cache=ImageCache())
 
-        if image_path is None:
-            raise ValueError("Не удалось сгенерировать изображение")
+        image_path = self._image_gen.create(str(self.current_sum))
 
         self.image_node = ImageNode(
             sum=self.current_sum,
             period_start=date_from,
             period_end=date_to,
             image_path=image_path,
+            embedding=compute_embedding(image_path).tolist(),
         )
+        store = self._image_gen.store
+        store.attach(image_path, self.image_node.id, self.current_sum)
+        self.image_thumbnail = store.thumbnail(image_path)
 
         self.image_generated = True
         return True
 
+    def _get_graph_service(self) -> "GraphDBService":
+        """Подключается к neo4j при первом обращении"""
+        with self._lock:
+            if self._graph_service is None:
+                from src.services.graph_service import GraphDBService
+                from src.services.similarity_cache import SimilarityCache
+
+                self._graph_service = GraphDBService(cache=SimilarityCache())
+            return self._graph_service
+
+    def _get_outbox(self) -> "GraphOutbox":
+        """Журнал отложенной записи в neo4j; фоновый поток запускается при первом обращении"""
+        with self._lock:
+            if self._outbox is None:
+                from src.services.graph_outbox import GraphOutbox
+
+                self._outbox = GraphOutbox(self._get_graph_service).start()
+            return self._outbox
+
+    def resume_pending_pushes(self) -> bool:
+        """Запускает дозапись узлов, оставшихся в журнале с прошлого запуска"""
+        from src.services.graph_outbox import GraphOutbox
+
+        if not GraphOutbox.has_pending():
+            return False
+        self._get_outbox()
+        return True
+
+    def close(self) -> None:
+        """Останавливает фоновую запись (журнал сохраняется) и закрывает соединение с neo4j"""
+        if self._outbox is not None:
+            self._outbox.close()
+        if self._graph_service is not None:
+            self._graph_service.close()
+
     def get_image_name(self) -> str:
         """Возвращает путь к сгенерированному изображению"""
         if not self.image_generated or self.image_node is None:
@@ -90,30 +365,83 @@ class TableController:
 
         return self.image_node.image_path
 
+    @timed("controller.push_to_neo4j")
     def push_to_neo4j(self) -> bool:
-        """Отправляет данные в neo4j"""
+        """Ставит узел в журнал отложенной записи в neo4j; сервер не ожидается"""
         if not self.image_generated or self.image_node is None:
             raise ValueError("Сначала сгенерируйте изображение")
 
-        if self._graph_service is None:
-            self._graph_service = GraphDBService()
-
-        self._graph_service.push_image_node(self.image_node)
+        self._get_outbox().put([self.image_node])
+        self._queued_id = self.image_node.id
         return True
 
-    def search_similar_images(self, threshold: float = 0.8) -> list[dict[str, str]]:
-        """Ищет похожие изображения в neo4j"""
+    def _ensure_queued(self) -> None:
+        """Ставит текущий узел в журнал, если он еще не поставлен"""
+        if self._queued_id != self.image_node.id:
+            self.push_to_neo4j()
+
+    def _ensure_pushed(self) -> None:
+        """Ставит текущий узел в журнал и ждет записи только его (и узлов перед ним)"""
+        self._ensure_queued()
+        if not self._get_outbox().flush(self.SEARCH_FLUSH_TIMEOUT, node_ids=[self.image_node.id]):
+            raise ValueError("neo4j недоступен: узел ожидает записи в локальном журнале")
+
+    @timed("controller.search_similar_images")
+    def search_similar_images(self, threshold: float = 0.8, limit: int = 20) -> list[dict[str, str]]:
+        """Ищет в neo4j изображения с похожей суммой.
+
+        threshold - степень сходства от 0 до 1: допускается отклонение суммы
+        на (1 - threshold) * |sum|, при threshold=1 ищутся только равные суммы.
+        """
         if not self.image_generated or self.image_node is None:
             raise ValueError("Сначала сгенерируйте изображение")
+        if not 0 <= threshold <= 1:
+            raise ValueError("threshold должен быть в диапазоне от 0 до 1")
 
-        self.push_to_neo4j()  
-
-        if self._graph_service is None:
-            self._graph_service = GraphDBService()
+        # Сам узел в ответ не входит (exclude_id), поэтому ждать его записи не нужно
+        self._ensure_queued()
 
-        similar_nodes = self._graph_service.find_similar_by_sum(self.image_node.id)
+        graph_service = self._get_graph_service()
+        tolerance = abs(self.image_node.sum) * (1 - threshold)
+        similar_nodes = graph_service.find_by_sum_range(
+            self.image_node.sum,
+            tolerance=tolerance,
+            exclude_id=self.image_node.id,
+            limit=limit,
+        )
         return similar_nodes
 
+    def count_same_sum_images(self) -> int:
+        """Число изображений в neo4j с той же суммой, что у текущего"""
+        if not self.image_generated or self.image_node is None:
+            raise ValueError("Сначала сгенерируйте изображение")
+
+        self._ensure_pushed()
+        return self._get_graph_service().count_similar_by_sum(self.image_node.id)
+
+    @timed("controller.same_sum_images_page")
+    def same_sum_images_page(
+        self, after: tuple | None = None, page_size: int | None = None
+    ) -> "ImagePage":
+        """Страница изображений с той же суммой; after - cursor предыдущей страницы"""
+        if not self.image_generated or self.image_node is None:
+            raise ValueError("Сначала сгенерируйте изображение")
+
+        self._ensure_pushed()
+        return self._get_graph_service().find_similar_by_sum_page(
+            self.image_node.id, page_size, after, fields=("sum", "image_path")
+        )
+
+    @timed("controller.search_similar_by_image")
+    def search_similar_by_image(self, k: int = 10) -> list[dict[str, str]]:
+        """Ищет в neo4j изображения, похожие по содержимому (по эмбеддингу)"""
+        if not self.image_generated or self.image_node is None:
+            raise ValueError("Сначала сгенерируйте изображение")
+
+        return self._get_graph_service().find_similar_by_embedding(
+            self.image_node.embedding, k=k, exclude_id=self.image_node.id
+        )
+
     def is_image_generated(self) -> bool:
         """Проверяет, сгенерировано ли изображение"""
         return self.image_generated
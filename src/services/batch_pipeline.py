@@ -0,0 +1,309 @@
+"""Пакетная обработка периодов: суммы -> изображения -> Neo4j.
+
+Стадии связаны ограниченными очередями и работают одновременно:
+суммы считаются одним векторизованным запросом к TableAnalyzer, изображения
+генерируются пулом потоков, а узлы пишутся в Neo4j пакетами. Обработанные
+периоды фиксируются в журнале (JSONL), поэтому прерванный запуск можно
+продолжить с того же места.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Iterable
+import numpy as np
+from src.services.graph_service import GraphDBService, ImageNode
+from src.services.image_embedding import compute_embedding
+from src.services.image_generator import ImageGen
+from src.services.table_analyzer import CALENDAR_UNITS, TableAnalyzer, calendar_bounds
+
+PERIOD_STEPS = CALENDAR_UNITS
+
+_STOP = object()
+
+
+def periods_every(
+    date_from: date | np.datetime64, date_to: date | np.datetime64, step: str
+) -> list[tuple[str, str]]:
+    """Разбивает диапазон на календарные периоды (см. table_analyzer.calendar_bounds).
+
+    Первый и последний периоды не обрезаются по границам диапазона.
+    """
+    starts, ends = calendar_bounds(date_from, date_to, step)
+    return [
+        (str(start), str(end))
+        for start, end in zip(np.datetime_as_string(starts), np.datetime_as_string(ends))
+    ]
+
+
+def parse_periods(specs: Iterable[str]) -> list[tuple[str, str]]:
+    """Разбирает периоды вида 2024-01-01:2024-01-31 (одна дата - период в один день)"""
+    periods = []
+    for spec in specs:
+        start, _, end = spec.partition(":")
+        try:
+            start_parsed = np.datetime64(start.strip(), "D")
+            end_parsed = np.datetime64((end or start).strip(), "D")
+        except ValueError:
+            raise ValueError(f"Некорректный период: {spec}") from None
+        if end_parsed < start_parsed:
+            raise ValueError(f"Начало периода позже конца: {spec}")
+        periods.append((str(start_parsed), str(end_parsed)))
+    return periods
+
+
+class PipelineCheckpoint:
+    """Журнал периодов, узлы которых уже записаны в Neo4j.
+
+    Ключ записи - (начало, конец, сумма): если данные таблицы изменились
+    и сумма периода стала другой, период обрабатывается заново.
+    Оборванная при сбое последняя строка журнала игнорируется.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self._done: set[tuple[str, str, int]] = set()
+        self._lock = threading.Lock()
+        # Оборванная строка без перевода строки склеилась бы со следующей записью
+        self._broken_tail = False
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    self._broken_tail = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                        self._done.add(
+                            (record["period_start"], record["period_end"], record["sum"])
+                        )
+                    except (ValueError, KeyError):
+                        continue
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def is_done(self, period_start: str, period_end: str, total: int) -> bool:
+        return (period_start, period_end, total) in self._done
+
+    def record(self, nodes: list[ImageNode]) -> None:
+        """Дописывает узлы в журнал и сбрасывает его на диск"""
+        lines = [
+            json.dumps(
+                {
+                    "period_start": node.period_start,
+                    "period_end": node.period_end,
+                    "sum": node.sum,
+                    "id": node.id,
+                    "image_path": node.image_path,
+                },
+                ensure_ascii=False,
+            )
+            for node in nodes
+        ]
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self._broken_tail:
+                    f.write("\n")
+                    self._broken_tail = False
+                f.write("".join(line + "\n" for line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self._done.update((n.period_start, n.period_end, n.sum) for n in nodes)
+
+
+@dataclass
+class PipelineItem:
+    period_start: str
+    period_end: str
+    sum: int
+
+
+@dataclass
+class PipelineReport:
+    """Итоги запуска: счетчики и время работы стадий"""
+    periods: int = 0
+    skipped: int = 0
+    generated: int = 0
+    pushed: int = 0
+    batches: int = 0
+    failures: list[tuple[str, str, str]] = field(default_factory=list)
+    sums_seconds: float = 0.0
+    images_seconds: float = 0.0
+    graph_seconds: float = 0.0
+    seconds: float = 0.0
+
+    def format(self) -> str:
+        def rate(count: int, seconds: float) -> str:
+            return f"{count / seconds:.1f}/с" if seconds else "-"
+
+        lines = [
+            f"Периодов: {self.periods}, пропущено по журналу: {self.skipped}",
+            f"Суммы: {self.sums_seconds:.3f} с",
+            f"Изображения: {self.generated} шт., суммарное время генерации "
+            f"{self.images_seconds:.1f} с",
+            f"Neo4j: {self.pushed} узлов в {self.batches} пакетах за {self.graph_seconds:.2f} с "
+            f"({rate(self.pushed, self.graph_seconds)})",
+            f"Всего: {self.seconds:.1f} с, сквозная пропускная способность "
+            f"{rate(self.pushed, self.seconds)}",
+        ]
+        if self.failures:
+            lines.append(f"Ошибок: {len(self.failures)}")
+            lines += [f"  {start} - {end}: {error}" for start, end, error in self.failures]
+        return "\n".join(lines)
+
+
+class BatchPipeline:
+    """Конвейер периоды -> суммы -> изображения -> Neo4j с ограниченными очередями.
+
+    Ошибка отдельного периода не останавливает конвейер: она попадает
+    в отчет, а период не отмечается в журнале и будет повторен при следующем
+    запуске. Повторная генерация при этом обычно берется из ImageCache.
+    """
+    DEFAULT_BATCH_SIZE = 100
+    DEFAULT_QUEUE_SIZE = 64
+    DEFAULT_FLUSH_INTERVAL = 2.0
+
+    def __init__(
+        self,
+        analyzer: TableAnalyzer,
+        image_gen: ImageGen,
+        graph_service: GraphDBService,
+        checkpoint: PipelineCheckpoint | None = None,
+        image_workers: int | None = None,
+        batch_size: int | None = None,
+        queue_size: int | None = None,
+        flush_interval: float | None = None,
+        resume: bool = True,
+    ):
+        """image_workers - число потоков генерации (по умолчанию image_gen.max_workers),
+        flush_interval - через сколько секунд простоя записывать неполный пакет,
+        resume=False - обрабатывать и периоды, уже отмеченные в журнале"""
+        self.analyzer = analyzer
+        self.image_gen = image_gen
+        self.graph_service = graph_service
+        self.checkpoint = checkpoint
+        self.image_workers = image_workers or image_gen.max_workers
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.queue_size = queue_size or self.DEFAULT_QUEUE_SIZE
+        self.flush_interval = flush_interval or self.DEFAULT_FLUSH_INTERVAL
+        self.resume = resume
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self, periods: list[tuple[str, str]]) -> PipelineReport:
+        """Обрабатывает периоды и возвращает отчет.
+
+        При KeyboardInterrupt уже сгенерированные узлы дописываются в Neo4j
+        и журнал, после чего исключение пробрасывается дальше.
+        """
+        report = PipelineReport(periods=len(periods))
+        start = time.perf_counter()
+        self._stop.clear()
+
+        sums = self.analyzer.sum_by_periods(periods) if periods else []
+        report.sums_seconds = time.perf_counter() - start
+
+        pending: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        nodes: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        workers = [
+            threading.Thread(target=self._image_worker, args=(pending, nodes, report), daemon=True)
+            for _ in range(self.image_workers)
+        ]
+        writer = threading.Thread(target=self._graph_writer, args=(nodes, report), daemon=True)
+        for thread in workers + [writer]:
+            thread.start()
+
+        try:
+            for (period_start, period_end), total in zip(periods, sums):
+                total = int(total)
+                if (
+                    self.resume
+                    and self.checkpoint is not None
+                    and self.checkpoint.is_done(period_start, period_end, total)
+                ):
+                    report.skipped += 1
+                    continue
+                pending.put(PipelineItem(period_start, period_end, total))
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            for _ in workers:
+                pending.put(_STOP)
+            for thread in workers:
+                thread.join()
+            nodes.put(_STOP)
+            writer.join()
+            report.seconds = time.perf_counter() - start
+
+        return report
+
+    def _fail(self, report: PipelineReport, start: str, end: str, error: Exception) -> None:
+        with self._lock:
+            report.failures.append((start, end, f"{type(error).__name__}: {error}"))
+
+    def _image_worker(
+        self, pending: queue.Queue, nodes: queue.Queue, report: PipelineReport
+    ) -> None:
+        while (item := pending.get()) is not _STOP:
+            if self._stop.is_set():
+                continue
+
+            start = time.perf_counter()
+            try:
+                image_path = self.image_gen.generate(str(item.sum))
+                node = ImageNode(
+                    sum=item.sum,
+                    period_start=item.period_start,
+                    period_end=item.period_end,
+                    image_path=image_path,
+                    embedding=compute_embedding(image_path).tolist(),
+                )
+                self.image_gen.store.attach(image_path, node.id, node.sum)
+            except Exception as e:
+                self._fail(report, item.period_start, item.period_end, e)
+                continue
+            finally:
+                with self._lock:
+                    report.images_seconds += time.perf_counter() - start
+
+            with self._lock:
+                report.generated += 1
+            nodes.put(node)
+
+    def _graph_writer(self, nodes: queue.Queue, report: PipelineReport) -> None:
+        batch: list[ImageNode] = []
+        while True:
+            try:
+                node = nodes.get(timeout=self.flush_interval)
+            except queue.Empty:
+                node = None
+            if node is _STOP:
+                break
+            if node is not None:
+                batch.append(node)
+            if batch and (node is None or len(batch) >= self.batch_size):
+                self._flush(batch, report)
+                batch = []
+
+        if batch:
+            self._flush(batch, report)
+
+    def _flush(self, batch: list[ImageNode], report: PipelineReport) -> None:
+        try:
+            stats = self.graph_service.push_image_nodes(batch, batch_size=len(batch))
+            if self.checkpoint is not None:
+                self.checkpoint.record(batch)
+        except Exception as e:
+            for node in batch:
+                self._fail(report, node.period_start, node.period_end, e)
+            return
+
+        with self._lock:
+            report.pushed += stats.nodes
+            report.batches += stats.batches
+            report.graph_seconds += stats.seconds
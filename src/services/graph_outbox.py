@@ -0,0 +1,350 @@
+"""Журнал отложенной записи (write-behind) узлов Image в Neo4j.
+
+put() не ждет сервер: параметры узла записываются в локальный журнал SQLite
+(режим WAL, по умолчанию data/neo4j_outbox.sqlite3), и вызов сразу
+возвращается. Фоновый поток забирает записи пакетами в порядке поступления
+и пишет их в Neo4j; запись удаляется из журнала только после подтверждения
+транзакции. Пока Neo4j недоступен, пакет повторяется с экспоненциальной
+задержкой; записи, оставшиеся после падения или закрытия процесса,
+дописываются при следующем запуске. Повторная запись безопасна: запрос
+построен на MERGE по Image.id.
+
+Ошибки связи, временные ошибки и ошибки доступа повторяются без
+ограничения. Если пакет max_attempts раз отклонен из-за данных (нарушение
+ограничения, неверный тип; счетчик attempts), пакет делится пополам, пока не
+останется одна виноватая запись; она переносится в таблицу outbox_dead (см.
+dead_letters), чтобы не задерживать остальные.
+
+Метрики: graphdb_outbox_depth и graphdb_outbox_oldest_seconds (датчики),
+graphdb_outbox_flush_lag_seconds (от постановки в журнал до записи),
+graphdb_outbox_flushed_total, graphdb_outbox_retries_total,
+graphdb_outbox_dead_letters_total.
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable
+from src.config.config import DATA_DIR
+from src.services.metrics import METRICS, count, gauge, observe, timed
+
+if TYPE_CHECKING:
+    from src.services.graph_service import GraphDBService, ImageNode
+
+DEFAULT_OUTBOX_PATH = DATA_DIR / "neo4j_outbox.sqlite3"
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    enqueued REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS outbox_dead (
+    node_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    enqueued REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT NOT NULL,
+    failed REAL NOT NULL
+);
+"""
+
+# Повторная постановка еще не записанного узла заменяет его параметры,
+# сохраняя место в очереди; version защищает новую версию от удаления
+# пакетом, который был прочитан до замены
+ENQUEUE = """
+INSERT INTO outbox (node_id, payload, enqueued) VALUES (?, ?, ?)
+ON CONFLICT (node_id) DO UPDATE SET payload = excluded.payload, version = version + 1
+"""
+
+
+class GraphOutbox:
+    DEFAULT_BATCH_SIZE = 500
+    DEFAULT_POLL_INTERVAL = 5.0
+    DEFAULT_MAX_BACKOFF = 60.0
+    DEFAULT_MAX_ATTEMPTS = 5
+    INITIAL_BACKOFF = 0.5
+
+    def __init__(
+        self,
+        service_factory: Callable[[], "GraphDBService"],
+        path: Path | str | None = None,
+        batch_size: int | None = None,
+        poll_interval: float | None = None,
+        max_backoff: float | None = None,
+        max_attempts: int | None = None,
+    ):
+        """service_factory - возвращает GraphDBService (вызывается в фоновом потоке,
+        поэтому подключение к Neo4j не задерживает put), path - файл журнала,
+        max_attempts - отказов из-за данных, после которых запись ищется и
+        переносится в outbox_dead"""
+        self.service_factory = service_factory
+        self.path = Path(path or DEFAULT_OUTBOX_PATH)
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.poll_interval = poll_interval or self.DEFAULT_POLL_INTERVAL
+        self.max_backoff = max_backoff or self.DEFAULT_MAX_BACKOFF
+        self.max_attempts = max_attempts or self.DEFAULT_MAX_ATTEMPTS
+        self.last_error: Exception | None = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL: запись не блокирует чтение; NORMAL переживает падение процесса
+        # (но не отключение питания) без fsync на каждую транзакцию
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._update_gauges()
+
+    @staticmethod
+    def has_pending(path: Path | str | None = None) -> bool:
+        """Есть ли в журнале незаписанные узлы (без запуска фонового потока)"""
+        path = Path(path or DEFAULT_OUTBOX_PATH)
+        if not path.exists():
+            return False
+        db = sqlite3.connect(path)
+        try:
+            return db.execute("SELECT 1 FROM outbox LIMIT 1").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            db.close()
+
+    @staticmethod
+    def pending_paths(path: Path | str | None = None) -> set[str]:
+        """Пути изображений узлов, еще не записанных в Neo4j (для сборки мусора ImageStore)"""
+        path = Path(path or DEFAULT_OUTBOX_PATH)
+        if not path.exists():
+            return set()
+        db = sqlite3.connect(path)
+        try:
+            # Узлы из outbox_dead тоже: их можно исправить и поставить в журнал снова
+            query = "SELECT payload FROM outbox UNION ALL SELECT payload FROM outbox_dead"
+            return {json.loads(payload)["path"] for (payload,) in db.execute(query)}
+        except sqlite3.OperationalError:
+            return set()
+        finally:
+            db.close()
+
+    def start(self) -> "GraphOutbox":
+        """Запускает фоновую запись; записи, оставшиеся с прошлого запуска, идут первыми"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="neo4j-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        """Останавливает фоновый поток; незаписанные узлы остаются в журнале"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Поток еще ждет Neo4j; соединение с журналом закроется вместе с процессом
+                return
+            self._thread = None
+        with self._lock:
+            self._db.close()
+
+    @timed("outbox.put")
+    def put(self, nodes: Iterable["ImageNode"]) -> int:
+        """Добавляет узлы в журнал (одной транзакцией) и возвращает их число"""
+        from src.services.graph_service import GraphDBService
+
+        now = time.time()
+        rows = [(node.id, json.dumps(GraphDBService.node_params(node)), now) for node in nodes]
+        with self._lock, self._db:
+            self._db.executemany(ENQUEUE, rows)
+        self._update_gauges()
+        self._wakeup.set()
+        return len(rows)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM outbox").fetchone()[0]
+
+    def dead_letters(self) -> list[dict]:
+        """Узлы, отклоненные Neo4j max_attempts раз: параметры, ошибка и время"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, payload, attempts, error, failed FROM outbox_dead ORDER BY failed"
+            ).fetchall()
+        return [
+            {"node_id": node_id, "params": json.loads(payload), "attempts": attempts,
+             "error": error, "failed": failed}
+            for node_id, payload, attempts, error, failed in rows
+        ]
+
+    def flush(self, timeout: float | None = None, node_ids: Iterable[str] | None = None) -> bool:
+        """Ждет записи всех узлов, поставленных до вызова; False - не успели за timeout.
+
+        node_ids - ждать только записи этих узлов (и стоящих в очереди перед ними)
+        """
+        with self._lock:
+            if node_ids is None:
+                last = self._db.execute("SELECT max(seq) FROM outbox").fetchone()[0]
+            else:
+                node_ids = list(node_ids)
+                last = self._db.execute(
+                    f"SELECT max(seq) FROM outbox WHERE node_id IN ({', '.join('?' * len(node_ids))})",
+                    node_ids,
+                ).fetchone()[0]
+        if last is None:
+            return True
+
+        self._wakeup.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._flushed:
+            while self._has_pending(last):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def _has_pending(self, last: int) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM outbox WHERE seq <= ? LIMIT 1", (last,)
+            ).fetchone() is not None
+
+    def _next_batch(self, limit: int) -> list[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT seq, version, enqueued, attempts, payload FROM outbox ORDER BY seq LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    @staticmethod
+    def _is_data_error(error: Exception) -> bool:
+        """Отказ из-за данных узлов: повтор того же пакета не поможет. Сбои связи,
+        временные ошибки и ошибки доступа к серверу к таким не относятся"""
+        from neo4j.exceptions import ConstraintError, CypherTypeError
+
+        return isinstance(error, (ConstraintError, CypherTypeError, TypeError, ValueError))
+
+    def _run(self) -> None:
+        delay = 0.0
+        limit = self.batch_size
+        while not self._stopping.is_set():
+            batch = self._next_batch(limit)
+            if not batch:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                service = self.service_factory()
+            except Exception as e:
+                # Нет подключения к Neo4j - записи не виноваты, попытки не считаются
+                delay = self._retry_later(e, delay)
+                continue
+
+            try:
+                self._flush_batch(service, batch)
+            except Exception as e:
+                if not self._is_data_error(e) or self._record_failure(batch) < self.max_attempts:
+                    delay = self._retry_later(e, delay)
+                    continue
+                # Отказ из-за данных: пакет делится пополам, пока не останется
+                # виноватая запись; она без задержки переносится в outbox_dead
+                self.last_error = e
+                if len(batch) > 1:
+                    limit = max(1, len(batch) // 2)
+                else:
+                    self._dead_letter(batch[0], e)
+                    limit = self.batch_size
+            else:
+                delay = 0.0
+                self.last_error = None
+                if limit < self.batch_size and not self._has_suspects():
+                    limit = self.batch_size
+
+    def _retry_later(self, error: Exception, delay: float) -> float:
+        """Ждет перед повтором и возвращает следующую задержку"""
+        self.last_error = error
+        count("graphdb_outbox_retries_total", error=type(error).__name__)
+        # Экспоненциальная задержка со случайной добавкой, чтобы
+        # несколько процессов не повторяли запись одновременно
+        delay = min(self.max_backoff, max(self.INITIAL_BACKOFF, delay * 2))
+        self._stopping.wait(delay * random.uniform(0.5, 1.0))
+        return delay
+
+    def _record_failure(self, batch: list[tuple]) -> int:
+        """Увеличивает число отказов записей пакета и возвращает наибольшее"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE outbox SET attempts = attempts + 1 WHERE seq = ?",
+                [(seq,) for seq, *_ in batch],
+            )
+        self._update_gauges()
+        return max(attempts for *_, attempts, _ in batch) + 1
+
+    def _has_suspects(self) -> bool:
+        """Остались ли записи, отклоненные max_attempts раз (поиск виноватой не закончен)"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM outbox WHERE attempts >= ? LIMIT 1", (self.max_attempts,)
+            ).fetchone() is not None
+
+    def _dead_letter(self, row: tuple, error: Exception) -> None:
+        seq, version, enqueued, attempts, payload = row
+        node_id = json.loads(payload)["id"]
+        with self._lock, self._db:
+            deleted = self._db.execute(
+                "DELETE FROM outbox WHERE seq = ? AND version = ?", (seq, version)
+            ).rowcount
+            if deleted:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO outbox_dead VALUES (?, ?, ?, ?, ?, ?)",
+                    (node_id, payload, enqueued, attempts + 1, f"{type(error).__name__}: {error}", time.time()),
+                )
+        if deleted:
+            # Иначе узел поставлен заново с новыми параметрами и будет записан снова
+            logger.error(
+                "Узел %s не записан в Neo4j после %d попыток и перенесен в outbox_dead: %s",
+                node_id, attempts + 1, error,
+            )
+            count("graphdb_outbox_dead_letters_total")
+        self._update_gauges()
+        with self._flushed:
+            self._flushed.notify_all()
+
+    def _flush_batch(self, service: "GraphDBService", batch: list[tuple]) -> None:
+        rows = [json.loads(payload) for *_, payload in batch]
+        with timed("outbox.flush_batch"):
+            service.push_rows(rows)
+
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM outbox WHERE seq = ? AND version = ?",
+                [(seq, version) for seq, version, *_ in batch],
+            )
+        now = time.time()
+        for _, _, enqueued, *_ in batch:
+            observe("graphdb_outbox_flush_lag_seconds", now - enqueued)
+        count("graphdb_outbox_flushed_total", len(batch))
+        self._update_gauges()
+        with self._flushed:
+            self._flushed.notify_all()
+
+    def _update_gauges(self) -> None:
+        if not METRICS.enabled:
+            return
+        with self._lock:
+            depth, oldest = self._db.execute("SELECT count(*), min(enqueued) FROM outbox").fetchone()
+        gauge("graphdb_outbox_depth", depth)
+        gauge("graphdb_outbox_oldest_seconds", time.time() - oldest if oldest is not None else 0)
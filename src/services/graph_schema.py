@@ -0,0 +1,134 @@
+"""Схема Neo4j: ограничения и индексы, от которых зависят запросы GraphDBService.
+
+Создание схемы идемпотентно. Явный запуск: python -m src.services.graph_schema
+"""
+import warnings
+from dataclasses import dataclass
+from neo4j import Driver
+from neo4j.exceptions import Neo4jError
+
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT image_id_unique IF NOT EXISTS FOR (i:Image) REQUIRE i.id IS UNIQUE",
+    "CREATE CONSTRAINT sum_value_unique IF NOT EXISTS FOR (s:Sum) REQUIRE s.value IS UNIQUE",
+    "CREATE CONSTRAINT sum_bucket_unique IF NOT EXISTS "
+    "FOR (b:SumBucket) REQUIRE (b.resolution, b.value) IS UNIQUE",
+    "CREATE INDEX image_sum IF NOT EXISTS FOR (i:Image) ON (i.sum)",
+    "CREATE INDEX image_created IF NOT EXISTS FOR (i:Image) ON (i.created)",
+    "CREATE INDEX image_path IF NOT EXISTS FOR (i:Image) ON (i.image_path)",
+]
+
+VECTOR_INDEX_NAME = "image_embedding"
+VECTOR_INDEX_STATEMENT = (
+    f"CREATE VECTOR INDEX {VECTOR_INDEX_NAME} IF NOT EXISTS "
+    "FOR (i:Image) ON i.embedding "
+    "OPTIONS {{indexConfig: {{`vector.dimensions`: {dimensions}, "
+    "`vector.similarity_function`: 'cosine'}}}}"
+)
+
+INDEX_WAIT_SECONDS = 60
+
+
+@dataclass
+class HotQuery:
+    """Запрос, который должен использовать индексы по указанным label(property)"""
+    query: str
+    params: dict
+    expected_indexes: list[str]
+
+
+@dataclass
+class IndexUsageReport:
+    name: str
+    used_indexes: list[str]
+    missing_indexes: list[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing_indexes
+
+
+def ensure_schema(driver: Driver, wait_seconds: int = INDEX_WAIT_SECONDS) -> None:
+    """Создает ограничения и индексы, если их еще нет, и ждет их готовности"""
+    with driver.session() as session:
+        for statement in SCHEMA_STATEMENTS:
+            session.run(statement).consume()
+        session.run("CALL db.awaitIndexes($seconds)", seconds=wait_seconds).consume()
+
+
+def ensure_vector_index(driver: Driver, dimensions: int) -> bool:
+    """Создает векторный индекс по Image.embedding; False - сервер его не поддерживает"""
+    try:
+        with driver.session() as session:
+            session.run(VECTOR_INDEX_STATEMENT.format(dimensions=dimensions)).consume()
+        return True
+    except Neo4jError:
+        return False
+
+
+def _collect_index_operators(plan: dict, found: list[str]) -> None:
+    operator = plan.get("operatorType", "")
+    if "Index" in operator:
+        details = plan.get("args", {}).get("Details", "")
+        found.append(f"{operator.split('@')[0]} {details}".strip())
+    for child in plan.get("children", []):
+        _collect_index_operators(child, found)
+
+
+def verify_index_usage(driver: Driver, hot_queries: dict[str, HotQuery]) -> list[IndexUsageReport]:
+    """Проверяет через EXPLAIN, что запросы используют индексы; предупреждает, если нет"""
+    reports = []
+    with driver.session() as session:
+        for name, hot_query in hot_queries.items():
+            summary = session.run(f"EXPLAIN {hot_query.query}", **hot_query.params).consume()
+            used: list[str] = []
+            _collect_index_operators(summary.plan or {}, used)
+
+            missing = [
+                index for index in hot_query.expected_indexes
+                if not any(index in operator for operator in used)
+            ]
+            report = IndexUsageReport(name=name, used_indexes=used, missing_indexes=missing)
+            if not report.ok:
+                warnings.warn(
+                    f"Запрос {name} не использует индексы: {', '.join(missing)}",
+                    RuntimeWarning,
+                    stacklevel=2,
+                )
+            reports.append(report)
+    return reports
+
+
+def bootstrap_schema(driver: Driver, hot_queries: dict[str, HotQuery]) -> list[IndexUsageReport]:
+    """Создает схему и проверяет планы; ошибки превращаются в предупреждения"""
+    try:
+        ensure_schema(driver)
+        return verify_index_usage(driver, hot_queries)
+    except Neo4jError as e:
+        warnings.warn(f"Не удалось подготовить схему Neo4j: {e}", RuntimeWarning, stacklevel=2)
+        return []
+
+
+def main():
+    from src.services.graph_service import GraphDBService
+    from src.services.image_embedding import EMBEDDING_DIM
+
+    service = GraphDBService(ensure_schema=False)
+    try:
+        ensure_schema(service.driver)
+        print("Схема Neo4j создана")
+        service.backfill_sum_buckets()
+        if ensure_vector_index(service.driver, EMBEDDING_DIM):
+            print("Векторный индекс по Image.embedding создан")
+        else:
+            print("Сервер не поддерживает векторные индексы, используется поиск в памяти")
+        for report in verify_index_usage(service.driver, service.HOT_QUERIES):
+            status = "OK" if report.ok else f"нет индексов: {', '.join(report.missing_indexes)}"
+            print(f"{report.name}: {status}")
+            for operator in report.used_indexes:
+                print(f"    {operator}")
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
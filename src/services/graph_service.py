@@ -1,13 +1,26 @@
-import os
-from neo4j import GraphDatabase
+import copy
+import math
+import threading
+import time
+from itertools import batched
+from typing import Iterable, Iterator
+from neo4j import Driver, GraphDatabase, ManagedTransaction
 from dataclasses import dataclass, field
 from datetime import datetime
 import uuid
-from dotenv import load_dotenv
+from src.config.config import get_settings
+from src.services.graph_schema import (
+    VECTOR_INDEX_NAME,
+    HotQuery,
+    bootstrap_schema,
+    ensure_vector_index,
+)
+from src.services.image_embedding import EMBEDDING_DIM
+from src.services.metrics import count, timed
+from src.services.similarity_cache import EVERYTHING, MISSING, SimilarityCache
+from src.services.vector_index import VectorIndex
 
 
-load_dotenv()
-
 
 @dataclass
 class ImageNode:
@@ -20,11 +33,204 @@ class ImageNode:
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
 
 
+@dataclass
+class ImagePage:
+    """Страница результатов; cursor - (created, id) последней строки для
+    запроса следующей страницы, None - страниц больше нет"""
+    items: list[dict]
+    cursor: tuple | None = None
+
+
+@dataclass
+class IngestStats:
+    nodes: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def nodes_per_sec(self) -> float:
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+
+PUSH_IMAGE_NODES_QUERY = """
+UNWIND $rows AS row
+MERGE (s:Sum {value: row.sum_key})
+MERGE (i:Image {id: row.id})
+SET i.sum = row.sum,
+    i.period_start = row.period_start,
+    i.period_end = row.period_end,
+    i.image_path = row.path,
+    i.created = datetime(row.created),
+    i.embedding = coalesce(row.embedding, i.embedding)
+MERGE (i)-[:HAS_SUM]->(s)
+WITH i, row
+UNWIND row.buckets AS bucket
+MERGE (b:SumBucket {resolution: bucket.resolution, value: bucket.value})
+MERGE (i)-[:IN_BUCKET]->(b)
+"""
+
+BACKFILL_SUM_BUCKETS_QUERY = """
+MATCH (i:Image)
+WHERE i.sum IS NOT NULL AND NOT (i)-[:IN_BUCKET]->(:SumBucket)
+CALL (i) {
+    UNWIND $resolutions AS resolution
+    MERGE (b:SumBucket {resolution: resolution, value: toInteger(floor(i.sum / resolution))})
+    MERGE (i)-[:IN_BUCKET]->(b)
+} IN TRANSACTIONS OF 1000 ROWS
+"""
+
+IMAGE_FIELDS = """
+img.id AS id, img.sum AS sum, img.image_path AS image_path,
+    img.period_start AS period_start, img.period_end AS period_end,
+    img.created AS created
+"""
+
+SUM_DISTANCE_FIELDS = f"{IMAGE_FIELDS}, abs(img.sum - $target_sum) AS difference"
+
+FIND_BY_SUM_RANGE_QUERY = f"""
+MATCH (img:Image)
+WHERE img.sum >= $min_sum AND img.sum <= $max_sum
+    AND ($exclude_id IS NULL OR img.id <> $exclude_id)
+RETURN {SUM_DISTANCE_FIELDS}
+ORDER BY difference
+LIMIT $limit
+"""
+
+FIND_IN_BUCKETS_QUERY = f"""
+MATCH (b:SumBucket {{resolution: $resolution}})<-[:IN_BUCKET]-(img:Image)
+WHERE b.value IN $bucket_values
+    AND ($exclude_id IS NULL OR img.id <> $exclude_id)
+RETURN {SUM_DISTANCE_FIELDS}
+ORDER BY difference
+LIMIT $limit
+"""
+
+FIND_NEAREST_ABOVE_QUERY = f"""
+MATCH (img:Image)
+WHERE img.sum >= $target_sum AND ($exclude_id IS NULL OR img.id <> $exclude_id)
+RETURN {SUM_DISTANCE_FIELDS}
+ORDER BY img.sum ASC
+LIMIT $limit
+"""
+
+FIND_NEAREST_BELOW_QUERY = f"""
+MATCH (img:Image)
+WHERE img.sum < $target_sum AND ($exclude_id IS NULL OR img.id <> $exclude_id)
+RETURN {SUM_DISTANCE_FIELDS}
+ORDER BY img.sum DESC
+LIMIT $limit
+"""
+
+# Keyset-пагинация по (created, id): следующая страница начинается строго после
+# последней строки предыдущей, поэтому сервер не пропускает OFFSET строк.
+# Поля возвращаются списком values по $fields, чтобы текст запроса (и его план
+# в кэше сервера) не зависел от набора полей.
+FIND_SIMILAR_BY_SUM_PAGE_QUERY = """
+MATCH (:Image {id: $id})-[:HAS_SUM]->(s:Sum)<-[:HAS_SUM]-(img:Image)
+WHERE img.id <> $id
+    AND ($after_created IS NULL OR img.created < $after_created
+        OR (img.created = $after_created AND img.id < $after_id))
+RETURN img.id AS id, img.created AS created, [field IN $fields | img[field]] AS values,
+    s.value AS sum_key
+ORDER BY img.created DESC, img.id DESC
+LIMIT $limit
+"""
+
+# Число связей узла Sum берется из счетчика степени узла, без обхода изображений
+COUNT_SIMILAR_BY_SUM_QUERY = """
+MATCH (:Image {id: $id})-[:HAS_SUM]->(s:Sum)
+RETURN COUNT { (s)<-[:HAS_SUM]-() } - 1 AS total, s.value AS sum_key
+"""
+
+FIND_BY_EMBEDDING_QUERY = f"""
+CALL db.index.vector.queryNodes('{VECTOR_INDEX_NAME}', $k, $embedding) YIELD node AS img, score
+WHERE $exclude_id IS NULL OR img.id <> $exclude_id
+RETURN {IMAGE_FIELDS}, score
+ORDER BY score DESC
+"""
+
+FIND_BY_IDS_QUERY = f"""
+MATCH (img:Image)
+WHERE img.id IN $ids
+RETURN {IMAGE_FIELDS}
+"""
+
+IMAGE_PATHS_QUERY = """
+MATCH (i:Image)
+WHERE i.image_path IS NOT NULL
+RETURN i.image_path AS path
+"""
+
+LOAD_EMBEDDINGS_QUERY = """
+MATCH (i:Image)
+WHERE i.embedding IS NOT NULL
+RETURN i.id AS id, i.embedding AS embedding
+"""
+
+SET_EMBEDDINGS_QUERY = """
+UNWIND $rows AS row
+MATCH (i:Image {image_path: row.path})
+SET i.embedding = row.embedding
+RETURN i.id AS id, row.path AS path
+"""
+
+
 class GraphDBService:
-    def __init__(self):
-        uri = os.getenv("NEO4j_URI")
-        user = os.getenv("NEO4j_USER")
-        password = os.getenv("NEO4j_PASSWORD")
+    DEFAULT_BATCH_SIZE = 1000
+    DEFAULT_PAGE_SIZE = 200
+    PAGE_FIELDS = ("sum", "image_path", "period_start", "period_end")
+    DEFAULT_MAX_RETRY_TIME = 30.0
+    BUCKET_RESOLUTIONS = (10, 100, 1000)
+    HOT_QUERIES = {
+        "push_image_nodes": HotQuery(
+            PUSH_IMAGE_NODES_QUERY,
+            {"rows": []},
+            ["Image(id)", "Sum(value)"],
+        ),
+        "find_similar_by_sum": HotQuery(
+            FIND_SIMILAR_BY_SUM_PAGE_QUERY,
+            {"id": "", "after_created": None, "after_id": None, "fields": [], "limit": 20},
+            ["Image(id)"],
+        ),
+        "find_by_sum_range": HotQuery(
+            FIND_BY_SUM_RANGE_QUERY,
+            {"min_sum": 0, "max_sum": 0, "target_sum": 0, "exclude_id": None, "limit": 20},
+            ["Image(sum)"],
+        ),
+        "find_in_buckets": HotQuery(
+            FIND_IN_BUCKETS_QUERY,
+            {"resolution": 10, "bucket_values": [0], "target_sum": 0, "exclude_id": None, "limit": 20},
+            ["SumBucket(resolution, value)"],
+        ),
+    }
+
+    def __init__(
+        self,
+        batch_size: int | None = None,
+        max_retry_time: float | None = None,
+        ensure_schema: bool = True,
+        driver: Driver | None = None,
+        cache: SimilarityCache | None = None,
+    ):
+        """max_retry_time - сколько секунд повторять транзакцию при временных ошибках,
+        ensure_schema - создать ограничения и индексы при подключении,
+        driver - готовый драйвер (например, заменитель для бенчмарков) вместо подключения по .env,
+        cache - кэш ответов поиска по сумме (сбрасывается при записи узлов этим сервисом)"""
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.cache = cache
+        self.vector_search_supported: bool | None = None
+        self._fallback_index: VectorIndex | None = None
+        self._fallback_lock = threading.Lock()
+        self.driver = driver if driver is not None else self._connect(max_retry_time)
+
+        if ensure_schema:
+            bootstrap_schema(self.driver, self.HOT_QUERIES)
+            self.vector_search_supported = ensure_vector_index(self.driver, EMBEDDING_DIM)
+
+    @timed("neo4j.connect")
+    def _connect(self, max_retry_time: float | None) -> Driver:
+        settings = get_settings()
+        uri, user, password = settings.neo4j_uri, settings.neo4j_user, settings.neo4j_password
         
         if not all([uri, user, password]):
             raise ValueError(
@@ -33,7 +239,11 @@ class GraphDBService:
             )
         
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
+            return GraphDatabase.driver(
+                uri,
+                auth=(user, password),
+                max_transaction_retry_time=max_retry_time or self.DEFAULT_MAX_RETRY_TIME,
+            )
         except Exception as e:
             raise ConnectionError(f"Не удалось подключиться к Neo4j: {e}") from e
     
@@ -43,74 +253,346 @@ class GraphDBService:
             self.driver.close()
     
 
+    @classmethod
+    def _bucket_value(cls, value: float, resolution: int) -> int:
+        return math.floor(value / resolution)
+
+    @classmethod
+    def node_params(cls, node: ImageNode) -> dict:
+        """Параметры узла для PUSH_IMAGE_NODES_QUERY (сериализуются в JSON)"""
+        return {
+            "id": node.id,
+            "sum": node.sum,
+            "sum_key": int(round(node.sum)),
+            "period_start": node.period_start,
+            "period_end": node.period_end,
+            "path": node.image_path,
+            "created": node.created.isoformat(),
+            "embedding": node.embedding,
+            "buckets": [
+                {"resolution": r, "value": cls._bucket_value(node.sum, r)}
+                for r in cls.BUCKET_RESOLUTIONS
+            ],
+        }
+
+    @staticmethod
+    def _write_batch(tx: ManagedTransaction, rows: list[dict]) -> None:
+        tx.run(PUSH_IMAGE_NODES_QUERY, rows=rows).consume()
+
     def push_image_node(self, node: ImageNode):
-        sum_key = int(
-            round(node.sum)
-        )  
+        self.push_image_nodes([node])
+
+    def push_image_nodes(
+        self, nodes: Iterable[ImageNode], batch_size: int | None = None
+    ) -> IngestStats:
+        """Записывает узлы пакетами: один UNWIND-запрос в управляемой транзакции на пакет.
+
+        nodes может быть генератором - узлы не собираются в память целиком.
+        Транзакция пакета повторяется драйвером при временных ошибках
+        (TransientError, потеря соединения) в течение max_retry_time.
+        """
+        stats = IngestStats()
+        start = time.perf_counter()
 
         with self.driver.session() as session:
-            session.run(
-                """
-                MERGE (s:Sum {value: $sum_key})
-                MERGE (i:Image {id: $id})
-                SET i.sum = $sum,
-                    i.period_start = $period_start,
-                    i.period_end = $period_end,
-                    i.image_path = $path,
-                    i.created = datetime($created)
-                MERGE (i)-[:HAS_SUM]->(s)
-                """,
-                id=node.id,
-                sum=node.sum,
-                sum_key=sum_key,
-                period_start=node.period_start,
-                period_end=node.period_end,
-                path=node.image_path,
-                created=node.created.isoformat(),
-            )
+            for batch in batched(nodes, batch_size or self.batch_size):
+                rows = [self.node_params(node) for node in batch]
+                self._write_rows(session, rows)
+                stats.nodes += len(rows)
+                stats.batches += 1
+
+        stats.seconds = time.perf_counter() - start
+        return stats
 
-    def find_similar_by_sum(self, target_id: str, limit: int = 20):
+    def push_rows(self, rows: list[dict]) -> None:
+        """Записывает один пакет готовых параметров узлов (см. node_params).
+
+        Запрос построен на MERGE по Image.id, поэтому повторная запись того же
+        пакета (например, после сбоя до подтверждения) не создает дубликатов.
+        """
+        with self.driver.session() as session:
+            self._write_rows(session, rows)
+
+    def _write_rows(self, session, rows: list[dict]) -> None:
+        with timed("neo4j.write_batch"):
+            session.execute_write(self._write_batch, rows)
+        count("graphdb_neo4j_nodes_written_total", len(rows))
+        self._update_fallback_index(rows)
+        if self.cache is not None:
+            self.cache.invalidate([row["sum"] for row in rows], [row["id"] for row in rows])
+
+    def find_similar_by_sum(self, target_id: str, limit: int = 20) -> list[dict]:
+        """Последние limit изображений с той же суммой, что у target_id"""
+        return self.find_similar_by_sum_page(target_id, page_size=limit).items
+
+    def find_similar_by_sum_page(
+        self,
+        target_id: str,
+        page_size: int | None = None,
+        after: tuple | None = None,
+        fields: Iterable[str] | None = None,
+    ) -> ImagePage:
+        """Страница изображений с той же суммой, от новых к старым.
+
+        after - cursor предыдущей страницы, fields - нужные поля из PAGE_FIELDS
+        (по умолчанию все); id и created возвращаются всегда.
+        """
+        page_size = page_size or self.DEFAULT_PAGE_SIZE
+        fields = tuple(self.PAGE_FIELDS if fields is None else fields)
+        unknown = set(fields) - set(self.PAGE_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        return self._cached(
+            ("similar_by_sum_page", target_id, page_size, after, fields),
+            self._query_similar_by_sum_page,
+            target_id, page_size, after, fields,
+        )
+
+    @timed("neo4j.find_similar_by_sum_page")
+    def _query_similar_by_sum_page(
+        self, target_id: str, page_size: int, after: tuple | None, fields: tuple[str, ...]
+    ) -> tuple[ImagePage, tuple[float, float], set[str]]:
+        after_created, after_id = after or (None, None)
         with self.driver.session() as session:
             result = session.run(
-                """
-                MATCH (t:Image {id: $id})-[:HAS_SUM]->(s:Sum)<-[:HAS_SUM]-(other:Image)
-                WHERE other.id <> $id
-                RETURN other.id AS id, other.sum AS sum, other.image_path AS image_path,
-                    other.period_start AS period_start, other.period_end AS period_end,
-                    other.created AS created
-                ORDER BY other.created DESC
-                LIMIT $limit
-                """,
+                FIND_SIMILAR_BY_SUM_PAGE_QUERY,
                 id=target_id,
+                after_created=after_created,
+                after_id=after_id,
+                fields=list(fields),
+                limit=page_size + 1,
+            )
+            records = list(result)
+
+        items = [
+            {"id": r["id"], "created": r["created"], **dict(zip(fields, r["values"]))}
+            for r in records
+        ]
+        interval = self._sum_key_interval(records[0]["sum_key"]) if records else EVERYTHING
+        ids = {target_id, *(item["id"] for item in items)}
+        # Лишняя строка только показывает, что есть следующая страница
+        if len(items) <= page_size:
+            return ImagePage(items), interval, ids
+        items = items[:page_size]
+        return ImagePage(items, (items[-1]["created"], items[-1]["id"])), interval, ids
+
+    def iter_similar_by_sum(
+        self,
+        target_id: str,
+        page_size: int | None = None,
+        fields: Iterable[str] | None = None,
+    ) -> Iterator[dict]:
+        """Лениво перебирает все изображения с той же суммой, запрашивая страницы по мере чтения"""
+        cursor = None
+        while True:
+            page = self.find_similar_by_sum_page(target_id, page_size, cursor, fields)
+            yield from page.items
+            if page.cursor is None:
+                return
+            cursor = page.cursor
+
+    def count_similar_by_sum(self, target_id: str) -> int:
+        """Число изображений с той же суммой, что у target_id (без него самого)"""
+        return self._cached(("count_similar_by_sum", target_id), self._query_count_similar_by_sum, target_id)
+
+    @timed("neo4j.count_similar_by_sum")
+    def _query_count_similar_by_sum(self, target_id: str) -> tuple[int, tuple[float, float], set[str]]:
+        with self.driver.session() as session:
+            record = session.run(COUNT_SIMILAR_BY_SUM_QUERY, id=target_id).single()
+        if record is None:
+            return 0, EVERYTHING, {target_id}
+        return max(record["total"], 0), self._sum_key_interval(record["sum_key"]), {target_id}
+
+    def backfill_sum_buckets(self) -> None:
+        """Привязывает к корзинам SumBucket изображения, добавленные до их появления"""
+        with self.driver.session() as session:
+            session.run(
+                BACKFILL_SUM_BUCKETS_QUERY, resolutions=list(self.BUCKET_RESOLUTIONS)
+            ).consume()
+
+    def find_by_sum_range(
+        self,
+        target_sum: float,
+        tolerance: float = 10,
+        exclude_id: str | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Ищет изображения с суммой в пределах target_sum ± tolerance (по индексу Image.sum)"""
+        return self._cached(
+            ("sum_range", target_sum, tolerance, exclude_id, limit),
+            self._query_sum_range,
+            target_sum, tolerance, exclude_id, limit,
+        )
+
+    @timed("neo4j.find_by_sum_range")
+    def _query_sum_range(
+        self, target_sum: float, tolerance: float, exclude_id: str | None, limit: int
+    ) -> tuple[list[dict], tuple[float, float], set[str]]:
+        with self.driver.session() as session:
+            result = session.run(
+                FIND_BY_SUM_RANGE_QUERY,
+                min_sum=target_sum - tolerance,
+                max_sum=target_sum + tolerance,
+                target_sum=target_sum,
+                exclude_id=exclude_id,
                 limit=limit,
             )
-            return [r.data() for r in result]
-
-    # def find_by_sum_range(self, target_sum: float, tolerance=10):
-    #     result = session.run(
-    #         """
-    #         MATCH (img:Image)
-    #         WHERE img.sum >= $min_sum AND img.sum <= $max_sum
-    #         RETURN img.id AS id, img.sum AS sum, img.image_path AS image_path,
-    #             abs(img.sum - $target_sum) AS difference
-    #         ORDER BY difference
-    #         """,
-    #         min_sum=target_sum - tolerance,
-    #         max_sum=target_sum + tolerance,
-    #         target_sum=target_sum,
-    #     )
-
-    #     images = []
-    #     for record in result:
-    #         images.append(
-    #             {
-    #                 "id": record["id"],
-    #                 "sum": record["sum"],
-    #                 "image_path": record["image_path"],
-    #                 "difference": record["difference"],
-    #             }
-    #         )
-    #     return images
-
-    # def close(self):
-    #     self.driver.close()
+            images = [r.data() for r in result]
+        interval = (target_sum - tolerance, target_sum + tolerance)
+        return images, interval, {image["id"] for image in images}
+
+    def find_nearest_by_sum(
+        self, target_sum: float, k: int = 10, exclude_id: str | None = None
+    ) -> list[dict]:
+        """Возвращает k изображений с ближайшими к target_sum суммами.
+
+        Поиск начинается с корзины SumBucket самого мелкого разрешения и ее соседей;
+        если в окне нет k изображений на расстоянии не больше разрешения корзины
+        (только тогда ответ гарантированно точный), окно расширяется до корзин
+        следующего разрешения. В крайнем случае выполняются два запроса по индексу
+        Image.sum - выше и ниже target_sum.
+        """
+        return self._cached(
+            ("nearest_by_sum", target_sum, k, exclude_id),
+            self._query_nearest_by_sum,
+            target_sum, k, exclude_id,
+        )
+
+    @timed("neo4j.find_nearest_by_sum")
+    def _query_nearest_by_sum(
+        self, target_sum: float, k: int, exclude_id: str | None
+    ) -> tuple[list[dict], tuple[float, float], set[str]]:
+        with self.driver.session() as session:
+            for resolution in self.BUCKET_RESOLUTIONS:
+                bucket = self._bucket_value(target_sum, resolution)
+                result = session.run(
+                    FIND_IN_BUCKETS_QUERY,
+                    resolution=resolution,
+                    bucket_values=[bucket - 1, bucket, bucket + 1],
+                    target_sum=target_sum,
+                    exclude_id=exclude_id,
+                    limit=k,
+                )
+                images = [r.data() for r in result]
+                if len(images) == k and images[-1]["difference"] <= resolution:
+                    break
+            else:
+                params = {"target_sum": target_sum, "exclude_id": exclude_id, "limit": k}
+                images = [r.data() for r in session.run(FIND_NEAREST_ABOVE_QUERY, **params)]
+                images += [r.data() for r in session.run(FIND_NEAREST_BELOW_QUERY, **params)]
+                images.sort(key=lambda image: image["difference"])
+                images = images[:k]
+
+        # Ответ изменит только узел не дальше самого дальнего найденного;
+        # если найдено меньше k, подойдет узел с любой суммой
+        if len(images) < k:
+            interval = EVERYTHING
+        else:
+            radius = images[-1]["difference"]
+            interval = (target_sum - radius, target_sum + radius)
+        return images, interval, {image["id"] for image in images}
+
+    @staticmethod
+    def _sum_key_interval(sum_key: int) -> tuple[float, float]:
+        """Суммы, которые округляются до Sum.value = sum_key (с запасом на границах)"""
+        return sum_key - 0.5, sum_key + 0.5
+
+    def _cached(self, key: tuple, query, *args):
+        """Ответ из кэша или query(*args) -> (ответ, интервал сумм, id изображений)"""
+        if self.cache is None:
+            return query(*args)[0]
+
+        value = self.cache.get(key)
+        if value is MISSING:
+            generation = self.cache.generation
+            value, interval, ids = query(*args)
+            self.cache.put(key, value, interval, ids, generation)
+        return copy.copy(value)
+
+    def _update_fallback_index(self, rows: list[dict]) -> None:
+        rows = [row for row in rows if row.get("embedding") is not None]
+        if not rows:
+            return
+        # Пока индекс строится в другом потоке, ждем его: строки, записанные
+        # после начала LOAD_EMBEDDINGS_QUERY, могли не попасть в выборку
+        with self._fallback_lock:
+            index = self._fallback_index
+        if index is not None:
+            index.add([row["id"] for row in rows], [row["embedding"] for row in rows])
+
+    def _get_fallback_index(self) -> VectorIndex:
+        """Строит ANN-индекс в памяти по эмбеддингам из графа (один раз)"""
+        index = self._fallback_index
+        if index is not None:
+            return index
+        with self._fallback_lock:
+            if self._fallback_index is None:
+                index = VectorIndex(EMBEDDING_DIM)
+                with timed("neo4j.load_embeddings"), self.driver.session() as session:
+                    for batch in batched(session.run(LOAD_EMBEDDINGS_QUERY), self.batch_size):
+                        index.add([r["id"] for r in batch], [r["embedding"] for r in batch])
+                self._fallback_index = index
+            return self._fallback_index
+
+    def iter_image_paths(self) -> Iterator[str]:
+        """Пути к файлам всех узлов Image (результат читается потоком)"""
+        with timed("neo4j.image_paths"), self.driver.session() as session:
+            for record in session.run(IMAGE_PATHS_QUERY):
+                yield record["path"]
+
+    @timed("neo4j.set_embeddings")
+    def set_embeddings(self, embeddings: dict[str, list[float]]) -> int:
+        """Записывает эмбеддинги узлам Image по пути к файлу; возвращает число узлов"""
+        updated = 0
+        with self.driver.session() as session:
+            for batch in batched(embeddings.items(), self.batch_size):
+                vectors = {path: [float(x) for x in vector] for path, vector in batch}
+                rows = [{"path": path, "embedding": vector} for path, vector in vectors.items()]
+                records = session.execute_write(
+                    lambda tx: [r.data() for r in tx.run(SET_EMBEDDINGS_QUERY, rows=rows)]
+                )
+                self._update_fallback_index(
+                    [{"id": r["id"], "embedding": vectors[r["path"]]} for r in records]
+                )
+                updated += len(records)
+        return updated
+
+    @timed("neo4j.find_similar_by_embedding")
+    def find_similar_by_embedding(
+        self, embedding: list[float], k: int = 10, exclude_id: str | None = None
+    ) -> list[dict]:
+        """Ищет k изображений, наиболее похожих по содержимому.
+
+        Использует векторный индекс Neo4j, а если сервер его не поддерживает -
+        ANN-индекс в памяти процесса (VectorIndex).
+        """
+        if self.vector_search_supported is None:
+            self.vector_search_supported = ensure_vector_index(self.driver, EMBEDDING_DIM)
+
+        embedding = [float(x) for x in embedding]
+        if self.vector_search_supported:
+            with self.driver.session() as session:
+                result = session.run(
+                    FIND_BY_EMBEDDING_QUERY,
+                    k=k + (exclude_id is not None),
+                    embedding=embedding,
+                    exclude_id=exclude_id,
+                )
+                return [r.data() for r in result][:k]
+
+        matches = [
+            (image_id, score)
+            for image_id, score in self._get_fallback_index().search(embedding, k + 1)
+            if image_id != exclude_id
+        ][:k]
+        if not matches:
+            return []
+
+        with self.driver.session() as session:
+            result = session.run(FIND_BY_IDS_QUERY, ids=[image_id for image_id, _ in matches])
+            images = {r["id"]: r.data() for r in result}
+        return [
+            {**images[image_id], "score": score}
+            for image_id, score in matches
+            if image_id in images
+        ]
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable
+from src.config.config import DATA_DIR
+from src.services.metrics import count
+
+
+class ImageCache:
+    """Кэш сгенерированных изображений с адресацией по содержимому запроса.
+
+    Ключ - sha256 от (model, prompt, image_config), значение - путь к PNG.
+    Индекс хранится в SQLite (режим WAL), поэтому кэш можно разделять между
+    потоками и процессами. Внутри процесса одновременные запросы одного ключа
+    выполняют генерацию только один раз.
+
+    Вытеснение (max_entries, max_age) удаляет записи индекса, но не файлы:
+    на изображения могут ссылаться узлы в Neo4j. Файлы удаляются только
+    при delete_files=True.
+    """
+    DEFAULT_MAX_ENTRIES = 10_000
+    DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+    def __init__(
+        self,
+        db_path: Path | None = None,
+        max_entries: int | None = None,
+        max_age: float | None = None,
+        delete_files: bool = False,
+    ):
+        self.db_path = Path(db_path or DATA_DIR / "image_cache.sqlite3")
+        self.max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self.max_age = max_age or self.DEFAULT_MAX_AGE
+        self.delete_files = delete_files
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        # key -> [блокировка, число потоков, которые ее держат или ждут]
+        self._key_locks: dict[str, list] = {}
+        self._key_locks_guard = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS images (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(model: str, prompt: str, image_config: dict) -> str:
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "image_config": image_config},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _count(self, hit: bool) -> None:
+        count("graphdb_image_cache_total", result="hit" if hit else "miss")
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _lookup(self, key: str) -> str | None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT path, created FROM images WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            path, created = row
+            if now - created > self.max_age or not os.path.exists(path):
+                conn.execute("DELETE FROM images WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE images SET last_used = ? WHERE key = ?", (now, key))
+            return path
+
+    def get(self, key: str) -> str | None:
+        """Возвращает путь к изображению из кэша или None"""
+        path = self._lookup(key)
+        self._count(path is not None)
+        return path
+
+    def put(self, key: str, path: str) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO images (key, path, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, path, now, now),
+            )
+        self.evict()
+
+    def _acquire_key_lock(self, key: str) -> None:
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def _release_key_lock(self, key: str) -> None:
+        with self._key_locks_guard:
+            entry = self._key_locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._key_locks[key]
+        entry[0].release()
+
+    def get_or_create(self, key: str, create: Callable[[], str]) -> str:
+        """Возвращает изображение из кэша или создает его через create() и кэширует"""
+        path = self._lookup(key)
+        if path is not None:
+            self._count(True)
+            return path
+
+        self._acquire_key_lock(key)
+        try:
+            path = self._lookup(key)
+            self._count(path is not None)
+            if path is None:
+                path = create()
+                self.put(key, path)
+        finally:
+            self._release_key_lock(key)
+        return path
+
+    def evict(self) -> int:
+        """Удаляет устаревшие записи и записи сверх max_entries (LRU); возвращает их число"""
+        with closing(self._connect()) as conn, conn:
+            expired = conn.execute(
+                "SELECT key, path FROM images WHERE created < ?", (time.time() - self.max_age,)
+            ).fetchall()
+            overflow = conn.execute(
+                "SELECT key, path FROM images ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+                (self.max_entries,),
+            ).fetchall()
+            evicted = dict(expired + overflow)
+            conn.executemany("DELETE FROM images WHERE key = ?", [(k,) for k in evicted])
+
+        if self.delete_files:
+            for path in evicted.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return len(evicted)
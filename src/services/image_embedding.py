@@ -0,0 +1,110 @@
+"""Локальные эмбеддинги изображений (CPU, без нейросетей).
+
+Вектор состоит из трех частей: уменьшенное до 8x8 изображение в оттенках
+серого, разностный перцептивный хэш (dHash 8x8) и цветовая гистограмма 4x4x4.
+Итоговый вектор нормирован по L2, поэтому сходство считается скалярным
+произведением (косинусная мера).
+
+Пересчет для каталога: python -m src.services.image_embedding [каталог] [--workers N] [--push]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable
+import numpy as np
+from src.config.config import DATA_DIR, IMAGES_DIR
+from src.services.metrics import timed
+
+EMBEDDING_DIM = 192
+THUMB_SIZE = 32
+HIST_BINS = 4
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@timed("image.embedding")
+def compute_embedding(path: str | os.PathLike) -> np.ndarray:
+    """Вычисляет эмбеддинг изображения размерности EMBEDDING_DIM (float32)"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        small = np.asarray(
+            image.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.Resampling.BOX),
+            dtype=np.float32,
+        )
+
+    gray = small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    pixels = gray.reshape(8, THUMB_SIZE // 8, 8, THUMB_SIZE // 8).mean(axis=(1, 3))
+    pixels = _normalize(pixels.ravel() - pixels.mean())
+
+    columns = np.linspace(0, THUMB_SIZE - 1, 9).astype(int)
+    rows = np.linspace(0, THUMB_SIZE - 1, 8).astype(int)
+    sampled = gray[np.ix_(rows, columns)]
+    dhash = np.where(sampled[:, 1:] > sampled[:, :-1], 1.0, -1.0).ravel() / 8.0
+
+    quantized = (small // (256 / HIST_BINS)).astype(np.int64).reshape(-1, 3)
+    codes = (quantized[:, 0] * HIST_BINS + quantized[:, 1]) * HIST_BINS + quantized[:, 2]
+    histogram = np.bincount(codes, minlength=HIST_BINS**3).astype(np.float32)
+    histogram = _normalize(np.sqrt(histogram))
+
+    return _normalize(np.concatenate([pixels, dhash, histogram])).astype(np.float32)
+
+
+def compute_embeddings(
+    paths: Iterable[str | os.PathLike],
+    max_workers: int | None = None,
+    chunksize: int = 16,
+) -> dict[str, np.ndarray]:
+    """Считает эмбеддинги для набора файлов параллельно в пуле процессов"""
+    paths = [str(path) for path in paths]
+    if len(paths) <= 1 or max_workers == 1:
+        return {path: compute_embedding(path) for path in paths}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        vectors = pool.map(compute_embedding, paths, chunksize=chunksize)
+        return dict(zip(paths, vectors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчет эмбеддингов изображений")
+    parser.add_argument("directory", nargs="?", default=str(IMAGES_DIR))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=str(DATA_DIR / "embeddings.npz"))
+    parser.add_argument("--push", action="store_true", help="записать эмбеддинги в Neo4j")
+    args = parser.parse_args()
+
+    from src.services.image_store import iter_image_files
+
+    paths = sorted(entry.path for entry in iter_image_files(args.directory))
+    start = time.perf_counter()
+    embeddings = compute_embeddings(paths, max_workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Эмбеддинги: {len(embeddings)} изображений за {elapsed:.2f} с")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        args.output,
+        paths=np.array(list(embeddings), dtype=str),
+        vectors=np.stack(list(embeddings.values())) if embeddings else np.empty((0, EMBEDDING_DIM)),
+    )
+    print(f"Сохранено в {args.output}")
+
+    if args.push and embeddings:
+        from src.services.graph_service import GraphDBService
+
+        service = GraphDBService()
+        try:
+            updated = service.set_embeddings(embeddings)
+            print(f"Обновлено узлов в Neo4j: {updated}")
+        finally:
+            service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,186 @@
 import requests
-import base64
-import os
-from dotenv import load_dotenv
-import uuid
-from src.config.config import IMAGES_DIR
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable
+from src.config.config import get_settings
+from src.services.image_cache import ImageCache
+from src.services.image_store import ImageStore
+from src.services.image_stream import write_image_from_response
+from src.services.metrics import BYTES_BUCKETS, count, observe, timed
+from src.services.request_scheduler import RequestScheduler, check_status
+
+
+@dataclass
+class ImageResult:
+    """Результат генерации одного изображения в пакете"""
+    number: str
+    image_path: str | None = None
+    error: Exception | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class ImageGen:
-    def __init__(self):
-        load_dotenv()
-        
+    DEFAULT_URL = "https://openrouter.ai/api/v1/chat/completions"
+    DEFAULT_MODEL = "google/gemini-2.5-flash-image"
+    DEFAULT_IMAGE_CONFIG = {"aspect_ratio": "1:1", "image_size": "1K"}
+    DEFAULT_TIMEOUT = (10, 120)
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+    # Ошибки, после которых запрос повторяется (кроме 429 и 5xx)
+    RETRY_ERRORS = (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    )
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        url: str | None = None,
+        timeout: float | tuple[float, float] | None = None,
+        max_workers: int | None = None,
+        cache: ImageCache | None = None,
+        store: ImageStore | None = None,
+        scheduler: RequestScheduler | None = None,
+    ):
+        """timeout - (connect, read) в секундах, max_workers - число параллельных запросов,
+        cache - кэш уже сгенерированных изображений (проверяется до обращения к API),
+        store - куда сохранять файлы (по умолчанию ImageStore в images/),
+        scheduler - лимиты частоты, повторы и срок запроса (по умолчанию
+        RequestScheduler с max_workers одновременных запросов)"""
         self.image_path = None
-        
-        self.api_key = os.getenv("OPENROUTER_API_KEY")
+
+        self.api_key = api_key or get_settings().openrouter_api_key
         if not self.api_key:
             raise ValueError(
                 "OPENROUTER_API_KEY не найден. "
                 "Установите переменную окружения OPENROUTER_API_KEY в файле .env"
             )
-        
-        self.url = "https://openrouter.ai/api/v1/chat/completions"
+
+        self.url = url or self.DEFAULT_URL
+        self.model = self.DEFAULT_MODEL
+        self.image_config = dict(self.DEFAULT_IMAGE_CONFIG)
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.max_workers = max_workers or self.DEFAULT_MAX_WORKERS
+        self.cache = cache
+        self.store = store or ImageStore()
+        self.scheduler = scheduler or RequestScheduler(max_concurrency=self.max_workers)
+        self.chunk_size = self.DEFAULT_CHUNK_SIZE
+        self.peak_buffer_bytes = 0
+        self._stats_lock = threading.Lock()
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
 
-    def create(self, number: str):
-        """Создает изображение по промпту"""
-        
-        prompt = f"Generate an image which would contain number {number}."
-        
-        data = {
-            "model": "google/gemini-2.5-flash-image",
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        """Закрывает пул HTTP-соединений"""
+        self.session.close()
+
+    @staticmethod
+    def _build_prompt(number: str) -> str:
+        return f"Generate an image which would contain number {number}."
+
+    def _build_payload(self, prompt: str) -> dict:
+        return {
+            "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
             "modalities": ["image", "text"],
-            "image_config": {"aspect_ratio": "1:1", "image_size": "1K"},
+            "image_config": self.image_config,
         }
 
-        try:
-            response = requests.post(self.url, headers=self.headers, json=data)
-            response.raise_for_status()
+    def generate(self, number: str) -> str:
+        """Генерирует изображение и возвращает путь к файлу; при ошибке бросает исключение.
 
-            result = response.json()
-            image_url = result["choices"][0]["message"]["images"][0]["image_url"]["url"]
-            image_bytes = base64.b64decode(image_url.split(",")[1])
+        Метод не меняет состояние объекта и может вызываться из нескольких потоков.
+        """
+        prompt = self._build_prompt(number)
+        if self.cache is None:
+            return self._request_image(prompt, number)
 
-            filepath = str(IMAGES_DIR / f"{uuid.uuid4().hex}.png")
+        key = ImageCache.make_key(self.model, prompt, self.image_config)
+        return self.cache.get_or_create(key, lambda: self._request_image(prompt, number))
 
-            with open(filepath, "wb") as f:
-                f.write(image_bytes)
+    def _request_image(self, prompt: str, number: str) -> str:
+        """Запрашивает изображение через планировщик: 429, 5xx и ошибки соединения
+        повторяются, пока не истечет срок запроса"""
+        payload = self._build_payload(prompt)
+        return self.scheduler.call(
+            lambda remaining: self._attempt(payload, number, remaining), retry_on=self.RETRY_ERRORS
+        )
 
-            print(f"✅ {filepath}")
-            self.image_path = filepath
+    def _timeout_within(self, remaining: float) -> float | tuple[float, float]:
+        """Тайм-ауты попытки, не выходящие за срок запроса"""
+        if isinstance(self.timeout, tuple):
+            return tuple(min(part, remaining) for part in self.timeout)
+        return min(self.timeout, remaining)
 
+    def _attempt(self, payload: dict, number: str, remaining: float) -> str:
+        """Одна попытка; ответ читается потоком и декодируется порциями
+        во временный файл, который затем переносится в хранилище"""
+        filepath = self.store.incoming_path()
+
+        with timed("openrouter.response_headers"):
+            response = self.session.post(
+                self.url, json=payload, timeout=self._timeout_within(remaining), stream=True
+            )
+        with response:
+            count("graphdb_openrouter_responses_total", status=response.status_code)
+            self.scheduler.observe_limits(response.headers)
+            check_status(response)
+            response.raise_for_status()
+            with timed("openrouter.download_decode"):
+                image = write_image_from_response(response.iter_content(self.chunk_size), filepath)
+        observe("graphdb_image_bytes", image.size, BYTES_BUCKETS)
+
+        with self._stats_lock:
+            self.peak_buffer_bytes = max(self.peak_buffer_bytes, image.peak_buffer_bytes)
+        return self.store.add(image.path, image.sha256, number=number, model=self.model)
+
+    def create(self, number: str):
+        """Создает изображение по промпту и возвращает путь; при ошибке бросает
+        исключение, а get_image_path после нее не вернет прошлый путь"""
+        self.image_path = None
+        self.image_path = self.generate(number)
+        return self.image_path
+
+    def _generate_result(self, number: str) -> ImageResult:
+        start = time.perf_counter()
+        try:
+            return ImageResult(number, image_path=self.generate(number),
+                               seconds=time.perf_counter() - start)
         except Exception as e:
-            print(f"❌ Ошибка: {e}")
-            return None
-        
+            return ImageResult(number, error=e, seconds=time.perf_counter() - start)
+
+    def create_many(
+        self, numbers: Iterable[str], max_workers: int | None = None
+    ) -> list[ImageResult]:
+        """Генерирует изображения для нескольких чисел параллельно.
+
+        Возвращает результаты в порядке входных чисел; ошибка одного запроса
+        не прерывает остальные и сохраняется в ImageResult.error.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+            return list(pool.map(self._generate_result, [str(n) for n in numbers]))
+
     def get_image_path(self):
         """Возвращает путь к сгенерированному изображению"""
         if self.image_path is None:
             raise ValueError("Изображение не сгенерировано")
-        return self.image_path  
+        return self.image_path
 
 
 # # Использование
@@ -0,0 +1,329 @@
+"""Хранилище сгенерированных изображений с адресацией по содержимому.
+
+Файл сохраняется как images/ab/cd/<sha256>.png: два уровня подкаталогов
+держат каталоги небольшими даже при сотнях тысяч файлов, а одинаковые байты
+хранятся один раз. Индекс SQLite (data/image_store.sqlite3) связывает хэш с
+путем, числом и моделью, а узлы Image - с файлом (несколько узлов могут
+ссылаться на один файл, например при попадании в ImageCache). Миниатюры для
+интерфейса создаются по запросу в images/thumbs/ и кэшируются на диске.
+
+Сборка мусора сверяет хранилище с Image.image_path в Neo4j и с журналом
+отложенной записи: файлы, на которые никто не ссылается и которые старше
+grace, удаляются вместе с миниатюрами и записями индекса.
+
+    python -m src.services.image_store stats
+    python -m src.services.image_store gc [--dry-run] [--grace-hours 24]
+"""
+import argparse
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+from src.config.config import DATA_DIR, IMAGES_DIR, PROJECT_ROOT
+from src.services.metrics import count, timed
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+THUMBS_DIR_NAME = "thumbs"
+INCOMING_DIR_NAME = ".incoming"
+
+
+def iter_image_files(root: Path | str = IMAGES_DIR) -> Iterable[os.DirEntry]:
+    """Все PNG хранилища, включая файлы старого плоского формата в корне;
+    миниатюры и недописанные файлы (.incoming, .tmp-*) пропускаются"""
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in (THUMBS_DIR_NAME, INCOMING_DIR_NAME):
+                        stack.append(entry.path)
+                elif entry.name.endswith(".png") and not entry.name.startswith(".tmp-"):
+                    yield entry
+
+
+@dataclass
+class GcReport:
+    scanned: int = 0
+    referenced: int = 0
+    deleted: int = 0
+    freed_bytes: int = 0
+    missing: int = 0
+    dropped_rows: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"файлов: {self.scanned}, используются: {self.referenced}, "
+            f"удалено: {self.deleted} ({self.freed_bytes / 1024 / 1024:.1f} МБ), "
+            f"ссылок на отсутствующие файлы: {self.missing}, "
+            f"удалено записей индекса: {self.dropped_rows}"
+        )
+
+
+def normalize_path(path: str | os.PathLike) -> str:
+    """Абсолютный путь без символических ссылок; относительные пути - от корня проекта"""
+    path = Path(path)
+    if not path.is_absolute():
+        path = PROJECT_ROOT / path
+    return os.path.realpath(path)
+
+
+class ImageStore:
+    DEFAULT_THUMBNAIL_SIZE = 128
+    DEFAULT_GRACE = 24 * 3600
+
+    def __init__(self, root: Path | None = None, db_path: Path | None = None):
+        self.root = Path(root or IMAGES_DIR)
+        self.db_path = Path(db_path or DATA_DIR / "image_store.sqlite3")
+        self.thumbs_dir = self.root / THUMBS_DIR_NAME
+        self.incoming_dir = self.root / INCOMING_DIR_NAME
+
+        self.incoming_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    hash TEXT PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    number TEXT,
+                    model TEXT
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS nodes (
+                    node_id TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    sum REAL,
+                    created REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS nodes_hash ON nodes (hash)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def path_for(self, digest: str, directory: Path | None = None) -> Path:
+        """Путь файла в шардированном каталоге: <directory>/ab/cd/<digest>.png"""
+        shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+        return Path(directory or self.root, *shards, f"{digest}.png")
+
+    def incoming_path(self) -> str:
+        """Временный путь для записи нового изображения (затем передается в add)"""
+        return str(self.incoming_dir / f"{uuid.uuid4().hex}.png")
+
+    @timed("image_store.add")
+    def add(
+        self,
+        tmp_path: str,
+        digest: str,
+        number: str | None = None,
+        model: str | None = None,
+    ) -> str:
+        """Переносит записанный файл в хранилище и возвращает его постоянный путь.
+
+        digest - sha256 содержимого; если такие байты уже есть, временный файл
+        удаляется и возвращается путь существующего.
+        """
+        path = self.path_for(digest)
+        size = os.path.getsize(tmp_path)
+        if path.exists():
+            os.remove(tmp_path)
+            # Повторно выданный файл снова "свежий" и защищен от сборки мусора
+            os.utime(path)
+            count("graphdb_image_store_dedup_total")
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO files (hash, path, size, created, number, model) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, normalize_path(path), size, time.time(), number, model),
+            )
+        return str(path)
+
+    def attach(self, path: str, node_id: str, total: float | None = None) -> bool:
+        """Связывает узел Image с файлом хранилища; False - файл не из хранилища"""
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT hash FROM files WHERE path = ?", (normalize_path(path),)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO nodes (node_id, hash, sum, created) VALUES (?, ?, ?, ?)",
+                (node_id, row[0], total, time.time()),
+            )
+        return True
+
+    def info(self, path: str) -> dict | None:
+        """Метаданные файла: hash, size, created, number, model и id связанных узлов"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT hash, size, created, number, model FROM files WHERE path = ?",
+                (normalize_path(path),),
+            ).fetchone()
+            if row is None:
+                return None
+            nodes = [r[0] for r in conn.execute("SELECT node_id FROM nodes WHERE hash = ?", (row[0],))]
+        return dict(zip(("hash", "size", "created", "number", "model"), row), node_ids=nodes)
+
+    @timed("image_store.thumbnail")
+    def thumbnail(self, path: str, size: int | None = None) -> str:
+        """Путь к миниатюре изображения (PNG не больше size x size); создается один раз"""
+        from PIL import Image
+
+        size = size or self.DEFAULT_THUMBNAIL_SIZE
+        thumb = self.path_for(self._thumbnail_name(path), self.thumbs_dir / str(size))
+        if thumb.exists():
+            return str(thumb)
+
+        thumb.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = thumb.with_name(f".tmp-{uuid.uuid4().hex}.png")
+        with Image.open(path) as image:
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            image.save(tmp_path, "PNG", optimize=True)
+        os.replace(tmp_path, thumb)
+        return str(thumb)
+
+    def _thumbnail_name(self, path: str) -> str:
+        """Хэш файла хранилища; для файлов вне хранилища - uuid5 от пути"""
+        path = normalize_path(path)
+        stem = Path(path).stem
+        if len(stem) == 64 and normalize_path(self.path_for(stem)) == path:
+            return stem
+        return uuid.uuid5(uuid.NAMESPACE_URL, path).hex
+
+    def _iter_files(self) -> Iterable[os.DirEntry]:
+        return iter_image_files(self.root)
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            files, size = conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM files").fetchone()
+            nodes = conn.execute("SELECT count(*) FROM nodes").fetchone()[0]
+        return {"files": files, "bytes": size, "nodes": nodes}
+
+    @timed("image_store.gc")
+    def gc(
+        self,
+        referenced: Iterable[str],
+        grace: float | None = None,
+        dry_run: bool = False,
+    ) -> GcReport:
+        """Удаляет файлы, на которые нет ссылок в referenced (пути из графа и журнала),
+        если они не моложе grace секунд: свежий файл может еще ждать записи узла"""
+        grace = self.DEFAULT_GRACE if grace is None else grace
+        referenced = {normalize_path(path) for path in referenced if path}
+        deadline = time.time() - grace
+        report = GcReport()
+        present = set()
+        orphans = []
+
+        for entry in self._iter_files():
+            report.scanned += 1
+            path = normalize_path(entry.path)
+            present.add(path)
+            if path in referenced:
+                report.referenced += 1
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < deadline:
+                orphans.append((path, stat.st_size))
+
+        report.missing = len(referenced - present)
+        # Файлы, оставшиеся в .incoming после прерванной загрузки
+        for entry in os.scandir(self.incoming_dir):
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                orphans.append((normalize_path(entry.path), entry.stat().st_size))
+
+        for path, size in orphans:
+            report.deleted += 1
+            report.freed_bytes += size
+            if dry_run:
+                continue
+            for file in (path, *self._thumbnails(path)):
+                self._remove(file)
+
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT hash, path FROM files").fetchall()
+            deleted = {path for path, _ in orphans}
+            stale = [digest for digest, path in rows if path in deleted or path not in present]
+            report.dropped_rows = len(stale)
+            if not dry_run:
+                conn.executemany("DELETE FROM files WHERE hash = ?", [(d,) for d in stale])
+                conn.executemany("DELETE FROM nodes WHERE hash = ?", [(d,) for d in stale])
+
+        count("graphdb_image_store_gc_deleted_total", 0 if dry_run else report.deleted)
+        return report
+
+    def _remove(self, path: str) -> None:
+        """Удаляет файл и опустевшие каталоги шардов над ним"""
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        parent = Path(path).parent
+        for _ in range(SHARD_LEVELS):
+            try:
+                parent.rmdir()
+            except OSError:
+                return
+            parent = parent.parent
+
+    def _thumbnails(self, path: str) -> list[str]:
+        if not self.thumbs_dir.exists():
+            return []
+        name = self._thumbnail_name(path)
+        return [
+            str(self.path_for(name, size_dir))
+            for size_dir in self.thumbs_dir.iterdir()
+            if size_dir.is_dir()
+        ]
+
+
+def _referenced_paths() -> set[str]:
+    """Пути изображений из Neo4j и из еще не записанных узлов журнала"""
+    from src.services.graph_outbox import GraphOutbox
+    from src.services.graph_service import GraphDBService
+
+    service = GraphDBService(ensure_schema=False)
+    try:
+        paths = set(service.iter_image_paths())
+    finally:
+        service.close()
+    return paths | GraphOutbox.pending_paths()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Хранилище изображений: статистика и сборка мусора")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="число файлов, объем и число связанных узлов")
+    gc_parser = commands.add_parser("gc", help="удалить файлы, на которые нет ссылок в Neo4j")
+    gc_parser.add_argument("--dry-run", action="store_true", help="только показать, что будет удалено")
+    gc_parser.add_argument("--grace-hours", type=float, default=ImageStore.DEFAULT_GRACE / 3600)
+    args = parser.parse_args()
+
+    store = ImageStore()
+    if args.command == "stats":
+        stats = store.stats()
+        print(f"файлов: {stats['files']}, объем: {stats['bytes'] / 1024 / 1024:.1f} МБ, узлов: {stats['nodes']}")
+        return
+
+    report = store.gc(_referenced_paths(), grace=args.grace_hours * 3600, dry_run=args.dry_run)
+    print(("Будет удалено - " if args.dry_run else "") + str(report))
+
+
+if __name__ == "__main__":
+    main()
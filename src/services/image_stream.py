@@ -0,0 +1,139 @@
+"""Потоковое извлечение изображения из JSON-ответа OpenRouter.
+
+Ответ не разбирается целиком: во входном потоке ищется data URL
+(data:image/...;base64,), и base64-данные декодируются порциями прямо во
+временный файл, который после fsync атомарно переименовывается в итоговый.
+В памяти одновременно находится не больше одной порции ответа; sha256
+содержимого считается по ходу записи (для ImageStore).
+"""
+import binascii
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+DATA_URL_PREFIX = b"data:image"
+BASE64_MARKER = b";base64,"
+ERROR_HEAD_BYTES = 512
+
+
+@dataclass
+class StreamedImage:
+    path: str
+    size: int
+    peak_buffer_bytes: int
+    sha256: str
+
+
+class _Base64Writer:
+    """Декодирует base64 порциями и пишет байты в файл, проверяя заголовок PNG"""
+
+    def __init__(self, file):
+        self.file = file
+        self.carry = b""
+        self.header = b""
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def feed(self, text: bytes) -> int:
+        """Возвращает размер промежуточного буфера для учета пиковой памяти"""
+        text = self.carry + text
+        if text.endswith(b"\\"):
+            text, self.carry = text[:-1], b"\\"
+        else:
+            self.carry = b""
+        text = text.replace(b"\\/", b"/")
+
+        usable = len(text) - len(text) % 4
+        self.carry = text[usable:] + self.carry
+        decoded = binascii.a2b_base64(text[:usable], strict_mode=True) if usable else b""
+        self._check_header(decoded)
+        self.file.write(decoded)
+        self.digest.update(decoded)
+        self.size += len(decoded)
+        return len(text) + len(decoded)
+
+    def _check_header(self, decoded: bytes) -> None:
+        if len(self.header) >= 16:
+            return
+        self.header += decoded[: 16 - len(self.header)]
+        if not PNG_SIGNATURE.startswith(self.header[:8]) or (
+            len(self.header) == 16 and self.header[12:16] != b"IHDR"
+        ):
+            raise ValueError("Ответ содержит не PNG-изображение")
+
+    def finish(self) -> None:
+        if self.carry.strip(b"="):
+            self.feed(b"=" * (-len(self.carry) % 4))
+        if len(self.header) < 16:
+            raise ValueError("Изображение в ответе обрезано")
+
+
+def write_image_from_response(
+    chunks: Iterable[bytes], target_path: str | os.PathLike
+) -> StreamedImage:
+    """Находит в потоке JSON первый data URL и сохраняет декодированный PNG в target_path"""
+    target_path = os.fspath(target_path)
+    directory = os.path.dirname(target_path) or "."
+    chunks = iter(chunks)
+
+    head = b""
+    buffer = b""
+    peak = 0
+    payload = None
+    for chunk in chunks:
+        buffer += chunk
+        peak = max(peak, len(buffer))
+        if len(head) < ERROR_HEAD_BYTES:
+            head += chunk[: ERROR_HEAD_BYTES - len(head)]
+
+        start = buffer.find(DATA_URL_PREFIX)
+        if start >= 0:
+            marker = buffer.find(BASE64_MARKER, start)
+            if marker >= 0:
+                payload = buffer[marker + len(BASE64_MARKER):]
+                break
+            buffer = buffer[start:]
+        else:
+            buffer = buffer[-len(DATA_URL_PREFIX):]
+
+    if payload is None:
+        raise ValueError(f"В ответе нет изображения: {head.decode('utf-8', 'replace')}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".png")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            writer = _Base64Writer(file)
+            closed = False
+            for piece in _chain_first(payload, chunks):
+                end = piece.find(b'"')
+                if end >= 0:
+                    piece, closed = piece[:end], True
+                peak = max(peak, writer.feed(piece))
+                if closed:
+                    break
+            if not closed:
+                raise ValueError("Изображение в ответе обрезано")
+            writer.finish()
+
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return StreamedImage(
+        path=target_path, size=writer.size, peak_buffer_bytes=peak, sha256=writer.digest.hexdigest()
+    )
+
+
+def _chain_first(first: bytes, rest: Iterable[bytes]) -> Iterable[bytes]:
+    if first:
+        yield first
+    yield from rest
@@ -0,0 +1,322 @@
+"""Метрики производительности: таймеры, счетчики, датчики и гистограммы.
+
+Включаются переменными окружения (или в .env, см. config.Settings):
+    GRAPHDB_METRICS=1            - собирать метрики
+    GRAPHDB_METRICS_FILE=path    - журнал событий JSON lines (по умолчанию data/metrics.jsonl)
+    GRAPHDB_METRICS_PROM=path    - снимок в текстовом формате Prometheus при выходе
+                                   (по умолчанию data/metrics.prom)
+    GRAPHDB_PROFILE=cprofile     - профиль cProfile для операций с profile=True
+    GRAPHDB_PROFILE=tracemalloc  - пиковая память для операций с profile=True
+
+Выключенные метрики стоят одну проверку флага на вызов: таймер не читает
+часы и ничего не пишет, а count()/observe() сразу выходят.
+
+    with timed("sheets.fetch_rows"):
+        ...
+
+    @timed("controller.load_from_excel", profile=True)
+    def load_from_excel(...): ...
+"""
+import atexit
+import bisect
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from src.config.config import DATA_DIR, get_settings
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(float(4**power * 1024) for power in range(1, 12))
+OPERATION_SECONDS = "graphdb_operation_seconds"
+OPERATION_ERRORS = "graphdb_operation_errors_total"
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Реестр метрик процесса; потокобезопасен"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        events_path: Path | None = None,
+        prometheus_path: Path | None = None,
+        profile: str | None = None,
+    ):
+        self.enabled = enabled
+        self.events_path = events_path
+        self.prometheus_path = prometheus_path
+        self.profile = profile
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.gauges: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._lock = threading.Lock()
+        self._events_file = None
+        self._profiling = threading.local()
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        settings = get_settings()
+        return cls(
+            enabled=settings.metrics_enabled,
+            events_path=settings.metrics_file,
+            prometheus_path=settings.metrics_prometheus_file,
+            profile=settings.profile,
+        )
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Текущее значение величины (например, глубины очереди)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(
+        self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels
+    ) -> None:
+        """Добавляет значение в гистограмму; buckets задаются при первом наблюдении серии"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def event(self, record: dict) -> None:
+        """Пишет событие в журнал JSON lines"""
+        if not self.enabled or self.events_path is None:
+            return
+        line = json.dumps({"ts": time.time(), **record}, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._events_file is None:
+                self.events_path.parent.mkdir(parents=True, exist_ok=True)
+                self._events_file = open(self.events_path, "a", encoding="utf-8")
+            self._events_file.write(line + "\n")
+
+    def to_prometheus(self) -> str:
+        """Снимок метрик в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, f'le=\"{bound:g}\"')} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, 'le=\"+Inf\"')} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path | None = None) -> Path | None:
+        path = Path(path) if path else self.prometheus_path
+        if path is None:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp_path, path)
+        return path
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._events_file is not None:
+                self._events_file.flush()
+
+    def close(self) -> None:
+        """Сбрасывает журнал и записывает снимок Prometheus (вызывается при выходе)"""
+        if not self.enabled:
+            return
+        self.write_prometheus()
+        with self._lock:
+            if self._events_file is not None:
+                self._events_file.close()
+                self._events_file = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+METRICS = Metrics.from_env()
+atexit.register(METRICS.close)
+
+
+class _Timer:
+    __slots__ = ("op", "profile", "labels", "_start", "_profiler", "_tracing")
+
+    def __init__(self, op: str, profile: bool, labels: dict):
+        self.op = op
+        self.profile = profile
+        self.labels = labels
+        self._start: float | None = None
+        self._profiler: cProfile.Profile | None = None
+        self._tracing = False
+
+    def __enter__(self):
+        if not METRICS.enabled:
+            return self
+        if self.profile and METRICS.profile:
+            self._start_profile()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is None:
+            return False
+        seconds = time.perf_counter() - self._start
+        record = {"op": self.op, "seconds": round(seconds, 6), **self.labels}
+        METRICS.observe(OPERATION_SECONDS, seconds, op=self.op)
+        if exc_type is not None:
+            METRICS.count(OPERATION_ERRORS, op=self.op, error=exc_type.__name__)
+            record["error"] = exc_type.__name__
+        if self._profiler is not None or self._tracing:
+            record.update(self._stop_profile())
+        METRICS.event(record)
+        return False
+
+    def _start_profile(self) -> None:
+        # Профилируется только внешняя операция: вложенные профили не поддерживаются
+        state = METRICS._profiling
+        if getattr(state, "active", False):
+            return
+        if METRICS.profile == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return
+            self._profiler = profiler
+        elif METRICS.profile == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        state.active = self._profiler is not None or self._tracing
+
+    def _stop_profile(self) -> dict:
+        METRICS._profiling.active = False
+        if self._profiler is not None:
+            self._profiler.disable()
+            directory = DATA_DIR / "profiles"
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{self.op}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+            self._profiler.dump_stats(path)
+            return {"profile": str(path)}
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        METRICS.observe("graphdb_operation_peak_bytes", peak, BYTES_BUCKETS, op=self.op)
+        return {"peak_bytes": peak}
+
+    def __call__(self, func):
+        op, profile, labels = self.op, self.profile, self.labels
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return func(*args, **kwargs)
+            with _Timer(op, profile, labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def timed(op: str, profile: bool = False, **labels):
+    """Таймер операции: контекстный менеджер или декоратор.
+
+    Время попадает в гистограмму graphdb_operation_seconds{op=...}, исключения -
+    в счетчик graphdb_operation_errors_total{op=..., error=...}, каждое
+    выполнение - в журнал событий. profile=True включает хук GRAPHDB_PROFILE.
+    """
+    return _Timer(op, profile, labels)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    METRICS.count(name, value, **labels)
+
+
+def gauge(name: str, value: float, **labels) -> None:
+    METRICS.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> None:
+    METRICS.observe(name, value, buckets, **labels)
+
+
+def main():
+    """python -m src.services.metrics [журнал] - сводка по журналу событий"""
+    import argparse
+    from collections import defaultdict
+
+    parser = argparse.ArgumentParser(description="Сводка по журналу метрик")
+    parser.add_argument("path", nargs="?", default=str(METRICS.events_path))
+    args = parser.parse_args()
+
+    durations: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    with open(args.path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            durations[record["op"]].append(record["seconds"])
+            errors[record["op"]] += "error" in record
+
+    print(f"{'операция':<40} {'вызовов':>8} {'всего, с':>10} {'p50, мс':>9} {'p95, мс':>9} {'ошибок':>7}")
+    for op, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        p50 = values[len(values) // 2] * 1000
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))] * 1000
+        print(f"{op:<40} {len(values):>8} {sum(values):>10.3f} {p50:>9.1f} {p95:>9.1f} {errors[op]:>7}")
+
+
+if __name__ == "__main__":
+    main()
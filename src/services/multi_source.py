@@ -0,0 +1,168 @@
+"""Загрузка одной таблицы из нескольких источников.
+
+Книги Excel (каталог, маска или список файлов) разбираются параллельно в пуле
+процессов: разбор упирается в CPU и GIL, поэтому потоки не ускоряют его.
+Листы Google Sheets загружаются одним batch-запросом (см.
+GoogleSheetsReader.read_worksheets). Результаты сливаются в одну
+отсортированную по дате таблицу, которая передается в TableAnalyzer.
+"""
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Iterable, Sequence
+import numpy as np
+from src.services.metrics import timed
+from src.services.table_data import TableData
+
+if TYPE_CHECKING:
+    from src.services.table_cache import TableCache
+    from src.services.table_reader import GoogleSheetsReader, ProgressCallback
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+DEDUPE_RULES = ("all", "first", "last")
+
+
+def expand_excel_paths(sources: Iterable[str]) -> list[str]:
+    """Каталоги, маски (glob) и пути к файлам -> список книг без повторов.
+
+    Файлы каталога и совпадения маски сортируются по имени, поэтому книги
+    вида 2024-01.xlsx, 2024-02.xlsx идут в хронологическом порядке.
+    """
+    paths: list[str] = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = [
+                os.path.join(source, name)
+                for name in os.listdir(source)
+                if name.lower().endswith(EXCEL_EXTENSIONS) and not name.startswith("~$")
+            ]
+        elif glob.has_magic(source):
+            matches = glob.glob(source)
+        else:
+            matches = [source]
+        paths.extend(sorted(matches))
+
+    paths = list(dict.fromkeys(os.path.abspath(path) for path in paths))
+    if not paths:
+        raise ValueError(f"Не найдено ни одного Excel-файла: {', '.join(sources)}")
+    return paths
+
+
+@timed("multi_source.merge")
+def merge_tables(tables: Sequence[TableData], dedupe: str = "all") -> TableData:
+    """Сливает таблицы в одну, отсортированную по дате.
+
+    Строки с нераспознанной датой отбрасываются. Если дата встречается в
+    нескольких источниках, dedupe определяет, чьи строки за эту дату оставить:
+    all - всех источников, first - первого по порядку, last - последнего
+    (например, когда более поздняя выгрузка исправляет предыдущую).
+    """
+    if dedupe not in DEDUPE_RULES:
+        raise ValueError(f"dedupe должен быть одним из: {', '.join(DEDUPE_RULES)}")
+    if not tables:
+        return TableData.empty_table()
+
+    valid = [table.date_valid for table in tables]
+    dates = np.concatenate([t.dates[mask] for t, mask in zip(tables, valid)])
+    values = np.concatenate([t.values[mask] for t, mask in zip(tables, valid)])
+    value_valid = np.concatenate([t.value_valid[mask] for t, mask in zip(tables, valid)])
+    source = np.repeat(np.arange(len(tables)), [int(mask.sum()) for mask in valid])
+
+    # Стабильная сортировка сохраняет порядок источников внутри одной даты
+    order = np.argsort(dates, kind="stable")
+    dates, values, value_valid, source = dates[order], values[order], value_valid[order], source[order]
+
+    if dedupe != "all" and len(dates):
+        starts = np.flatnonzero(np.concatenate(([True], dates[1:] != dates[:-1])))
+        reduce = np.minimum if dedupe == "first" else np.maximum
+        winners = reduce.reduceat(source, starts)
+        group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(dates))))
+        keep = source == winners[group]
+        dates, values, value_valid = dates[keep], values[keep], value_valid[keep]
+
+    return TableData.from_arrays(dates, values, value_valid, columns=tables[0].columns)
+
+
+def _read_excel(path: str, date_format: str | None) -> TableData:
+    """Разбор одной книги в процессе пула"""
+    from src.services.table_reader import ExcelReader
+
+    return ExcelReader(path, date_format=date_format).read()
+
+
+class MultiSourceLoader:
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        dedupe: str = "all",
+        date_format: str | None = None,
+        cache: "TableCache | None" = None,
+    ):
+        """max_workers - процессов для разбора книг (по умолчанию число ядер),
+        cache - дисковый кэш разобранных книг (ключ - отпечаток файла)"""
+        if dedupe not in DEDUPE_RULES:
+            raise ValueError(f"dedupe должен быть одним из: {', '.join(DEDUPE_RULES)}")
+        self.max_workers = max_workers or os.process_cpu_count() or 1
+        self.dedupe = dedupe
+        self.date_format = date_format
+        self.cache = cache
+
+    @timed("multi_source.load_excel")
+    def load_excel(
+        self, paths: Sequence[str], progress: "ProgressCallback | None" = None
+    ) -> TableData:
+        """Читает книги (закэшированные - из кэша, остальные - в пуле процессов)
+        и сливает их в одну таблицу; progress(прочитано_книг, всего_книг)"""
+        from src.services.table_reader import ExcelReader
+
+        keys = [ExcelReader(path, date_format=self.date_format).fingerprint() for path in paths]
+        tables: list[TableData | None] = [
+            self.cache.get(key) if self.cache is not None else None for key in keys
+        ]
+        missing = [i for i, table in enumerate(tables) if table is None]
+        done = len(paths) - len(missing)
+        if progress is not None and done:
+            progress(done, len(paths))
+
+        def store(i: int, table: TableData) -> None:
+            nonlocal done
+            tables[i] = table
+            if self.cache is not None:
+                self.cache.put(keys[i], table)
+            done += 1
+            if progress is not None:
+                progress(done, len(paths))
+
+        workers = min(self.max_workers, len(missing))
+        if workers <= 1:
+            for i in missing:
+                store(i, self._read_one(paths[i]))
+        else:
+            # spawn: дочерние процессы не наследуют потоки интерфейса и пулов
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                futures = {pool.submit(_read_excel, paths[i], self.date_format): i for i in missing}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        table = future.result()
+                    except Exception as e:
+                        for pending in futures:
+                            pending.cancel()
+                        raise ValueError(f"Не удалось прочитать {paths[i]}: {e}") from e
+                    store(i, table)
+
+        return merge_tables(tables, self.dedupe)
+
+    def _read_one(self, path: str) -> TableData:
+        try:
+            return _read_excel(path, self.date_format)
+        except Exception as e:
+            raise ValueError(f"Не удалось прочитать {path}: {e}") from e
+
+    def load_worksheets(
+        self, reader: "GoogleSheetsReader", worksheets: list[str] | None = None
+    ) -> TableData:
+        """Читает листы таблицы (None - все) и сливает их в одну таблицу"""
+        return merge_tables(reader.read_worksheets(worksheets), self.dedupe)
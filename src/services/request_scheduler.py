@@ -0,0 +1,418 @@
+"""Планировщик запросов к OpenRouter с учетом лимитов провайдера.
+
+Каждый запрос проходит четыре ступени:
+
+- TokenBucket - не больше rate запросов в секунду (с запасом burst); ответ
+  429 с Retry-After приостанавливает выдачу жетонов для всех потоков, а не
+  только для получившего его запроса. Если rate не задан явно, он берется
+  из настройки OPENROUTER_RATE_LIMIT и уточняется по заголовкам ответов
+  X-RateLimit-Limit и X-RateLimit-Reset;
+- AimdLimiter - число одновременных запросов: растет на 1 за «окно» успешных
+  ответов и уменьшается вдвое при 429 (не чаще раза на одно поколение
+  запросов, как окно TCP), поэтому подстраивается под лимит, о котором
+  провайдер сообщает только отказами;
+- CircuitBreaker - после серии ошибок соединения и 5xx запросы сразу
+  отклоняются (CircuitOpenError), через reset_timeout пропускается одна
+  пробная попытка;
+- повторы - 429, 5xx и ошибки из retry_on повторяются с экспоненциальной
+  задержкой со случайной добавкой или через Retry-After, но не дольше
+  срока (deadline) всего запроса.
+
+Метрики: graphdb_openrouter_attempts_total{outcome},
+graphdb_openrouter_retries_total{reason}, graphdb_openrouter_wait_seconds
+(ожидание жетона и места), датчики graphdb_openrouter_concurrency_limit,
+graphdb_openrouter_rate_limit и graphdb_openrouter_circuit_open.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping, TypeVar
+from src.config.config import get_settings
+from src.services.metrics import count, gauge, observe
+
+T = TypeVar("T")
+
+THROTTLE_STATUS = 429
+RETRY_STATUSES = frozenset({THROTTLE_STATUS, 500, 502, 503, 504})
+
+
+class CircuitOpenError(RuntimeError):
+    """Сервис недоступен: запросы отклоняются без обращения к нему"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Запрос не уложился в срок вместе с ожиданием и повторами"""
+
+
+class RetryableStatus(Exception):
+    """Ответ с кодом, после которого запрос стоит повторить"""
+
+    def __init__(self, status: int, retry_after: float | None = None):
+        super().__init__(f"Сервис ответил {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After в секундах: число секунд или HTTP-дата"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+
+def parse_rate_limit(headers: Mapping[str, str]) -> tuple[int, float, bool] | None:
+    """(X-RateLimit-Limit, момент сброса квоты по time.time(), задан ли момент
+    абсолютно) или None, если заголовков нет.
+
+    X-RateLimit-Reset - момент сброса в миллисекундах (OpenRouter) или секундах
+    от начала эпохи либо число секунд до сброса.
+    """
+    try:
+        limit = int(float(headers.get("X-RateLimit-Limit")))
+        reset = float(headers.get("X-RateLimit-Reset"))
+    except (TypeError, ValueError):
+        return None
+    if limit <= 0:
+        return None
+    if reset > 1e11:
+        return limit, reset / 1000, True
+    if reset > 1e9:
+        return limit, reset, True
+    return limit, time.time() + reset, False
+
+
+def check_status(response) -> None:
+    """Бросает RetryableStatus для 429 и 5xx (response - requests.Response)"""
+    if response.status_code in RETRY_STATUSES:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        raise RetryableStatus(response.status_code, retry_after)
+
+
+def _wait_until(moment: float, deadline: float) -> bool:
+    """Спит до moment; False - moment позже deadline (не спит)"""
+    if moment > deadline:
+        return False
+    delay = moment - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+    return True
+
+
+class TokenBucket:
+    def __init__(self, rate: float | None, burst: int = 1):
+        """rate - жетонов в секунду (None - без ограничения), burst - емкость"""
+        if rate is not None and rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float = float("inf")) -> bool:
+        """Забирает жетон, дожидаясь его; False - жетона не будет до deadline (time.monotonic)"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and (self.rate is None or self._tokens >= 1):
+                    if self.rate is not None:
+                        self._tokens -= 1
+                    return True
+                ready = max(self._paused_until, now + (1 - self._tokens) / self.rate if self.rate else now)
+            if not _wait_until(ready, deadline):
+                return False
+
+    def _refill(self, now: float) -> None:
+        # Во время паузы жетоны не копятся: _updated может быть в будущем
+        if self.rate is not None and now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = max(self._updated, now)
+
+    def set_rate(self, rate: float) -> None:
+        """Меняет частоту; накопленные жетоны сохраняются"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать жетоны seconds секунд (после 429 с Retry-After)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            # После паузы запросы идут с обычной частотой, а не всплеском
+            self._tokens = min(self._tokens, 1.0)
+            self._updated = self._paused_until
+
+
+class AimdLimiter:
+    DECREASE = 0.5
+
+    def __init__(self, limit: int, min_limit: int = 1, max_limit: int | None = None):
+        """limit - начальное число одновременных запросов, max_limit - верхняя граница"""
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit or limit)
+        self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._changed = threading.Condition()
+        gauge("graphdb_openrouter_concurrency_limit", self.limit)
+
+    def acquire(self, deadline: float = float("inf")) -> float | None:
+        """Ждет свободного места; возвращает момент начала запроса для release
+        или None, если место не освободилось до deadline"""
+        with self._changed:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(min(remaining, 3600))
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, throttled: bool | None = False) -> None:
+        """Освобождает место. throttled: True - ответ 429 (уменьшить предел),
+        False - успешный ответ (увеличить), None - ответ ничего не говорит о лимите"""
+        with self._changed:
+            self.in_flight -= 1
+            if throttled:
+                # Отказы запросов, начатых до прошлого уменьшения, вызваны
+                # прежним пределом и не уменьшают его повторно
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.DECREASE)
+                    self._last_decrease = time.monotonic()
+            elif throttled is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            limit = self.limit
+            self._changed.notify_all()
+        gauge("graphdb_openrouter_concurrency_limit", limit)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 30.0
+
+    def __init__(self, failure_threshold: int | None = None, reset_timeout: float | None = None):
+        """failure_threshold - ошибок подряд до размыкания,
+        reset_timeout - секунд до пробного запроса"""
+        self.failure_threshold = failure_threshold or self.DEFAULT_FAILURE_THRESHOLD
+        self.reset_timeout = self.DEFAULT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def retry_in(self) -> float:
+        """Секунд до пробного запроса (0 - запросы пропускаются)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Пропустить ли запрос; в полуоткрытом состоянии - только один пробный"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self._opened + self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Сервис ответил (в том числе отказом 429 или 4xx)"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+        gauge("graphdb_openrouter_circuit_open", 0)
+
+    def abandon(self) -> None:
+        """Попытка прервана без ответа сервиса: освобождает место пробного
+        запроса, не считая ее ни успехом, ни ошибкой"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        """Ошибка соединения, тайм-аут или 5xx"""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened = time.monotonic()
+            opened = self.state == self.OPEN
+        gauge("graphdb_openrouter_circuit_open", int(opened))
+
+
+class RequestScheduler:
+    DEFAULT_RATE = 5.0
+    # Доля квоты из заголовков X-RateLimit-*, которую занимает планировщик
+    RATE_LIMIT_SHARE = 0.9
+    DEFAULT_BURST = 5
+    DEFAULT_MAX_CONCURRENCY = 4
+    DEFAULT_MAX_ATTEMPTS = 5
+    DEFAULT_DEADLINE = 300.0
+    BASE_BACKOFF = 0.5
+    MAX_BACKOFF = 30.0
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: int | None = None,
+        max_concurrency: int | None = None,
+        max_attempts: int | None = None,
+        deadline: float | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        """rate - запросов в секунду (0 - без ограничения, None - OPENROUTER_RATE_LIMIT
+        или DEFAULT_RATE с уточнением по заголовкам ответов), burst - сколько можно
+        отправить разом, max_concurrency - верхняя граница одновременных запросов,
+        max_attempts - попыток на запрос, deadline - секунд на запрос с повторами"""
+        self.auto_rate = rate is None
+        if rate is None:
+            rate = get_settings().openrouter_rate_limit
+        rate = self.DEFAULT_RATE if rate is None else rate
+        self.bucket = TokenBucket(rate or None, burst or self.DEFAULT_BURST)
+        gauge("graphdb_openrouter_rate_limit", rate)
+        self.limiter = AimdLimiter(max_concurrency or self.DEFAULT_MAX_CONCURRENCY)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts or self.DEFAULT_MAX_ATTEMPTS
+        self.deadline = deadline or self.DEFAULT_DEADLINE
+        self._quota_window = 0.0
+        self._quota_reset = 0.0
+        self._quota_lock = threading.Lock()
+
+    def observe_limits(self, headers: Mapping[str, str]) -> None:
+        """Подстраивает частоту под квоту из заголовков ответа (если rate не задан явно).
+
+        Длина окна квоты - наименьший промежуток между сменами момента сброса
+        (пропущенное окно дает кратный промежуток, то есть меньшую частоту);
+        если сброс задан числом секунд - наибольшее из них.
+        """
+        if not self.auto_rate:
+            return
+        quota = parse_rate_limit(headers)
+        if quota is None:
+            return
+        limit, reset, absolute = quota
+        with self._quota_lock:
+            if not absolute:
+                self._quota_window = max(self._quota_window, reset - time.time())
+            elif reset > self._quota_reset:
+                if self._quota_reset:
+                    window = reset - self._quota_reset
+                    self._quota_window = min(self._quota_window or window, window)
+                self._quota_reset = reset
+            if self._quota_window <= 0:
+                return
+            rate = self.RATE_LIMIT_SHARE * limit / self._quota_window
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+            gauge("graphdb_openrouter_rate_limit", rate)
+
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка со случайной добавкой (full jitter)"""
+        return random.uniform(0, min(self.MAX_BACKOFF, self.BASE_BACKOFF * 2 ** (attempt - 1)))
+
+    def call(
+        self,
+        attempt: Callable[[float], T],
+        retry_on: tuple[type[BaseException], ...] = (ConnectionError, TimeoutError),
+        deadline: float | None = None,
+    ) -> T:
+        """Выполняет attempt(remaining) с ограничениями и повторами.
+
+        remaining - секунд до срока запроса (по нему attempt ограничивает свои
+        тайм-ауты). attempt сообщает о 429/5xx через RetryableStatus (см.
+        check_status); исключения из retry_on тоже повторяются, остальные
+        пробрасываются сразу.
+        """
+        expires = time.monotonic() + (deadline or self.deadline)
+        error: BaseException | None = None
+        for number in range(1, self.max_attempts + 1):
+            queued = time.monotonic()
+            if not self.bucket.acquire(expires):
+                raise DeadlineExceeded("Не дождались очереди к сервису до истечения срока")
+            started = self.limiter.acquire(expires)
+            if started is None:
+                raise DeadlineExceeded("Не дождались очереди к сервису до истечения срока")
+            observe("graphdb_openrouter_wait_seconds", started - queued)
+            remaining = expires - started
+            if remaining <= 0:
+                # Тайм-аут попытки не может быть нулевым или отрицательным
+                self.limiter.release(started, throttled=None)
+                raise DeadlineExceeded("Срок запроса истек в очереди к сервису") from error
+
+            if not self.breaker.allow():
+                self.limiter.release(started, throttled=None)
+                count("graphdb_openrouter_attempts_total", outcome="circuit_open")
+                raise CircuitOpenError(
+                    f"Сервис недоступен, повтор через {self.breaker.retry_in:.1f} с"
+                ) from error
+
+            try:
+                result = attempt(remaining)
+            except RetryableStatus as e:
+                throttled = e.status == THROTTLE_STATUS
+                self.limiter.release(started, throttled=True if throttled else None)
+                if throttled:
+                    self.breaker.record_success()
+                    if e.retry_after:
+                        self.bucket.pause(e.retry_after)
+                else:
+                    self.breaker.record_failure()
+                outcome = "throttled" if throttled else "server_error"
+                error = e
+                delay = (
+                    e.retry_after + random.uniform(0, self.BASE_BACKOFF)
+                    if e.retry_after is not None
+                    else self._backoff(number)
+                )
+            except retry_on as e:
+                self.limiter.release(started, throttled=None)
+                self.breaker.record_failure()
+                outcome, error, delay = "connection_error", e, self._backoff(number)
+            except Exception:
+                # Сервис ответил, но запрос не удался (4xx, неверный ответ)
+                self.limiter.release(started, throttled=None)
+                self.breaker.record_success()
+                count("graphdb_openrouter_attempts_total", outcome="error")
+                raise
+            except BaseException:
+                # KeyboardInterrupt, SystemExit: о работе сервиса ничего не известно
+                self.limiter.release(started, throttled=None)
+                self.breaker.abandon()
+                raise
+            else:
+                self.limiter.release(started, throttled=False)
+                self.breaker.record_success()
+                count("graphdb_openrouter_attempts_total", outcome="ok")
+                return result
+
+            count("graphdb_openrouter_attempts_total", outcome=outcome)
+            if number == self.max_attempts:
+                raise error
+            if not _wait_until(time.monotonic() + delay, expires):
+                raise DeadlineExceeded("Срок запроса истек до следующей попытки") from error
+            count("graphdb_openrouter_retries_total", reason=outcome)
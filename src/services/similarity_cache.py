@@ -0,0 +1,124 @@
+"""Кэш результатов поиска по сумме в памяти процесса.
+
+Результат запроса зависит только от изображений с суммами из некоторого
+интервала: для поиска по диапазону - сам диапазон, для k ближайших -
+окрестность радиуса до самого дальнего найденного, для изображений с той же
+суммой - значения, округляющиеся до того же Sum.value. Каждая запись хранит
+этот интервал и id изображений в ответе; запись узлов в Neo4j (см.
+GraphDBService._write_rows) сбрасывает только записи, чей интервал содержит
+сумму записанного узла или в чей ответ этот узел уже входит. Предполагается,
+что повторная запись узла с тем же id не меняет его сумму (так пишут
+контроллер и журнал записи): иначе число изображений с прежней суммой может
+устареть до истечения ttl.
+
+Размер ограничен числом записей (вытесняются давно не использовавшиеся),
+а время жизни - ttl секунд на случай записи в Neo4j другим процессом.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterable
+from src.services.metrics import count
+
+MISSING = object()
+EVERYTHING = (float("-inf"), float("inf"))
+
+
+@dataclass(slots=True)
+class _Entry:
+    value: Any
+    expires: float
+    low: float
+    high: float
+    ids: frozenset[str]
+
+
+class SimilarityCache:
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_TTL = 300.0
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None):
+        self.max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self.ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения: растет при каждой инвалидации; передается в put,
+        чтобы не сохранить ответ, полученный до записи узлов"""
+        return self._generation
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Значение по ключу или MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        count("graphdb_similarity_cache_requests_total", result="miss" if entry is None else "hit")
+        return MISSING if entry is None else entry.value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        interval: tuple[float, float],
+        ids: Iterable[str],
+        generation: int,
+    ) -> None:
+        """Сохраняет ответ, зависящий от сумм из interval и изображений ids.
+
+        Если после generation были инвалидации, ответ мог устареть и не сохраняется.
+        """
+        low, high = interval
+        entry = _Entry(value, time.monotonic() + self.ttl, low, high, frozenset(ids))
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sums: Iterable[float], ids: Iterable[str]) -> int:
+        """Сбрасывает записи, затронутые записью узлов с суммами sums и id ids;
+        возвращает число сброшенных записей"""
+        sums = sorted(sums)
+        ids = set(ids)
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if bisect.bisect_left(sums, entry.low) < bisect.bisect_right(sums, entry.high)
+                or not entry.ids.isdisjoint(ids)
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            count("graphdb_similarity_cache_invalidations_total", len(stale))
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
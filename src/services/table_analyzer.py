@@ -1,30 +1,403 @@
-import pandas as pd
+import threading
+import numpy as np
+from dataclasses import dataclass
 from datetime import date
+from typing import Iterable
+from src.services.metrics import timed
+from src.services.table_data import TableData, TableDelta
+
+CALENDAR_UNITS = ("day", "week", "month", "quarter", "year")
+ONE_DAY = np.timedelta64(1, "D")
+
+
+def calendar_bounds(
+    date_from: date | np.datetime64, date_to: date | np.datetime64, unit: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """Границы календарных периодов, покрывающих [date_from, date_to].
+
+    unit - day, week (ISO, с понедельника), month, quarter или year; первый и
+    последний периоды не обрезаются по границам диапазона. Возвращает массивы
+    начал и концов (включительно) в datetime64[D].
+    """
+    first = np.datetime64(date_from, "D")
+    last = np.datetime64(date_to, "D")
+    if unit == "day":
+        starts = np.arange(first, last + ONE_DAY)
+        return starts, starts
+    if unit == "week":
+        # 1970-01-01 - четверг, поэтому понедельник недели смещен на 3 дня
+        monday = first - np.timedelta64((int(first.astype(np.int64)) + 3) % 7, "D")
+        starts = np.arange(monday, last + ONE_DAY, np.timedelta64(7, "D"))
+        return starts, starts + np.timedelta64(6, "D")
+
+    if unit == "month":
+        step, first_unit, last_unit = 1, first.astype("datetime64[M]"), last.astype("datetime64[M]")
+    elif unit == "quarter":
+        step, first_unit, last_unit = 3, first.astype("datetime64[M]"), last.astype("datetime64[M]")
+        # 1970-01 - начало квартала, поэтому квартал определяется остатком от деления на 3
+        first_unit = first_unit - np.timedelta64(int(first_unit.astype(np.int64)) % 3, "M")
+    elif unit == "year":
+        step, first_unit, last_unit = 1, first.astype("datetime64[Y]"), last.astype("datetime64[Y]")
+    else:
+        raise ValueError(f"Неизвестный календарный период: {unit}")
+
+    # Шаг в тех же единицах, что и даты периодов (M или Y)
+    one = np.timedelta64(1, np.datetime_data(first_unit.dtype)[0])
+    units = np.arange(first_unit, last_unit + one, step * one)
+    return units.astype("datetime64[D]"), (units + step * one).astype("datetime64[D]") - ONE_DAY
+
+
+@dataclass(frozen=True)
+class PeriodSums:
+    """Суммы по последовательности периодов в колоночном виде.
+
+    starts / ends - границы периодов (datetime64[D], включительно),
+    sums - суммы значений (int64), counts - число строк в периоде.
+    """
+    unit: str
+    starts: np.ndarray
+    ends: np.ndarray
+    sums: np.ndarray
+    counts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def cumulative(self) -> np.ndarray:
+        """Нарастающий итог по периодам"""
+        return np.cumsum(self.sums)
+
+    def periods(self) -> list[tuple[str, str]]:
+        """Периоды в виде строк ISO (например, для BatchPipeline)"""
+        return [
+            (str(start), str(end))
+            for start, end in zip(np.datetime_as_string(self.starts), np.datetime_as_string(self.ends))
+        ]
+
+    def nonzero(self) -> "PeriodSums":
+        """Только периоды, в которых есть строки"""
+        mask = self.counts > 0
+        return PeriodSums(
+            self.unit, self.starts[mask], self.ends[mask], self.sums[mask], self.counts[mask]
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class _Index:
+    """Снимок индекса: основной слой и небольшой слой изменений (как в LSM-дереве).
+
+    Основной слой - отсортированные даты строк и префиксные суммы значений.
+    Слой изменений - отсортированные строки со знаком: +значение для
+    добавленных, -значение для удаленных; его префиксные суммы складываются
+    с суммами основного слоя. Снимки не изменяются, поэтому запросы из других
+    потоков видят согласованное состояние.
+    """
+    dates: np.ndarray
+    cumsum: np.ndarray
+    delta_dates: np.ndarray
+    delta_values: np.ndarray
+    delta_signs: np.ndarray
+    delta_cumsum: np.ndarray
+    delta_counts: np.ndarray
+
+    @classmethod
+    def build(cls, dates: np.ndarray, values: np.ndarray) -> "_Index":
+        cumsum = np.zeros(len(values) + 1, dtype="int64")
+        np.cumsum(values, out=cumsum[1:])
+        no_rows = np.array([], dtype="int64")
+        no_delta = np.zeros(1, dtype="int64")
+        return cls(dates, cumsum, dates[:0], no_rows, no_rows, no_delta, no_delta)
+
+    def with_delta(self, dates: np.ndarray, values: np.ndarray, signs: np.ndarray) -> "_Index":
+        """Новый снимок с отсортированным слоем изменений: values - значения
+        со знаком, signs - +1 для добавленной строки и -1 для удаленной"""
+        delta_cumsum = np.zeros(len(values) + 1, dtype="int64")
+        np.cumsum(values, out=delta_cumsum[1:])
+        delta_counts = np.zeros(len(signs) + 1, dtype="int64")
+        np.cumsum(signs, out=delta_counts[1:])
+        return _Index(self.dates, self.cumsum, dates, values, signs, delta_cumsum, delta_counts)
+
+    def prefix(self, bounds: np.ndarray, side: str) -> tuple[np.ndarray, np.ndarray]:
+        """Суммы и число строк с датой < bounds (side="left") или <= bounds (side="right")"""
+        positions = np.searchsorted(self.dates, bounds, side=side)
+        sums, counts = self.cumsum[positions], positions
+        if len(self.delta_dates):
+            delta = np.searchsorted(self.delta_dates, bounds, side=side)
+            sums = sums + self.delta_cumsum[delta]
+            counts = counts + self.delta_counts[delta]
+        return sums, counts
+
+    def window(self, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Суммы и число строк в периодах [starts, ends]"""
+        lo_sums, lo_counts = self.prefix(starts, "left")
+        hi_sums, hi_counts = self.prefix(ends, "right")
+        empty = ends < starts
+        return np.where(empty, 0, hi_sums - lo_sums), np.where(empty, 0, hi_counts - lo_counts)
 
 
 class TableAnalyzer:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df
+    # Слой изменений сливается с основным, когда превышает эту долю основного слоя
+    COMPACT_RATIO = 0.05
+    COMPACT_MIN_ROWS = 4096
+
+    def __init__(self, table: TableData | None = None):
+        no_dates = np.array([], dtype="datetime64[D]")
+        self._index = _Index.build(no_dates, np.array([], dtype="int64"))
+        self._pending: list[tuple[np.ndarray, np.ndarray]] = []
+        self._removed_pending: list[tuple[np.ndarray, np.ndarray]] = []
+        self._unique_dates: np.ndarray | None = None
+        self._unique_dates_base: np.ndarray | None = None
+        self._lock = threading.RLock()
+        if table is not None:
+            self.append(table)
     
     @property
-    def dates(self):
-        return self.df.iloc[:, 0]
+    def dates(self) -> np.ndarray:
+        """Отсортированные корректные даты всех строк (datetime64[D])"""
+        return self._compacted().dates
     
     @property
-    def values(self):
-        return self.df.iloc[:, 1]
+    def values(self) -> np.ndarray:
+        """Значения в порядке отсортированных дат"""
+        return np.diff(self._compacted().cumsum)
+
+    @property
+    def unique_dates(self) -> np.ndarray:
+        """Отсортированные уникальные даты; не требует слияния слоя изменений"""
+        index = self._current()
+        with self._lock:
+            # Уникальные даты основного слоя пересчитываются только после слияния
+            if self._unique_dates_base is not index.dates:
+                dates = index.dates
+                first = np.concatenate(([True], dates[1:] != dates[:-1])) if len(dates) else []
+                self._unique_dates = dates[first]
+                self._unique_dates_base = dates
+            unique = self._unique_dates
+        if not len(index.delta_dates):
+            return unique
+
+        # Даты слоя изменений добавляются, даты без оставшихся строк отбрасываются
+        candidates = np.union1d(unique, index.delta_dates)
+        _, counts = index.window(candidates, candidates)
+        return candidates[counts > 0]
+
+    def append(self, table: TableData) -> None:
+        """Добавляет строки в индекс (например, очередную порцию при потоковом чтении).
+
+        Порции накапливаются и сливаются с индексом один раз - при первом запросе.
+        """
+        valid = table.date_valid
+        if valid.any():
+            with self._lock:
+                self._pending.append((table.dates[valid], table.values[valid]))
+
+    def remove(self, table: TableData) -> None:
+        """Исключает из индекса ранее добавленные строки (дата и значение должны совпадать)"""
+        valid = table.date_valid
+        if valid.any():
+            with self._lock:
+                self._removed_pending.append((table.dates[valid], table.values[valid]))
+
+    def apply_delta(self, delta: TableDelta) -> None:
+        """Применяет изменения источника; стоимость зависит от размера дельты,
+        а не таблицы (слой изменений сливается с основным по мере роста)"""
+        if delta.full is not None:
+            with self._lock:
+                self._pending.clear()
+                self._removed_pending.clear()
+                self._index = _Index.build(self._index.dates[:0], np.array([], dtype="int64"))
+            self.append(delta.full)
+            return
+        self.remove(delta.removed)
+        self.append(delta.added)
+
+    def _current(self) -> _Index:
+        """Снимок индекса с учетом накопленных порций"""
+        self._ensure_index()
+        return self._index
+
+    def _compacted(self) -> _Index:
+        """Снимок индекса без слоя изменений"""
+        self._ensure_index()
+        with self._lock:
+            if len(self._index.delta_dates):
+                with timed("analyzer.compact"):
+                    self._compact()
+            return self._index
     
+    def _ensure_index(self) -> None:
+        """Сливает накопленные порции с индексом"""
+        if not self._pending and not self._removed_pending:
+            return
+
+        with self._lock, timed("analyzer.build_index"):
+            self._merge_pending()
+
+    def _merge_pending(self) -> None:
+        added, self._pending = self._pending, []
+        removed, self._removed_pending = self._removed_pending, []
+        index = self._index
+
+        if len(index.dates) == 0 and len(index.delta_dates) == 0 and not removed:
+            # Первое построение: одна сортировка всех порций
+            dates = np.concatenate([d for d, _ in added])
+            values = np.concatenate([v for _, v in added])
+            order = np.argsort(dates, kind="stable")
+            self._index = _Index.build(dates[order], values[order])
+            return
+
+        dates = np.concatenate(
+            [index.delta_dates] + [d for d, _ in added] + [d for d, _ in removed]
+        )
+        values = np.concatenate(
+            [index.delta_values] + [v for _, v in added] + [-v for _, v in removed]
+        )
+        signs = np.concatenate(
+            [index.delta_signs]
+            + [np.ones(len(d), dtype="int64") for d, _ in added]
+            + [-np.ones(len(d), dtype="int64") for d, _ in removed]
+        )
+        order = np.argsort(dates, kind="stable")
+        self._index = index.with_delta(dates[order], values[order], signs[order])
+
+        if len(dates) > max(self.COMPACT_MIN_ROWS, self.COMPACT_RATIO * len(index.dates)):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Сливает слой изменений с основным: вставка добавленных строк и удаление
+        удаленных за O(N + k log k), без пересортировки основного слоя"""
+        index = self._index
+        signs = index.delta_signs
+        dates = index.dates
+        values = np.diff(index.cumsum)
+
+        added = signs > 0
+        add_dates, add_values = index.delta_dates[added], index.delta_values[added]
+        at = np.searchsorted(dates, add_dates, side="right")
+        dates = np.insert(dates, at, add_dates)
+        values = np.insert(values, at, add_values)
+
+        keep = np.ones(len(dates), dtype=bool)
+        unmatched = []
+        for day, value in zip(index.delta_dates[~added], -index.delta_values[~added]):
+            lo = np.searchsorted(dates, day, side="left")
+            hi = np.searchsorted(dates, day, side="right")
+            matches = np.flatnonzero((values[lo:hi] == value) & keep[lo:hi])
+            if len(matches):
+                keep[lo + matches[-1]] = False
+            else:
+                unmatched.append((day, -value))
+
+        dates, values = dates[keep], values[keep]
+        if unmatched:
+            # Удаление строки, которой нет в индексе, сохраняется как отрицательная
+            # строка, чтобы суммы до и после слияния совпадали
+            extra_dates = np.array([d for d, _ in unmatched], dtype="datetime64[D]")
+            extra_values = np.array([v for _, v in unmatched], dtype="int64")
+            at = np.searchsorted(dates, extra_dates, side="right")
+            dates = np.insert(dates, at, extra_dates)
+            values = np.insert(values, at, extra_values)
+
+        self._index = _Index.build(dates, values)
        
     def get_min_max_date(self) -> tuple[date, date]:
         """Возвращает кортеж (min_date, max_date)"""  
-        
-        valid_dates = self.dates[self.dates.notna()]
-        return (min(valid_dates), max(valid_dates))
+        dates = self.unique_dates
+        if len(dates) == 0:
+            raise ValueError("В таблице нет корректных дат")
+        return (dates[0].item(), dates[-1].item())
     
-    def sum_by_period(self, date_from: date, date_to: date) -> int:
+    def sum_by_period(self, date_from: date | np.datetime64, date_to: date | np.datetime64) -> int:
         """Вычисляет сумму за период [date_from, date_to]"""
-        mask = (self.dates >= date_from) & (self.dates <= date_to)
-        return int(self.values[mask].sum())
+        index = self._current()
+        start = np.datetime64(date_from, "D")
+        end = np.datetime64(date_to, "D")
+        if end < start:
+            return 0
+        lo_sum, _ = index.prefix(start, "left")
+        hi_sum, _ = index.prefix(end, "right")
+        return int(hi_sum - lo_sum)
+
+    def sum_by_periods(self, periods: Iterable[tuple[date, date]]) -> np.ndarray:
+        """Вычисляет суммы сразу для множества периодов [date_from, date_to]"""
+        index = self._current()
+        bounds = np.asarray(list(periods), dtype="datetime64[D]").reshape(-1, 2)
+        sums, _ = index.window(bounds[:, 0], bounds[:, 1])
+        return sums
+
+    def _range(
+        self, date_from: date | np.datetime64 | None, date_to: date | np.datetime64 | None
+    ) -> tuple[np.datetime64, np.datetime64] | None:
+        """Диапазон запроса; по умолчанию - все даты таблицы, None - таблица пуста"""
+        if date_from is not None and date_to is not None:
+            return np.datetime64(date_from, "D"), np.datetime64(date_to, "D")
+        dates = self.unique_dates
+        if len(dates) == 0:
+            return None
+        first = np.datetime64(date_from, "D") if date_from is not None else dates[0]
+        last = np.datetime64(date_to, "D") if date_to is not None else dates[-1]
+        return first, last
+
+    def _period_sums(self, unit: str, starts: np.ndarray, ends: np.ndarray) -> PeriodSums:
+        sums, counts = self._current().window(starts, ends)
+        return PeriodSums(unit, starts, ends, sums, counts)
+
+    @staticmethod
+    def _empty_sums(unit: str) -> PeriodSums:
+        no_dates = np.array([], dtype="datetime64[D]")
+        no_values = np.array([], dtype="int64")
+        return PeriodSums(unit, no_dates, no_dates, no_values, no_values)
+
+    @timed("analyzer.sum_by_calendar")
+    def sum_by_calendar(
+        self,
+        unit: str,
+        date_from: date | np.datetime64 | None = None,
+        date_to: date | np.datetime64 | None = None,
+    ) -> PeriodSums:
+        """Суммы по всем календарным периодам (день, неделя, месяц, квартал, год)
+        диапазона за один векторизованный проход; пустые периоды имеют сумму 0"""
+        bounds = self._range(date_from, date_to)
+        if bounds is None:
+            return self._empty_sums(unit)
+        starts, ends = calendar_bounds(*bounds, unit)
+        return self._period_sums(unit, starts, ends)
+
+    @timed("analyzer.rolling_sums")
+    def rolling_sums(
+        self,
+        window_days: int,
+        date_from: date | np.datetime64 | None = None,
+        date_to: date | np.datetime64 | None = None,
+    ) -> PeriodSums:
+        """Скользящие суммы: для каждого дня диапазона - сумма за window_days
+        дней, заканчивающихся этим днем (окна могут выходить за начало диапазона)"""
+        if window_days < 1:
+            raise ValueError("window_days должно быть положительным")
+        unit = f"rolling_{window_days}d"
+        bounds = self._range(date_from, date_to)
+        if bounds is None:
+            return self._empty_sums(unit)
+        ends = np.arange(bounds[0], bounds[1] + ONE_DAY)
+        return self._period_sums(unit, ends - np.timedelta64(window_days - 1, "D"), ends)
+
+    @timed("analyzer.cumulative_sums")
+    def cumulative_sums(
+        self,
+        unit: str = "day",
+        date_from: date | np.datetime64 | None = None,
+        date_to: date | np.datetime64 | None = None,
+    ) -> PeriodSums:
+        """Нарастающий итог с начала таблицы на конец каждого календарного периода.
+
+        В отличие от PeriodSums.cumulative() учитывает строки до date_from.
+        """
+        bounds = self._range(date_from, date_to)
+        if bounds is None:
+            return self._empty_sums(unit)
+        starts, ends = calendar_bounds(*bounds, unit)
+        sums, counts = self._current().prefix(ends, "right")
+        return PeriodSums(f"cumulative_{unit}", starts, ends, sums, counts)
     
 
 
@@ -37,9 +410,9 @@ class TableAnalyzer:
 #     #     sheet_id=''
 #     # )
 #     reader = ExcelReader(file_path=r"data\test_table.xlsx")
-#     df = reader.read()
+#     table = reader.read()
     
-#     analyzer = TableAnalyzer(df)
+#     analyzer = TableAnalyzer(table)
 #     min_date, max_date = analyzer.get_min_max_date()
     
 #     print(f"Date range: {min_date} - {max_date}")
\ No newline at end of file
@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+from src.config.config import DATA_DIR
+from src.services.metrics import timed
+from src.services.table_data import TableData
+
+logger = logging.getLogger(__name__)
+
+
+class TableCache:
+    """Дисковый кэш нормализованных таблиц.
+
+    Каждая таблица хранится в отдельном каталоге в виде .npy-файлов колонок,
+    которые при повторной загрузке открываются через memory map без копирования.
+    Ключ - отпечаток источника (см. TableReader.fingerprint). При превышении
+    max_bytes удаляются давно не использовавшиеся записи (LRU).
+    """
+    FORMAT_VERSION = 1
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    COLUMNS = ("dates", "values", "date_valid", "value_valid")
+    META_FILE = "meta.json"
+
+    def __init__(self, cache_dir: Path | None = None, max_bytes: int | None = None):
+        self.cache_dir = Path(cache_dir or DATA_DIR / "table_cache")
+        self.max_bytes = self.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / f"v{self.FORMAT_VERSION}-{key}"
+
+    @timed("table_cache.get")
+    def get(self, key: str | None) -> TableData | None:
+        """Возвращает таблицу из кэша или None, если записи нет"""
+        if key is None:
+            return None
+
+        entry = self._entry_dir(key)
+        meta_path = entry / self.META_FILE
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            arrays = {
+                name: np.load(entry / f"{name}.npy", mmap_mode="r") for name in self.COLUMNS
+            }
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+
+        return TableData(columns=tuple(meta["columns"]), **arrays)
+
+    @timed("table_cache.put")
+    def put(self, key: str | None, table: TableData) -> None:
+        """Сохраняет таблицу в кэш и при необходимости вытесняет старые записи"""
+        if key is None:
+            return
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-"))
+        except OSError as error:
+            logger.warning("Не удалось сохранить таблицу %s в кэш: %s", key, error)
+            return
+        try:
+            for name in self.COLUMNS:
+                np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(getattr(table, name)))
+            self._write_meta(tmp_dir, table.columns, len(table))
+        except OSError as error:
+            logger.warning("Не удалось сохранить таблицу %s в кэш: %s", key, error)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self._install(key, tmp_dir)
+
+    def writer(self, key: str) -> "TableCacheWriter":
+        """Запись таблицы в кэш порциями, без сборки всей таблицы в памяти"""
+        return TableCacheWriter(self, key)
+
+    def _write_meta(self, entry: Path, columns: tuple[str, str], rows: int) -> None:
+        (entry / self.META_FILE).write_text(
+            json.dumps({"columns": list(columns), "rows": rows}), encoding="utf-8"
+        )
+
+    def _install(self, key: str, tmp_dir: Path) -> bool:
+        """Заменяет запись key готовым каталогом tmp_dir и вытесняет старые записи"""
+        entry = self._entry_dir(key)
+        stale = tmp_dir.with_name(tmp_dir.name.replace(".tmp-", ".old-", 1))
+        try:
+            # Каталог нельзя заменить переименованием поверх непустого: прежняя
+            # запись сначала отодвигается (открытые memory map остаются рабочими)
+            try:
+                os.replace(entry, stale)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_dir, entry)
+        except OSError as error:
+            logger.warning("Не удалось сохранить таблицу %s в кэш: %s", key, error)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            try:
+                os.replace(stale, entry)
+            except OSError:
+                pass
+            return False
+        finally:
+            shutil.rmtree(stale, ignore_errors=True)
+
+        self._evict(keep=entry)
+        return True
+
+    def _evict(self, keep: Path) -> None:
+        """Удаляет наименее недавно использованные записи сверх лимита max_bytes"""
+        entries = []
+        for entry in self.cache_dir.glob(f"v{self.FORMAT_VERSION}-*"):
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                last_used = (entry / self.META_FILE).stat().st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Удаляет все записи кэша"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+class TableCacheWriter:
+    """Сохраняет таблицу в запись TableCache по мере чтения порций.
+
+    Колонки дописываются в файлы на диске, в памяти держится только текущая
+    порция; commit() добавляет заголовки .npy и возвращает таблицу из кэша
+    (memory map). При ошибке записи порции дальше пропускаются, а commit()
+    возвращает None.
+    """
+
+    def __init__(self, cache: TableCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.columns: tuple[str, str] | None = None
+        self.rows = 0
+        self._dtypes = {
+            name: getattr(TableData.empty_table(), name).dtype for name in TableCache.COLUMNS
+        }
+        self._tmp_dir: Path | None = None
+        self._files: dict = {}
+        try:
+            cache.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._tmp_dir = Path(tempfile.mkdtemp(dir=cache.cache_dir, prefix=".tmp-"))
+            for name in TableCache.COLUMNS:
+                self._files[name] = open(self._tmp_dir / f"{name}.raw", "wb")
+        except OSError as error:
+            self._fail(error)
+
+    def __enter__(self) -> "TableCacheWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.abort()
+
+    def append(self, table: TableData) -> None:
+        if self._tmp_dir is None:
+            return
+        if self.columns is None:
+            self.columns = table.columns
+        try:
+            for name, file in self._files.items():
+                np.ascontiguousarray(getattr(table, name), dtype=self._dtypes[name]).tofile(file)
+        except OSError as error:
+            self._fail(error)
+            return
+        self.rows += len(table)
+
+    @timed("table_cache.put")
+    def commit(self) -> TableData | None:
+        """Завершает запись; None - таблица в кэш не записана"""
+        if self._tmp_dir is None:
+            return None
+        tmp_dir = self._tmp_dir
+        try:
+            for name, file in self._files.items():
+                file.close()
+                raw_path = tmp_dir / f"{name}.raw"
+                header = {"descr": np.lib.format.dtype_to_descr(self._dtypes[name]),
+                          "fortran_order": False, "shape": (self.rows,)}
+                with open(tmp_dir / f"{name}.npy", "wb") as out, open(raw_path, "rb") as raw:
+                    np.lib.format.write_array_header_1_0(out, header)
+                    shutil.copyfileobj(raw, out)
+                raw_path.unlink()
+            self.cache._write_meta(tmp_dir, self.columns or TableData.empty_table().columns, self.rows)
+        except OSError as error:
+            self._fail(error)
+            return None
+
+        self._tmp_dir = None
+        if not self.cache._install(self.key, tmp_dir):
+            return None
+        return self.cache.get(self.key)
+
+    def abort(self) -> None:
+        """Удаляет незавершенную запись (после commit ничего не делает)"""
+        for file in self._files.values():
+            file.close()
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def _fail(self, error: OSError) -> None:
+        logger.warning("Не удалось сохранить таблицу %s в кэш: %s", self.key, error)
+        self.abort()
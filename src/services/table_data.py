@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass(frozen=True)
+class TableData:
+    """Нормализованная таблица в колоночном виде.
+
+    dates - массив datetime64[D] (NaT для нераспознанных дат),
+    values - массив int64 (0 для нераспознанных значений),
+    date_valid / value_valid - маски корректно распознанных строк.
+    """
+    dates: np.ndarray
+    values: np.ndarray
+    date_valid: np.ndarray
+    value_valid: np.ndarray
+    columns: tuple[str, str] = ("Date", "Value")
+
+    @classmethod
+    def empty_table(cls, columns: tuple[str, str] = ("Date", "Value")) -> "TableData":
+        """Создает пустую таблицу"""
+        return cls(
+            dates=np.array([], dtype="datetime64[D]"),
+            values=np.array([], dtype="int64"),
+            date_valid=np.array([], dtype=bool),
+            value_valid=np.array([], dtype=bool),
+            columns=columns,
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        dates: np.ndarray,
+        values: np.ndarray,
+        value_valid: np.ndarray | None = None,
+        columns: tuple[str, str] = ("Date", "Value"),
+    ) -> "TableData":
+        """Создает таблицу из массивов дат и значений"""
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        values = np.asarray(values, dtype="int64")
+        if value_valid is None:
+            value_valid = np.ones(len(values), dtype=bool)
+        return cls(
+            dates=dates,
+            values=values,
+            date_valid=~np.isnat(dates),
+            value_valid=np.asarray(value_valid, dtype=bool),
+            columns=columns,
+        )
+
+    @classmethod
+    def concat(cls, tables: Iterable["TableData"]) -> "TableData":
+        """Объединяет несколько таблиц в одну в порядке следования"""
+        tables = list(tables)
+        if not tables:
+            return cls.empty_table()
+        return cls(
+            dates=np.concatenate([t.dates for t in tables]),
+            values=np.concatenate([t.values for t in tables]),
+            date_valid=np.concatenate([t.date_valid for t in tables]),
+            value_valid=np.concatenate([t.value_valid for t in tables]),
+            columns=tables[0].columns,
+        )
+
+    def take(self, rows: np.ndarray) -> "TableData":
+        """Выбирает строки по маске или индексам"""
+        return TableData(
+            dates=self.dates[rows],
+            values=self.values[rows],
+            date_valid=self.date_valid[rows],
+            value_valid=self.value_valid[rows],
+            columns=self.columns,
+        )
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def nbytes(self) -> int:
+        """Объем памяти, занимаемый колонками"""
+        return (
+            self.dates.nbytes
+            + self.values.nbytes
+            + self.date_valid.nbytes
+            + self.value_valid.nbytes
+        )
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        """Преобразует таблицу в DataFrame (для отображения и отладки)"""
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                self.columns[0]: self.dates.astype("datetime64[s]"),
+                self.columns[1]: self.values,
+            }
+        )
+
+
+@dataclass(frozen=True)
+class TableDelta:
+    """Изменения источника между двумя чтениями.
+
+    added - новые строки и новые версии измененных строк, removed - удаленные
+    строки и старые версии измененных. Если изменения не удалось выразить
+    строками (например, поменялись заголовки), full содержит таблицу целиком.
+    """
+    added: TableData
+    removed: TableData
+    full: TableData | None = None
+
+    @classmethod
+    def unchanged(cls) -> "TableDelta":
+        return cls(TableData.empty_table(), TableData.empty_table())
+
+    @classmethod
+    def replace(cls, table: TableData) -> "TableDelta":
+        return cls(TableData.empty_table(), TableData.empty_table(), full=table)
+
+    @property
+    def changed(self) -> bool:
+        return self.full is not None or len(self.added) > 0 or len(self.removed) > 0
+
+
+def diff_tables(old: TableData, new: TableData) -> TableDelta:
+    """Построчное сравнение двух версий таблицы.
+
+    Строки сравниваются по позиции, поэтому дописывание строк в конец и правки
+    на месте дают дельту по размеру изменений; вставка в середину сдвигает
+    все последующие строки и превращается в их замену.
+    """
+    if old.columns != new.columns:
+        return TableDelta.replace(new)
+
+    common = min(len(old), len(new))
+    # Даты сравниваются как int64: NaT != NaT в арифметике datetime64
+    changed = (
+        (old.dates[:common].view("int64") != new.dates[:common].view("int64"))
+        | (old.values[:common] != new.values[:common])
+        | (old.value_valid[:common] != new.value_valid[:common])
+    )
+    removed = np.concatenate([np.flatnonzero(changed), np.arange(common, len(old))])
+    added = np.concatenate([np.flatnonzero(changed), np.arange(common, len(new))])
+    return TableDelta(added=new.take(added), removed=old.take(removed))
@@ -1,11 +1,18 @@
 from abc import ABC, abstractmethod
-import gspread
-from google.oauth2.service_account import Credentials
+import hashlib
+import json
+from pathlib import Path
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Iterator
+import numpy as np
 import pandas as pd
 import os
-from dotenv import load_dotenv
+from src.config.config import DATA_DIR, get_settings
+from src.services.metrics import count, timed
+from src.services.table_data import TableData, TableDelta
 
-load_dotenv()
+if TYPE_CHECKING:
+    import gspread
 
 class TableReader(ABC):
     DEFAULT_DATE_FORMAT = "%d.%m.%Y"
@@ -14,31 +21,46 @@ class TableReader(ABC):
         self.date_format = date_format or self.DEFAULT_DATE_FORMAT
 
     @abstractmethod
-    def read(self) -> pd.DataFrame:
+    def read(self) -> TableData:
         pass
 
-    def _parse_date_column(self, series: pd.Series) -> pd.Series:
-        return pd.to_datetime(series, errors="coerce", format=self.date_format).apply(
-            lambda x: x.date() if pd.notna(x) else None
-        )
+    def fingerprint(self) -> str | None:
+        """Отпечаток источника для кэширования; None - источник не кэшируется"""
+        return None
+
+    @timed("table.parse_dates")
+    def _parse_date_column(self, series: pd.Series) -> np.ndarray:
+        parsed = pd.to_datetime(series, errors="coerce", format=self.date_format)
+        return parsed.to_numpy().astype("datetime64[D]")
 
-    def _parse_value_column(self, series: pd.Series) -> pd.Series:
-        return pd.to_numeric(series, errors="coerce").fillna(0).astype("int64")
+    @timed("table.parse_values")
+    def _parse_value_column(self, series: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        parsed = pd.to_numeric(series, errors="coerce")
+        valid = parsed.notna().to_numpy()
+        return parsed.fillna(0).to_numpy(dtype="int64"), valid
 
-    def _normalize_table(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _normalize_table(self, df: pd.DataFrame) -> TableData:
         if df.empty or df.shape[1] < 2:
-            return df
+            return TableData.empty_table()
 
-        df = df.copy()
-        df[df.columns[0]] = self._parse_date_column(df.iloc[:, 0])
-        df[df.columns[1]] = self._parse_value_column(df.iloc[:, 1])
+        dates = self._parse_date_column(df.iloc[:, 0])
+        values, value_valid = self._parse_value_column(df.iloc[:, 1])
 
-        return df
+        return TableData(
+            dates=dates,
+            values=values,
+            date_valid=~np.isnat(dates),
+            value_valid=value_valid,
+            columns=(str(df.columns[0]), str(df.columns[1])),
+        )
 
 
 class GoogleSheetsReader(TableReader):
-    DEFAULT_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-    DEFAULT_CREDENTIALS_PATH = os.getenv("GOOGLE_SHEETS_CREDENTIALS_PATH")
+    DEFAULT_SCOPES = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive.metadata.readonly",
+    ]
+    COLUMNS_RANGE = ("A", "B")
 
     def __init__(
         self,
@@ -46,49 +68,304 @@ class GoogleSheetsReader(TableReader):
         cred_path: str | None = None,
         date_format: str | None = None,
         scopes: list[str] | None = None,
+        client: "gspread.Client | None" = None,
+        cache_dir: Path | None = None,
+        use_cache: bool = True,
+        worksheet: str | None = None,
     ):
+        """client позволяет передать готовый (в т.ч. тестовый) клиент gspread,
+        worksheet - имя листа (по умолчанию первый лист)"""
         super().__init__(date_format)
         self.sheet_id = sheet_id
+        self.worksheet = worksheet
         self.scopes = scopes or self.DEFAULT_SCOPES
-        self.cred_path = cred_path or self.DEFAULT_CREDENTIALS_PATH
+        self.cache_dir = Path(cache_dir or DATA_DIR / "sheets_cache")
+        self.use_cache = use_cache
+        self.last_fetch: str | None = None
+        self.last_fetched_rows = 0
+
+        if client is not None:
+            self.client = client
+            return
+
+        # gspread и google-auth импортируются только при подключении к Google
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        self.cred_path = cred_path or get_settings().google_sheets_credentials_path
         
-        if not self.cred_path:
-            raise ValueError("cred_path не указан и GOOGLE_SHEETS_CREDENTIALS_PATH не установлен")
+        if not os.path.exists(self.cred_path):
+            raise ValueError(f"Файл учетных данных Google не найден: {self.cred_path}")
         
         self.creds = Credentials.from_service_account_file(
             self.cred_path, scopes=self.scopes
         )
         self.client = gspread.authorize(self.creds)
 
-    def get_sheet(self, sheet_id: str) -> gspread.Spreadsheet:
+    @timed("sheets.open")
+    def get_sheet(self, sheet_id: str) -> "gspread.Spreadsheet":
         return self.client.open_by_key(sheet_id)
 
-    def _get_all_raws(self, sheet: gspread.Spreadsheet) -> list:
-        return sheet.sheet1.get_all_values()
+    @timed("sheets.revision")
+    def _get_revision(self, sheet: "gspread.Spreadsheet") -> str | None:
+        """Время последнего изменения таблицы; None, если Drive API недоступен"""
+        try:
+            return sheet.get_lastUpdateTime()
+        except Exception:
+            return None
+
+    def _a1_range(self, first_row: int = 1) -> str:
+        """Диапазон нужных столбцов листа в нотации A1"""
+        first_col, last_col = self.COLUMNS_RANGE
+        cells = f"{first_col}{first_row}:{last_col}"
+        if self.worksheet is None:
+            return cells
+        return "'" + self.worksheet.replace("'", "''") + "'!" + cells
+
+    def _pad_rows(self, value_range: dict) -> list[list[str]]:
+        first_col, last_col = self.COLUMNS_RANGE
+        rows = value_range.get("values", [])
+        width = ord(last_col) - ord(first_col) + 1
+        count("graphdb_sheets_rows_fetched_total", len(rows))
+        return [(list(row) + [""] * width)[:width] for row in rows]
+
+    @timed("sheets.fetch_rows")
+    def _fetch_rows(self, sheet: "gspread.Spreadsheet", first_row: int = 1) -> list[list[str]]:
+        """Загружает только нужные столбцы листа одним batch-запросом"""
+        response = sheet.values_batch_get([self._a1_range(first_row)])
+        value_ranges = response.get("valueRanges", [])
+        return self._pad_rows(value_ranges[0]) if value_ranges else []
+
+    def _cache_path(self) -> Path:
+        if self.worksheet is None:
+            return self.cache_dir / f"{self.sheet_id}.json"
+        suffix = hashlib.sha1(self.worksheet.encode("utf-8")).hexdigest()[:12]
+        return self.cache_dir / f"{self.sheet_id}-{suffix}.json"
+
+    def _load_cache(self) -> dict | None:
+        if not self.use_cache:
+            return None
+        try:
+            return json.loads(self._cache_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _save_cache(self, revision: str | None, rows: list[list[str]]) -> None:
+        if not self.use_cache:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._cache_path().with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"revision": revision, "rows": rows}), encoding="utf-8")
+        os.replace(tmp_path, self._cache_path())
+
+    def _get_all_raws(self, sheet: "gspread.Spreadsheet") -> list:
+        """Возвращает строки таблицы, по возможности используя локальный кэш.
+
+        Если ревизия не изменилась - запрос данных не выполняется, если
+        изменилась - таблица загружается целиком: по ревизии не видно, где
+        правка, а правка в середине не меняет последнюю строку. Если ревизия
+        неизвестна (Drive API недоступен), загружаются строки, начиная с
+        последней закэшированной: если она не изменилась, к кэшу добавляются
+        только новые строки, иначе таблица загружается целиком. В этом случае
+        правки в середине таблицы пропускаются - для этого есть use_cache=False.
+        """
+        revision = self._get_revision(sheet)
+        cached = self._load_cache()
+        cached_rows = cached["rows"] if cached else []
+
+        if cached_rows and revision is not None and cached["revision"] == revision:
+            self.last_fetch, self.last_fetched_rows = "cache", 0
+            count("graphdb_sheets_fetch_total", mode="cache")
+            return cached_rows
+
+        rows = None
+        if cached_rows and revision is None:
+            tail = self._fetch_rows(sheet, first_row=len(cached_rows))
+            if tail and tail[0] == cached_rows[-1]:
+                rows = cached_rows + tail[1:]
+                self.last_fetch, self.last_fetched_rows = "append", len(tail)
+
+        if rows is None:
+            rows = self._fetch_rows(sheet)
+            self.last_fetch, self.last_fetched_rows = "full", len(rows)
+
+        self._save_cache(revision, rows)
+        count("graphdb_sheets_fetch_total", mode=self.last_fetch)
+        return rows
 
     def _create_dataframe(self, rows: list) -> pd.DataFrame:
         if not rows:
             return pd.DataFrame()
         return pd.DataFrame(rows[1:], columns=rows[0])
 
-    def read(self) -> pd.DataFrame:
+    def read(self) -> TableData:
         sheet = self.get_sheet(self.sheet_id)
         rows = self._get_all_raws(sheet)
         df = self._create_dataframe(rows)
         return self._normalize_table(df)
 
+    @timed("sheets.read_changes")
+    def read_changes(self) -> TableDelta:
+        """Изменения листа с прошлого чтения, найденные по локальному кэшу строк.
+
+        Если ревизия таблицы не изменилась, данные не запрашиваются. Иначе два
+        нужных столбца загружаются и сравниваются с кэшем построчно, а разбираются
+        только новые и измененные строки. Без кэша (первое чтение или
+        use_cache=False) возвращается вся таблица (TableDelta.full).
+        """
+        sheet = self.get_sheet(self.sheet_id)
+        cached = self._load_cache()
+        old_rows = cached["rows"] if cached else []
+        rows = self._get_all_raws(sheet)
+        if not old_rows or not rows or rows[0] != old_rows[0]:
+            return TableDelta.replace(self._normalize_table(self._create_dataframe(rows)))
+        if self.last_fetch == "cache":
+            return TableDelta.unchanged()
+
+        common = min(len(rows), len(old_rows))
+        if self.last_fetch == "append":
+            changed = []
+        else:
+            changed = [i for i in range(1, common) if rows[i] != old_rows[i]]
+        added = [rows[i] for i in changed] + rows[common:]
+        removed = [old_rows[i] for i in changed] + old_rows[common:]
+        header = rows[0]
+        return TableDelta(
+            added=self._normalize_table(self._create_dataframe([header] + added)),
+            removed=self._normalize_table(self._create_dataframe([header] + removed)),
+        )
+
+    def _for_worksheet(self, worksheet: str) -> "GoogleSheetsReader":
+        return GoogleSheetsReader(
+            self.sheet_id,
+            date_format=self.date_format,
+            client=self.client,
+            cache_dir=self.cache_dir,
+            use_cache=self.use_cache,
+            worksheet=worksheet,
+        )
+
+    @timed("sheets.read_worksheets")
+    def read_worksheets(self, worksheets: list[str] | None = None) -> list[TableData]:
+        """Читает несколько листов таблицы; None - все листы по порядку.
+
+        Листы, не изменившиеся с прошлой загрузки (по ревизии таблицы), берутся
+        из кэша, остальные загружаются одним batch-запросом на все листы.
+        """
+        sheet = self.get_sheet(self.sheet_id)
+        if worksheets is None:
+            worksheets = [worksheet.title for worksheet in sheet.worksheets()]
+        readers = [self._for_worksheet(name) for name in worksheets]
+
+        revision = self._get_revision(sheet)
+        rows: list[list | None] = [None] * len(readers)
+        for i, reader in enumerate(readers):
+            cached = reader._load_cache()
+            if cached and revision is not None and cached["revision"] == revision:
+                rows[i] = cached["rows"]
+
+        missing = [i for i, found in enumerate(rows) if found is None]
+        count("graphdb_sheets_fetch_total", len(readers) - len(missing), mode="cache")
+        if missing:
+            with timed("sheets.fetch_rows", worksheets=len(missing)):
+                response = sheet.values_batch_get([readers[i]._a1_range() for i in missing])
+            value_ranges = response.get("valueRanges", [])
+            for i, value_range in zip(missing, value_ranges):
+                rows[i] = readers[i]._pad_rows(value_range)
+                readers[i]._save_cache(revision, rows[i])
+            count("graphdb_sheets_fetch_total", len(missing), mode="full")
+
+        return [
+            reader._normalize_table(reader._create_dataframe(worksheet_rows or []))
+            for reader, worksheet_rows in zip(readers, rows)
+        ]
+
+
+ProgressCallback = Callable[[int, int | None], None]
+
 
 class ExcelReader(TableReader):
-    def __init__(self, file_path: str, date_format: str | None = None):
+    DEFAULT_CHUNK_SIZE = 50_000
+    STREAMING_THRESHOLD_BYTES = 10 * 1024 * 1024
+    STREAMING_EXTENSIONS = (".xlsx", ".xlsm")
+
+    def __init__(
+        self,
+        file_path: str,
+        date_format: str | None = None,
+        streaming: bool | None = None,
+        chunk_size: int | None = None,
+    ):
+        """streaming=None включает потоковое чтение автоматически для больших .xlsx"""
         super().__init__(date_format)
         self.file_path = file_path
+        self.chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        self.streaming = self._should_stream() if streaming is None else streaming
+
+    def _should_stream(self) -> bool:
+        if not self.file_path.lower().endswith(self.STREAMING_EXTENSIONS):
+            return False
+        return os.path.getsize(self.file_path) >= self.STREAMING_THRESHOLD_BYTES
+
+    def fingerprint(self) -> str | None:
+        """Отпечаток по пути, размеру и времени изменения файла и формату дат"""
+        stat = os.stat(self.file_path)
+        source = "|".join(
+            [
+                type(self).__name__,
+                os.path.abspath(self.file_path),
+                str(stat.st_size),
+                str(stat.st_mtime_ns),
+                self.date_format,
+            ]
+        )
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
 
+    @timed("excel.read_file")
     def _read_excel_file(self) -> pd.DataFrame:
         return pd.read_excel(self.file_path, parse_dates=False)
 
-    def read(self) -> pd.DataFrame:
+    def iter_chunks(self, progress: ProgressCallback | None = None) -> Iterator[TableData]:
+        """Потоково читает первый лист порциями по chunk_size строк.
+
+        Читаются только два первых столбца (дата и значение), книга открывается
+        в режиме read-only, поэтому потребление памяти не зависит от размера файла.
+        progress(прочитано_строк, всего_строк | None) вызывается после каждой порции.
+        """
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            rows = sheet.iter_rows(max_col=2, values_only=True)
+            header = next(rows, None)
+            if header is None or len(header) < 2:
+                return
+
+            columns = [str(name) for name in header]
+            total = sheet.max_row - 1 if sheet.max_row else None
+            done = 0
+            while True:
+                with timed("excel.read_chunk"):
+                    chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                done += len(chunk)
+                yield self._normalize_table(pd.DataFrame(chunk, columns=columns))
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            workbook.close()
+
+    def read(self, progress: ProgressCallback | None = None) -> TableData:
+        if self.streaming:
+            return TableData.concat(self.iter_chunks(progress))
+
         df = self._read_excel_file()
-        return self._normalize_table(df)
+        table = self._normalize_table(df)
+        if progress is not None:
+            progress(len(table), len(table))
+        return table
 
 
 # # Использование
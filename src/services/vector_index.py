@@ -0,0 +1,118 @@
+import threading
+import numpy as np
+
+
+class VectorIndex:
+    """Приближенный поиск ближайших соседей по косинусному сходству в памяти процесса.
+
+    Используется, когда сервер Neo4j не поддерживает векторные индексы.
+    Векторы раскладываются по корзинам случайными гиперплоскостями (LSH)
+    в n_tables независимых таблицах; при запросе просматриваются корзина
+    запроса и корзины, отличающиеся одним битом, а кандидаты ранжируются
+    точным скалярным произведением. Небольшие наборы ищутся полным перебором.
+    Векторы должны быть нормированы по L2. Методы add и search можно вызывать
+    из разных потоков.
+    """
+    DEFAULT_BRUTE_FORCE_BELOW = 5000
+
+    def __init__(
+        self,
+        dim: int,
+        n_tables: int = 24,
+        n_bits: int = 12,
+        brute_force_below: int | None = None,
+        seed: int = 0,
+    ):
+        self.dim = dim
+        self.n_bits = n_bits
+        self.brute_force_below = (
+            self.DEFAULT_BRUTE_FORCE_BELOW if brute_force_below is None else brute_force_below
+        )
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((n_tables, dim, n_bits)).astype(np.float32)
+        self._bit_weights = 1 << np.arange(n_bits, dtype=np.int64)
+
+        self._ids: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._pending: list[np.ndarray] = []
+        self._tables: list[tuple[np.ndarray, np.ndarray]] | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._ids)
+
+    def add(self, ids: list[str], vectors: np.ndarray) -> None:
+        """Добавляет векторы; повторно добавленный id заменяет прежний вектор"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            self._flush_pending()
+            base = len(self._ids)
+            new_rows = []
+            for item_id, vector in zip(ids, vectors):
+                position = self._positions.get(item_id)
+                if position is not None and position < base:
+                    self._vectors[position] = vector
+                    continue
+                if position is not None:
+                    new_rows[position - base] = vector
+                    continue
+                self._positions[item_id] = len(self._ids)
+                self._ids.append(item_id)
+                new_rows.append(vector)
+            if new_rows:
+                self._pending.append(np.stack(new_rows))
+            self._tables = None
+
+    def _flush_pending(self) -> None:
+        """Вызывается под self._lock (как и _ensure_tables, _candidates)"""
+        if self._pending:
+            self._vectors = np.concatenate([self._vectors] + self._pending)
+            self._pending.clear()
+
+    def _codes(self, vectors: np.ndarray, table: int) -> np.ndarray:
+        bits = (vectors @ self._planes[table]) > 0
+        return bits.astype(np.int64) @ self._bit_weights
+
+    def _ensure_tables(self) -> None:
+        self._flush_pending()
+        if self._tables is not None:
+            return
+        self._tables = []
+        for table in range(len(self._planes)):
+            codes = self._codes(self._vectors, table)
+            order = np.argsort(codes, kind="stable")
+            self._tables.append((codes[order], order))
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        probes_mask = np.concatenate([[0], self._bit_weights])
+        found = []
+        for table, (codes, order) in enumerate(self._tables):
+            probes = self._codes(query[None, :], table)[0] ^ probes_mask
+            lo = np.searchsorted(codes, probes, side="left")
+            hi = np.searchsorted(codes, probes, side="right")
+            found.extend(order[a:b] for a, b in zip(lo, hi) if b > a)
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def search(self, query: np.ndarray, k: int = 10) -> list[tuple[str, float]]:
+        """Возвращает до k пар (id, сходство) в порядке убывания сходства"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            self._flush_pending()
+            if not self._ids or k <= 0:
+                return []
+
+            if len(self._ids) < self.brute_force_below:
+                candidates = np.arange(len(self._ids))
+            else:
+                self._ensure_tables()
+                candidates = self._candidates(query)
+                if len(candidates) < k:
+                    candidates = np.arange(len(self._ids))
+
+            scores = self._vectors[candidates] @ query
+            top = min(k, len(candidates))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            return [(self._ids[candidates[i]], float(scores[i])) for i in best]
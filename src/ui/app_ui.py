@@ -2,17 +2,32 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import numpy as np
 from src.controllers.app_controller import TableController
+from src.services.table_analyzer import CALENDAR_UNITS
+from src.ui.date_picker import DatePicker
+from src.ui.task_runner import Task, TaskRunner
 
 
 class TableUI:
+    MAX_REPORT_LINES = 1000
+    WATCH_INTERVAL_MS = 5000
+    CALENDAR_UNIT_LABELS = dict(zip(CALENDAR_UNITS, ("дни", "недели", "месяцы", "кварталы", "годы")))
+
     def __init__(self):
         self.window = tk.Tk()
         self.window.title("Table Manager")
         self.window.geometry("1020x800")
         
         self.controller = TableController()
+        self.tasks = TaskRunner(self.window)
+        self._current_task: Task | None = None
+        self._action_buttons: list[ttk.Button] = []
+        self._watch_id: str | None = None
+        self._similar_cursor: tuple | None = None
         self._ui_create_widgets()
+        self.window.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.window.after_idle(self._resume_pending_pushes)
     
     def _ui_create_widgets(self):
         """Создаёт все виджеты интерфейса"""
@@ -20,6 +35,7 @@ class TableUI:
         self._ui_create_excel_section()
         self._ui_create_date_selection_section()
         self._ui_create_action_buttons()
+        self._ui_create_status_section()
         self._ui_create_info_section()
     
     def _ui_create_google_sheets_section(self):
@@ -30,10 +46,16 @@ class TableUI:
         ttk.Label(frame, text="Sheet ID:").pack(side="left")
         self.sheet_id_entry = ttk.Entry(frame, width=40)
         self.sheet_id_entry.pack(side="left", padx=5)
+
+        ttk.Label(frame, text="Листы:").pack(side="left")
+        self.worksheets_entry = ttk.Entry(frame, width=20)
+        self.worksheets_entry.pack(side="left", padx=5)
         
         # self.sheet_id_entry.bind('<Control-v>', self._paste_to_entry)
         
-        ttk.Button(frame, text="Загрузить", command=self._load_google_sheets).pack(side="left")
+        button = ttk.Button(frame, text="Загрузить", command=self._load_google_sheets)
+        button.pack(side="left")
+        self._action_buttons.append(button)
     
     # def _paste_to_entry(self, event):
     #     """Вставляет текст из буфера обмена в поле ввода"""
@@ -52,7 +74,9 @@ class TableUI:
         self.excel_path_label = ttk.Label(frame, text="Файл не выбран")
         self.excel_path_label.pack(side="left", padx=5)
         
-        ttk.Button(frame, text="Выбрать файл", command=self._load_excel).pack(side="left", padx=5)
+        button = ttk.Button(frame, text="Выбрать файлы", command=self._load_excel)
+        button.pack(side="left", padx=5)
+        self._action_buttons.append(button)
     
     def _ui_create_date_selection_section(self):
         """Секция выбора дат"""
@@ -60,12 +84,14 @@ class TableUI:
         frame.pack(fill="x", padx=10, pady=5)
         
         ttk.Label(frame, text="С:").pack(side="left")
-        self.date_from_combo = ttk.Combobox(frame, state="readonly", width=15)
+        self.date_from_combo = DatePicker(frame, width=15)
         self.date_from_combo.pack(side="left", padx=5)
         
         ttk.Label(frame, text="По:").pack(side="left")
-        self.date_to_combo = ttk.Combobox(frame, state="readonly", width=15)
+        self.date_to_combo = DatePicker(frame, width=15)
         self.date_to_combo.pack(side="left", padx=5)
+
+        ttk.Label(frame, text="(введите начало даты, например 2024-03, и откройте список)").pack(side="left", padx=5)
     
     def _ui_create_action_buttons(self):
         """Кнопки действий"""
@@ -73,16 +99,50 @@ class TableUI:
         frame.pack(fill="x", padx=10, pady=5)
         
         ttk.Button(frame, text="Получить сумму", command=self._get_sum).pack(side="left", padx=5)
-        ttk.Button(frame, text="Сгенерировать изображение", command=self._generate_image).pack(side="left", padx=5)
-        ttk.Button(frame, text="Искать похожие", command=self._search_similar_images).pack(side="left", padx=15)
+        self.calendar_unit_combo = ttk.Combobox(
+            frame, values=list(self.CALENDAR_UNIT_LABELS.values()), state="readonly", width=9
+        )
+        self.calendar_unit_combo.set(self.CALENDAR_UNIT_LABELS["month"])
+        self.calendar_unit_combo.pack(side="left")
+        ttk.Button(frame, text="Суммы по периодам", command=self._get_calendar_sums).pack(side="left", padx=5)
+        for text, command, padx in (
+            ("Сгенерировать изображение", self._generate_image, 5),
+            ("Искать похожие", self._search_similar_images, 15),
+            ("Похожие по изображению", self._search_similar_by_image, 5),
+        ):
+            button = ttk.Button(frame, text=text, command=command)
+            button.pack(side="left", padx=padx)
+            self._action_buttons.append(button)
         self.send_button = ttk.Button(frame, text="Добавить в neo4j", command=self._send_number, state="disabled")
         self.send_button.pack(side="left", padx=5)
+        self.more_button = ttk.Button(frame, text="Еще", command=self._show_more_similar, state="disabled")
+        self.more_button.pack(side="left", padx=5)
+    
+    def _ui_create_status_section(self):
+        """Прогресс фоновой операции и кнопка отмены"""
+        frame = ttk.Frame(self.window, padding=(10, 0))
+        frame.pack(fill="x", padx=10)
+        
+        self.status_label = ttk.Label(frame, text="Готово", width=40)
+        self.status_label.pack(side="left")
+        self.progress_bar = ttk.Progressbar(frame, mode="determinate", length=300)
+        self.progress_bar.pack(side="left", padx=5)
+        self.cancel_button = ttk.Button(frame, text="Отмена", command=self._cancel_task, state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            frame, text="Следить за изменениями", variable=self.watch_var, command=self._toggle_watch
+        ).pack(side="left", padx=5)
     
     def _ui_create_info_section(self):
         """Блок справочной информации"""
         frame = ttk.LabelFrame(self.window, text="Информация", padding=10)
         frame.pack(fill="both", expand=True, padx=10, pady=5)
         
+        self.preview_label = ttk.Label(frame)
+        self.preview_label.pack(side="right", anchor="n", padx=(10, 0))
+        self._preview_image: tk.PhotoImage | None = None
+
         self.info_text = tk.Text(frame, height=8, state="disabled")
         self.info_text.pack(fill="both", expand=True)
   
@@ -95,45 +155,101 @@ class TableUI:
             messagebox.showwarning("Ошибка", "Введите Sheet ID")
             return
         
-        try:
-            from src.config.config import GOOGLE_SHEETS_CREDENTIALS_PATH
+        # Пусто - первый лист, "*" - все листы, иначе имена через запятую
+        worksheets_text = self.worksheets_entry.get().strip()
+        if not worksheets_text:
+            worksheets = None
+        elif worksheets_text == "*":
+            worksheets = []
+        else:
+            worksheets = [name.strip() for name in worksheets_text.split(",") if name.strip()]
+
+        def load(context):
             self.controller.load_from_google_sheets(
-                cred_path=str(GOOGLE_SHEETS_CREDENTIALS_PATH),
-                sheet_id=sheet_id
+                cred_path=None, sheet_id=sheet_id, worksheets=worksheets
             )
-            self._add_info(f"Таблица загружена из {self.controller.get_source_info()}")
-            self._populate_date_combos()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить таблицу: {e}")
+            return self.controller.get_unique_dates()
+
+        self._run_task(
+            "Загрузка Google Sheets", load, self._on_table_loaded,
+            "Не удалось загрузить таблицу",
+        )
     
     def _load_excel(self):
-        file_path = filedialog.askopenfilename(
-            title="Выберите Excel файл",
+        file_paths = filedialog.askopenfilenames(
+            title="Выберите Excel файлы",
             filetypes=[("Excel files", "*.xlsx *.xls")]
         )
-        if not file_path:
+        if not file_paths:
             return
 
-        self.excel_path = file_path
-        self.excel_path_label.config(text=os.path.basename(file_path))
+        self.excel_path = file_paths[0]
+        label = os.path.basename(file_paths[0])
+        if len(file_paths) > 1:
+            label = f"{label} и еще {len(file_paths) - 1}"
+        self.excel_path_label.config(text=label)
 
-        try:
-            self.controller.load_from_excel(self.excel_path)
-            self._add_info(f"Таблица загружена из {self.controller.get_source_info()}")
-            self._populate_date_combos()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить таблицу: {e}")
+        def load(context, paths):
+            if len(paths) == 1:
+                self.controller.load_from_excel(paths[0], progress=context.progress)
+            else:
+                self.controller.load_from_excel_files(paths, progress=context.progress)
+            return self.controller.get_unique_dates()
 
-    def _populate_date_combos(self):
-        """Заполняет выпадающие списки датами"""
-        dates = self.controller.get_all_dates()
-        
-        self.date_from_combo['values'] = dates
-        self.date_to_combo['values'] = dates
-        
-        if dates:
-            self.date_from_combo.current(0)
-            self.date_to_combo.current(len(dates) - 1)
+        self._run_task(
+            "Загрузка Excel", load, self._on_table_loaded,
+            "Не удалось загрузить таблицу", list(file_paths),
+        )
+
+    def _on_table_loaded(self, dates: np.ndarray):
+        self._add_info(f"Таблица загружена из {self.controller.get_source_info()}")
+        self._populate_date_combos(dates)
+
+    def _toggle_watch(self):
+        """Включает или выключает периодическую проверку источника"""
+        if self.watch_var.get():
+            self._schedule_watch()
+        elif self._watch_id is not None:
+            self.window.after_cancel(self._watch_id)
+            self._watch_id = None
+
+    def _schedule_watch(self):
+        if self._watch_id is None and self.watch_var.get():
+            self._watch_id = self.window.after(self.WATCH_INTERVAL_MS, self._watch_tick)
+
+    def _watch_tick(self):
+        """Проверяет источник в фоне; пропускает проверку, пока идет другая операция"""
+        self._watch_id = None
+        if self.tasks.busy or not self.controller.can_refresh():
+            self._schedule_watch()
+            return
+
+        def refresh(context):
+            delta = self.controller.refresh()
+            return delta, self.controller.get_unique_dates() if delta.changed else None
+
+        def on_success(result):
+            delta, dates = result
+            if not delta.changed:
+                return
+            self._add_info(f"Таблица обновлена: +{len(delta.added)} / -{len(delta.removed)} строк")
+            self.date_from_combo.set_dates(dates, self.date_from_combo.get())
+            self.date_to_combo.set_dates(dates, self.date_to_combo.get())
+
+        self.tasks.submit(
+            refresh,
+            on_success=on_success,
+            on_error=lambda e: self._add_info(f"Не удалось обновить таблицу: {e}"),
+            on_done=lambda task: self._schedule_watch(),
+            name="Обновление таблицы",
+        )
+
+    def _populate_date_combos(self, dates: np.ndarray):
+        """Передает уникальные даты в поля выбора периода"""
+        first = str(dates[0]) if len(dates) else None
+        last = str(dates[-1]) if len(dates) else None
+        self.date_from_combo.set_dates(dates, first)
+        self.date_to_combo.set_dates(dates, last)
     
     def _get_sum(self):
         """Обработчик получения суммы"""
@@ -154,26 +270,71 @@ class TableUI:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось вычислить сумму: {e}")
     
+    def _get_calendar_sums(self):
+        """Выводит суммы по календарным периодам выбранного диапазона"""
+        if not self.controller.is_table_loaded():
+            messagebox.showwarning("Ошибка", "Сначала загрузите таблицу")
+            return
+
+        labels = {label: unit for unit, label in self.CALENDAR_UNIT_LABELS.items()}
+        unit = labels[self.calendar_unit_combo.get()]
+        date_from = self.date_from_combo.get() or None
+        date_to = self.date_to_combo.get() or None
+
+        try:
+            report = self.controller.get_calendar_sums(unit, date_from, date_to)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось вычислить суммы: {e}")
+            return
+
+        lines = [
+            f"{start} - {end}: {total}"
+            for (start, end), total in zip(
+                report.periods()[: self.MAX_REPORT_LINES], report.sums[: self.MAX_REPORT_LINES]
+            )
+        ]
+        if len(report) > self.MAX_REPORT_LINES:
+            lines.append(f"... и еще {len(report) - self.MAX_REPORT_LINES} периодов")
+        lines.append(f"Итого за {len(report)} периодов: {int(report.sums.sum())}")
+        self._add_info("\n".join(lines))
+
     def _generate_image(self):
         """Генерирует изображение"""
         date_from = self.date_from_combo.get()
         date_to = self.date_to_combo.get()
         
-        try:
-            self.controller.try_generate_image(date_from, date_to)
+        def on_success(_):
+            self._similar_cursor = None
+            self._show_preview(self.controller.image_thumbnail)
             self.send_button.config(state="normal")
             self._add_info(f"Изображение {self.controller.get_image_name().split(os.sep)[-1]} сгенерировано")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось сгенерировать изображение: {e}")
+
+        self._run_task(
+            "Генерация изображения",
+            lambda context: self.controller.try_generate_image(date_from, date_to),
+            on_success,
+            "Не удалось сгенерировать изображение",
+        )
     
+    def _show_preview(self, path: str | None):
+        """Показывает миниатюру сгенерированного изображения"""
+        self._preview_image = tk.PhotoImage(file=path) if path else None
+        self.preview_label.config(image=self._preview_image or "")
+
     def _send_number(self):
         """Обработчик отправки в neo4j"""
-        try:
-            self.controller.push_to_neo4j()
-            self._add_info("Данные отправлены в neo4j")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось отправить данные: {e}")
+        self._run_task(
+            "Отправка в neo4j",
+            lambda context: self.controller.push_to_neo4j(),
+            lambda _: self._add_info("Данные поставлены в очередь записи в neo4j"),
+            "Не удалось отправить данные",
+        )
     
+    def _resume_pending_pushes(self):
+        """Дописывает в neo4j узлы, оставшиеся в журнале с прошлого запуска"""
+        if self.controller.resume_pending_pushes():
+            self._add_info("Незаписанные в прошлый раз узлы дописываются в neo4j в фоне")
+
     def _add_info(self, message: str):
         """Добавляет сообщение в информационный блок"""
         self.info_text.config(state="normal")
@@ -182,19 +343,121 @@ class TableUI:
         self.info_text.config(state="disabled")
         
     def _search_similar_images(self):
-        """Ищет похожие изображения"""
-        try:
+        """Ищет похожие изображения; изображения с той же суммой выводятся
+        постранично, следующая страница - по кнопке «Еще»"""
+        def search(context):
             results = self.controller.search_similar_images()
-            self._add_info(f"Изображение {self.controller.get_image_name().split(os.sep)[-1]} было добавлено в БД: ")
+            return results, self.controller.count_same_sum_images(), self.controller.same_sum_images_page()
+
+        def on_success(found):
+            results, total, page = found
+            lines = [f"Изображение {self.controller.get_image_name().split(os.sep)[-1]} было добавлено в БД: "]
+            if results:
+                lines.append("Похожие изображения:")
+                lines += [f"Путь: {res['image_path']}, Число: {res['sum']}" for res in results]
+            else:
+                lines.append("Похожие изображения не найдены")
+            if total:
+                lines.append(f"С той же суммой: {total}")
+            self._add_info("\n".join(lines))
+            self._show_similar_page(page)
+
+        self._run_task("Поиск похожих", search, on_success, "Не удалось найти похожие изображения")
+
+    def _show_more_similar(self):
+        """Следующая страница изображений с той же суммой"""
+        self._run_task(
+            "Загрузка страницы",
+            lambda context, cursor: self.controller.same_sum_images_page(cursor),
+            self._show_similar_page,
+            "Не удалось загрузить страницу",
+            self._similar_cursor,
+        )
+
+    def _show_similar_page(self, page):
+        self._similar_cursor = page.cursor
+        if page.items:
+            self._add_info("\n".join(f"Путь: {res['image_path']}, Число: {res['sum']}" for res in page.items))
+        if page.cursor is not None:
+            self._add_info("... нажмите «Еще», чтобы показать следующие")
+
+    def _search_similar_by_image(self):
+        """Ищет изображения, похожие по содержимому"""
+        def on_success(results):
             if not results:
-                self._add_info("Похожие изображения не найдены")
+                self._add_info("Похожие по содержимому изображения не найдены")
                 return
-            
-            self._add_info("Похожие изображения:")
-            for res in results:
-                self._add_info(f"Путь: {res['image_path']}, Число: {res['sum']}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось найти похожие изображения: {e}")
+
+            self._add_info("\n".join(
+                ["Похожие по содержимому изображения:"]
+                + [f"Путь: {res['image_path']}, Число: {res['sum']}, Сходство: {res['score']:.3f}" for res in results]
+            ))
+
+        self._run_task(
+            "Поиск по изображению",
+            lambda context: self.controller.search_similar_by_image(),
+            on_success,
+            "Не удалось найти похожие изображения",
+        )
+
+    def _run_task(self, title: str, fn, on_success, error_message: str, *args):
+        """Выполняет fn в фоне; на время выполнения блокирует кнопки действий,
+        чтобы операции над контроллером не выполнялись одновременно"""
+        if self._current_task is not None:
+            messagebox.showwarning("Ошибка", "Дождитесь завершения текущей операции")
+            return
+
+        self._set_busy(title)
+        self._current_task = self.tasks.submit(
+            fn,
+            *args,
+            on_success=on_success,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"{error_message}: {e}"),
+            on_progress=self._on_progress,
+            on_done=self._on_task_done,
+            name=title,
+        )
+
+    def _set_busy(self, title: str):
+        for button in self._action_buttons + [self.send_button, self.more_button]:
+            button.state(["disabled"])
+        self.cancel_button.state(["!disabled"])
+        self.status_label.config(text=f"{title}...")
+        self.progress_bar.config(mode="indeterminate", value=0)
+        self.progress_bar.start(20)
+
+    def _on_progress(self, done: int, total: int | None):
+        if total:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode="determinate", maximum=total, value=done)
+        self.status_label.config(text=f"{self._current_task.name}: {done:,}" + (f" из {total:,}" if total else ""))
+
+    def _on_task_done(self, task: Task):
+        self._current_task = None
+        self.progress_bar.stop()
+        self.progress_bar.config(mode="determinate", value=0)
+        self.cancel_button.state(["disabled"])
+        for button in self._action_buttons:
+            button.state(["!disabled"])
+        if self.controller.is_image_generated():
+            self.send_button.state(["!disabled"])
+        if self._similar_cursor is not None:
+            self.more_button.state(["!disabled"])
+        self.status_label.config(text="Отменено" if task.cancelled else "Готово")
+        if task.cancelled:
+            self._add_info(f"{task.name}: операция отменена")
+
+    def _cancel_task(self):
+        if self._current_task is not None:
+            self._current_task.cancel()
+            self.status_label.config(text=f"{self._current_task.name}: отмена...")
+
+    def _on_close(self):
+        self.watch_var.set(False)
+        self._toggle_watch()
+        self.tasks.shutdown()
+        self.controller.close()
+        self.window.destroy()
     
     def run(self):
         """Запускает приложение"""
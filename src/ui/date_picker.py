@@ -0,0 +1,48 @@
+import bisect
+from tkinter import ttk
+import numpy as np
+
+
+class DatePicker(ttk.Combobox):
+    """Выпадающий выбор даты для таблиц с большим числом дат.
+
+    В список попадает не больше MAX_VISIBLE уникальных дат: соседние с введенной
+    датой или начинающиеся с введенного префикса (например, "2024-03").
+    Строки формируются только для видимого окна при открытии списка.
+    """
+    MAX_VISIBLE = 200
+
+    def __init__(self, master=None, **kwargs):
+        super().__init__(master, postcommand=self._fill_values, **kwargs)
+        self._dates = np.array([], dtype="datetime64[D]")
+
+    def set_dates(self, dates: np.ndarray, value: str | None = None) -> None:
+        """Задает отсортированные уникальные даты и выбранное значение"""
+        self._dates = np.asarray(dates, dtype="datetime64[D]")
+        self["values"] = ()
+        self.set(value or "")
+
+    def _position(self, text: str) -> int:
+        """Индекс первой даты, строковое представление которой не меньше text"""
+        # ISO-строки дат упорядочены так же, как сами даты
+        return bisect.bisect_left(range(len(self._dates)), text, key=lambda i: str(self._dates[i]))
+
+    def _window(self, start: int) -> list[str]:
+        start = max(0, min(start, len(self._dates) - self.MAX_VISIBLE))
+        return list(np.datetime_as_string(self._dates[start:start + self.MAX_VISIBLE]))
+
+    def _fill_values(self) -> None:
+        text = self.get().strip()
+        try:
+            selected = np.datetime64(text, "D") if len(text) == 10 else None
+        except ValueError:
+            selected = None
+
+        if selected is not None or not text:
+            position = self._position(text) if text else 0
+            values = self._window(position - self.MAX_VISIBLE // 2)
+        else:
+            position = self._position(text)
+            values = [v for v in self._window(position) if v.startswith(text)]
+
+        self["values"] = values
@@ -0,0 +1,172 @@
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+import tkinter as tk
+
+
+class TaskCancelled(Exception):
+    """Задача прервана пользователем"""
+
+
+class TaskContext:
+    """Передается в фоновую функцию: сообщает о прогрессе и проверяет отмену"""
+
+    def __init__(self, runner: "TaskRunner", task: "Task"):
+        self._runner = runner
+        self._task = task
+
+    @property
+    def cancelled(self) -> bool:
+        return self._task.cancelled
+
+    def check_cancelled(self) -> None:
+        if self._task.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, done: int, total: int | None = None) -> None:
+        """Сообщает о прогрессе; при отмене бросает TaskCancelled, прерывая работу"""
+        self.check_cancelled()
+        self._runner._post(self._task, "progress", (done, total))
+
+
+class Task:
+    def __init__(self, name: str, callbacks: dict[str, Callable | None]):
+        self.name = name
+        self.future: Future | None = None
+        self._callbacks = callbacks
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """Запрашивает отмену: задача в очереди не запустится, запущенная прервется
+        на ближайшей проверке, а ее результат не будет передан в интерфейс"""
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class TaskRunner:
+    """Выполняет долгие операции в пуле потоков, не блокируя главный поток Tk.
+
+    Результаты, ошибки и прогресс передаются через очередь, которую главный
+    поток опрашивает через after(), поэтому все колбэки выполняются в потоке Tk.
+    """
+    DEFAULT_MAX_WORKERS = 2
+    DEFAULT_POLL_INTERVAL_MS = 50
+
+    def __init__(
+        self,
+        widget: tk.Misc,
+        max_workers: int | None = None,
+        poll_interval_ms: int | None = None,
+    ):
+        self.widget = widget
+        self.poll_interval_ms = poll_interval_ms or self.DEFAULT_POLL_INTERVAL_MS
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or self.DEFAULT_MAX_WORKERS, thread_name_prefix="ui-task"
+        )
+        self._messages: queue.Queue = queue.Queue()
+        self._active: set[Task] = set()
+        self._poll_id: str | None = None
+        self._closed = False
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._active)
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        on_success: Callable[[Any], None] | None = None,
+        on_error: Callable[[Exception], None] | None = None,
+        on_progress: Callable[[int, int | None], None] | None = None,
+        on_done: Callable[["Task"], None] | None = None,
+        name: str = "",
+    ) -> Task:
+        """Запускает fn(context, *args) в фоне.
+
+        on_success/on_error/on_progress вызываются в потоке Tk; on_done - всегда,
+        в том числе после отмены.
+        """
+        if self._closed:
+            raise RuntimeError("TaskRunner остановлен")
+
+        task = Task(
+            name,
+            {"success": on_success, "error": on_error, "progress": on_progress, "done": on_done},
+        )
+        context = TaskContext(self, task)
+        self._active.add(task)
+        task.future = self._executor.submit(self._run, task, context, fn, args)
+        task.future.add_done_callback(
+            lambda future: future.cancelled() and self._post(task, "cancelled", None)
+        )
+        self._schedule_poll()
+        return task
+
+    def cancel_all(self) -> None:
+        for task in list(self._active):
+            task.cancel()
+
+    def shutdown(self) -> None:
+        """Отменяет задачи и останавливает опрос; запущенные потоки не ожидаются"""
+        self._closed = True
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def _run(self, task: Task, context: TaskContext, fn: Callable, args: tuple) -> None:
+        try:
+            context.check_cancelled()
+            result = fn(context, *args)
+        except TaskCancelled:
+            self._post(task, "cancelled", None)
+        except Exception as e:
+            self._post(task, "error", e)
+        else:
+            self._post(task, "success", result)
+
+    def _post(self, task: Task, kind: str, payload: Any) -> None:
+        self._messages.put((task, kind, payload))
+
+    def _schedule_poll(self) -> None:
+        if self._poll_id is None and not self._closed:
+            self._poll_id = self.widget.after(self.poll_interval_ms, self._poll)
+
+    def _poll(self) -> None:
+        self._poll_id = None
+        while True:
+            try:
+                task, kind, payload = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(task, kind, payload)
+
+        if self._active:
+            self._schedule_poll()
+
+    def _dispatch(self, task: Task, kind: str, payload: Any) -> None:
+        if task not in self._active:
+            return
+
+        if kind == "progress":
+            callback = task._callbacks["progress"]
+            if callback is not None and not task.cancelled:
+                callback(*payload)
+            return
+
+        self._active.discard(task)
+        callback = task._callbacks.get(kind)
+        try:
+            if callback is not None and not task.cancelled:
+                callback(payload)
+        finally:
+            if task._callbacks["done"] is not None:
+                task._callbacks["done"](task)
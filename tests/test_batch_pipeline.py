@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+import pytest
+from benchmarks.fakes.openrouter_fake import make_png
+from src.services.batch_pipeline import BatchPipeline, PipelineCheckpoint, parse_periods
+from src.services.graph_service import ImageNode, IngestStats
+from src.services.image_store import ImageStore
+
+PERIODS = [
+    ("2024-01-01", "2024-01-31"),
+    ("2024-02-01", "2024-02-29"),
+    ("2024-03-01", "2024-03-31"),
+]
+
+
+class FakeAnalyzer:
+    def __init__(self, sums: dict[tuple[str, str], int]):
+        self.sums = sums
+
+    def sum_by_periods(self, periods):
+        return [self.sums[period] for period in periods]
+
+
+class FakeImageGen:
+    max_workers = 2
+
+    def __init__(self, store: ImageStore, fail: set[str] = frozenset()):
+        self.store = store
+        self.fail = fail
+        self.generated: list[str] = []
+        self._lock = threading.Lock()
+
+    def generate(self, number: str) -> str:
+        if number in self.fail:
+            raise RuntimeError(f"не удалось сгенерировать {number}")
+        with self._lock:
+            self.generated.append(number)
+        data = make_png(16, 16, seed=int(number))
+        tmp_path = self.store.incoming_path()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.store.add(tmp_path, hashlib.sha256(data).hexdigest(), number=number)
+
+
+class FakeGraph:
+    def __init__(self):
+        self.nodes: list[ImageNode] = []
+
+    def push_image_nodes(self, nodes, batch_size=None):
+        self.nodes.extend(nodes)
+        return IngestStats(nodes=len(nodes), batches=1)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(root=tmp_path / "images", db_path=tmp_path / "store.sqlite3")
+
+
+def make_pipeline(store, checkpoint, sums=None, fail=frozenset()):
+    sums = sums or {period: i + 1 for i, period in enumerate(PERIODS)}
+    return BatchPipeline(
+        FakeAnalyzer(sums),
+        FakeImageGen(store, fail),
+        FakeGraph(),
+        checkpoint=checkpoint,
+        flush_interval=0.05,
+    )
+
+
+def test_checkpoint_ignores_truncated_tail(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    record = {"period_start": "2024-01-01", "period_end": "2024-01-31", "sum": 1}
+    path.write_text(json.dumps(record) + '\n{"period_start": "2024-02', encoding="utf-8")
+
+    checkpoint = PipelineCheckpoint(path)
+    assert len(checkpoint) == 1
+    assert checkpoint.is_done("2024-01-01", "2024-01-31", 1)
+    assert not checkpoint.is_done("2024-01-01", "2024-01-31", 2)
+
+    node = ImageNode(
+        sum=2, period_start="2024-02-01", period_end="2024-02-29", image_path="x.png"
+    )
+    checkpoint.record([node])
+    reloaded = PipelineCheckpoint(path)
+    assert len(reloaded) == 2
+    assert reloaded.is_done("2024-02-01", "2024-02-29", 2)
+
+
+def test_pipeline_resumes_from_checkpoint(store, tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    first = make_pipeline(store, PipelineCheckpoint(path), fail={"2"})
+    report = first.run(PERIODS)
+    assert report.pushed == 2
+    assert [start for start, _, _ in report.failures] == ["2024-02-01"]
+
+    second = make_pipeline(store, PipelineCheckpoint(path))
+    report = second.run(PERIODS)
+    assert report.skipped == 2
+    assert report.pushed == 1
+    assert second.image_gen.generated == ["2"]
+    assert len(PipelineCheckpoint(path)) == 3
+
+
+def test_pipeline_redoes_period_when_sum_changes(store, tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    make_pipeline(store, PipelineCheckpoint(path)).run(PERIODS)
+
+    sums = {period: i + 1 for i, period in enumerate(PERIODS)}
+    sums[PERIODS[0]] = 10
+    pipeline = make_pipeline(store, PipelineCheckpoint(path), sums=sums)
+    report = pipeline.run(PERIODS)
+    assert report.skipped == 2
+    assert [node.sum for node in pipeline.graph_service.nodes] == [10]
+
+    pipeline = make_pipeline(store, PipelineCheckpoint(path))
+    pipeline.resume = False
+    assert pipeline.run(PERIODS).skipped == 0
+
+
+def test_parse_periods():
+    assert parse_periods(["2024-01-01:2024-01-31", "2024-02-05"]) == [
+        ("2024-01-01", "2024-01-31"),
+        ("2024-02-05", "2024-02-05"),
+    ]
+    with pytest.raises(ValueError):
+        parse_periods(["2024-02-01:2024-01-01"])
+    with pytest.raises(ValueError):
+        parse_periods(["вчера"])
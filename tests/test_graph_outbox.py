@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+from neo4j.exceptions import ConstraintError, ServiceUnavailable
+from benchmarks.fakes.neo4j_fake import FakeNeo4jDriver
+from src.services.graph_outbox import GraphOutbox
+from src.services.graph_service import GraphDBService, ImageNode
+
+
+class FlakyService:
+    """Заменитель GraphDBService: недоступен, пока down, и отклоняет узлы с суммой из poison"""
+
+    def __init__(self, poison=(), latency: float = 0.0):
+        self.down = False
+        self.poison = set(poison)
+        self.latency = latency
+        self.written: list[float] = []
+        self.lock = threading.Lock()
+
+    def push_rows(self, rows: list[dict]) -> None:
+        time.sleep(self.latency)
+        if self.down:
+            raise ServiceUnavailable("neo4j недоступен")
+        if any(row["sum"] in self.poison for row in rows):
+            raise ConstraintError("узел нарушает ограничение")
+        with self.lock:
+            self.written += [row["sum"] for row in rows]
+
+
+def make_nodes(sums) -> list[ImageNode]:
+    return [
+        ImageNode(sum=total, period_start="2024-01-01", period_end="2024-01-31", image_path=f"/img/{total}.png")
+        for total in sums
+    ]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(GraphOutbox, "INITIAL_BACKOFF", 0.01)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return tmp_path / "outbox.sqlite3"
+
+
+def test_poison_row_is_dead_lettered(journal):
+    service = FlakyService(poison={13})
+    outbox = GraphOutbox(lambda: service, journal, batch_size=8, max_attempts=3, max_backoff=0.05)
+    try:
+        outbox.put(make_nodes(range(20)))
+        outbox.start()
+        assert outbox.flush(10)
+
+        assert sorted(service.written) == [n for n in range(20) if n != 13]
+        dead = outbox.dead_letters()
+        assert [row["params"]["sum"] for row in dead] == [13]
+        assert dead[0]["error"].startswith("ConstraintError")
+        assert outbox.pending() == 0
+    finally:
+        outbox.close()
+    # Файл узла из outbox_dead не должен удаляться сборкой мусора
+    assert GraphOutbox.pending_paths(journal) == {"/img/13.png"}
+
+
+def test_outage_is_retried_without_dead_letters(journal):
+    service = FlakyService()
+    service.down = True
+    outbox = GraphOutbox(lambda: service, journal, batch_size=4, max_attempts=2, max_backoff=0.02)
+    try:
+        outbox.put(make_nodes(range(10)))
+        outbox.start()
+        assert not outbox.flush(0.3)
+        assert outbox.pending() == 10
+
+        service.down = False
+        assert outbox.flush(10)
+        assert sorted(service.written) == list(range(10))
+        assert outbox.dead_letters() == []
+    finally:
+        outbox.close()
+
+
+def test_flush_waits_only_for_given_nodes(journal):
+    service = FlakyService(latency=0.1)
+    outbox = GraphOutbox(lambda: service, journal, batch_size=1)
+    nodes = make_nodes(range(10))
+    try:
+        outbox.put(nodes)
+        outbox.start()
+        assert outbox.flush(5, node_ids=[nodes[1].id])
+        assert {0, 1} <= set(service.written)
+        assert outbox.pending() > 0
+        # Узла нет в журнале (уже записан или не ставился) - ждать нечего
+        assert outbox.flush(0.01, node_ids=["missing"])
+    finally:
+        outbox.close()
+
+
+def test_journal_survives_restart(journal):
+    driver = FakeNeo4jDriver()
+    service = GraphDBService(driver=driver, ensure_schema=False)
+    nodes = make_nodes([1, 2, 3])
+
+    GraphOutbox(lambda: service, journal).put(nodes)
+    assert GraphOutbox.has_pending(journal)
+
+    outbox = GraphOutbox(lambda: service, journal).start()
+    try:
+        assert outbox.flush(5)
+    finally:
+        outbox.close()
+    assert set(driver.images) == {node.id for node in nodes}
+    assert not GraphOutbox.has_pending(journal)
+
+
+def test_requeued_node_keeps_latest_params(journal):
+    service = FlakyService()
+    outbox = GraphOutbox(lambda: service, journal)
+    node = make_nodes([1])[0]
+    try:
+        outbox.put([node])
+        node.sum = 5
+        outbox.put([node])
+        assert outbox.pending() == 1
+
+        outbox.start()
+        assert outbox.flush(5)
+        assert service.written == [5]
+    finally:
+        outbox.close()
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import time
+import pytest
+from benchmarks.fakes.openrouter_fake import make_png
+from src.services.graph_outbox import GraphOutbox
+from src.services.graph_service import ImageNode
+from src.services.image_store import ImageStore, iter_image_files, normalize_path
+
+OLD = time.time() - 7 * 24 * 3600
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(root=tmp_path / "images", db_path=tmp_path / "store.sqlite3")
+
+
+def add_image(store: ImageStore, seed: int, old: bool = True) -> str:
+    data = make_png(16, 16, seed=seed)
+    tmp_path = store.incoming_path()
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    path = store.add(tmp_path, hashlib.sha256(data).hexdigest(), number=str(seed))
+    if old:
+        os.utime(path, (OLD, OLD))
+    return path
+
+
+def test_add_deduplicates_by_content(store):
+    first = add_image(store, 1)
+    second = add_image(store, 1)
+
+    assert first == second
+    assert store.stats()["files"] == 1
+    assert os.listdir(store.incoming_dir) == []
+
+
+def test_gc_keeps_referenced_and_pending_paths(store, tmp_path):
+    in_graph = add_image(store, 1)
+    pending = add_image(store, 2)
+    orphan = add_image(store, 3)
+    fresh = add_image(store, 4, old=False)
+    store.thumbnail(orphan)
+
+    journal = tmp_path / "outbox.sqlite3"
+    node = ImageNode(sum=2, period_start="2024-01-01", period_end="2024-01-31", image_path=pending)
+    outbox = GraphOutbox(lambda: None, journal)
+    outbox.put([node])
+    outbox.close()
+
+    report = store.gc({in_graph} | GraphOutbox.pending_paths(journal))
+
+    assert os.path.exists(in_graph) and os.path.exists(pending)
+    # Свежий файл может еще ждать записи узла
+    assert os.path.exists(fresh)
+    assert not os.path.exists(orphan)
+    assert store._thumbnails(orphan) and not any(os.path.exists(p) for p in store._thumbnails(orphan))
+    assert (report.scanned, report.referenced, report.deleted) == (4, 2, 1)
+    assert store.stats()["files"] == 3
+
+
+def test_gc_dry_run_deletes_nothing(store):
+    orphan = add_image(store, 1)
+
+    report = store.gc([], dry_run=True)
+
+    assert report.deleted == 1
+    assert os.path.exists(orphan)
+    assert store.stats()["files"] == 1
+
+
+def test_gc_removes_stale_incoming_files(store):
+    leftover = store.incoming_path()
+    with open(leftover, "wb") as f:
+        f.write(b"partial")
+    os.utime(leftover, (OLD, OLD))
+
+    store.gc([])
+
+    assert not os.path.exists(leftover)
+
+
+def test_iter_image_files_skips_thumbnails_and_incoming(store):
+    path = add_image(store, 1)
+    store.thumbnail(path)
+    with open(store.incoming_path(), "wb") as f:
+        f.write(b"partial")
+
+    files = {normalize_path(entry.path) for entry in iter_image_files(store.root)}
+
+    assert files == {normalize_path(path)}
@@ -0,0 +1,257 @@
+import time
+import pytest
+from src.services import request_scheduler
+from src.services.request_scheduler import (
+    AimdLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    RequestScheduler,
+    RetryableStatus,
+    TokenBucket,
+    parse_rate_limit,
+    parse_retry_after,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(RequestScheduler, "BASE_BACKOFF", 0.001)
+
+
+def fail_with(error):
+    def attempt(remaining):
+        raise error
+    return attempt
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_in > 0
+
+    time.sleep(0.06)
+    assert breaker.allow()  # пробный запрос
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_abandoned_probe_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.abandon()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_scheduler_rejects_while_circuit_is_open():
+    scheduler = RequestScheduler(
+        rate=0, max_attempts=10, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+
+    with pytest.raises(CircuitOpenError):
+        scheduler.call(fail_with(ConnectionError("нет связи")))
+    assert scheduler.breaker.state == CircuitBreaker.OPEN
+
+
+def test_client_errors_close_the_breaker():
+    scheduler = RequestScheduler(rate=0, breaker=CircuitBreaker(failure_threshold=2))
+    scheduler.breaker.record_failure()
+
+    with pytest.raises(KeyError):
+        scheduler.call(fail_with(KeyError("нет поля")))
+    assert scheduler.breaker.failures == 0
+
+
+def test_interrupt_leaves_breaker_state_alone():
+    scheduler = RequestScheduler(rate=0, breaker=CircuitBreaker(failure_threshold=2))
+    scheduler.breaker.record_failure()
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.call(fail_with(KeyboardInterrupt()))
+    assert scheduler.breaker.failures == 1
+    assert scheduler.limiter.in_flight == 0
+
+
+def test_retries_until_success():
+    scheduler = RequestScheduler(rate=0, max_attempts=5)
+    outcomes = [RetryableStatus(503), ConnectionError("обрыв"), "ok"]
+
+    def attempt(remaining):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.call(attempt) == "ok"
+    assert outcomes == []
+
+
+def test_last_error_is_raised_after_max_attempts():
+    scheduler = RequestScheduler(rate=0, max_attempts=2, breaker=CircuitBreaker(failure_threshold=10))
+
+    with pytest.raises(RetryableStatus):
+        scheduler.call(fail_with(RetryableStatus(500)))
+
+
+def test_deadline_stops_waiting_for_retry_after():
+    scheduler = RequestScheduler(rate=0, max_attempts=5)
+    start = time.monotonic()
+
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(fail_with(RetryableStatus(429, retry_after=5)), deadline=0.2)
+    assert time.monotonic() - start < 1
+
+
+def test_deadline_expires_in_queue():
+    scheduler = RequestScheduler(rate=1, burst=1)
+    scheduler.call(lambda remaining: None)
+
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(lambda remaining: None, deadline=0.1)
+
+
+def test_attempt_gets_remaining_time():
+    scheduler = RequestScheduler(rate=0)
+    seen = []
+
+    scheduler.call(lambda remaining: seen.append(remaining), deadline=10)
+
+    assert 0 < seen[0] <= 10
+
+
+def test_token_bucket_rate_and_pause():
+    bucket = TokenBucket(rate=100, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        assert bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+    bucket.pause(0.1)
+    assert not bucket.acquire(deadline=time.monotonic() + 0.05)
+    assert bucket.acquire(deadline=time.monotonic() + 1)
+
+
+def test_token_bucket_no_burst_after_pause():
+    bucket = TokenBucket(rate=20, burst=5)
+    bucket.pause(0.3)
+    time.sleep(0.3)
+    # За паузу жетоны не накопились: второй ждет обычного интервала
+    assert bucket.acquire(deadline=time.monotonic() + 0.02)
+    assert not bucket.acquire(deadline=time.monotonic() + 0.02)
+
+
+def test_aimd_halves_once_per_generation():
+    limiter = AimdLimiter(8)
+    first, second = limiter.acquire(), limiter.acquire()
+
+    limiter.release(first, throttled=True)
+    limiter.release(second, throttled=True)  # начат до уменьшения
+    assert limiter.limit == 4
+
+    started = limiter.acquire()
+    limiter.release(started, throttled=False)
+    assert limiter.limit == pytest.approx(4.25)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after("") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("скоро") is None
+
+
+def test_parse_rate_limit_formats():
+    now = time.time()
+    limit, reset, absolute = parse_rate_limit(
+        {"X-RateLimit-Limit": "20", "X-RateLimit-Reset": str(int((now + 60) * 1000))}
+    )
+    assert limit == 20 and absolute and reset == pytest.approx(now + 60, abs=1)
+
+    _, reset, absolute = parse_rate_limit({"X-RateLimit-Limit": "20", "X-RateLimit-Reset": "30"})
+    assert not absolute and reset == pytest.approx(now + 30, abs=1)
+
+    assert parse_rate_limit({}) is None
+    assert parse_rate_limit({"X-RateLimit-Limit": "0", "X-RateLimit-Reset": "30"}) is None
+
+
+def no_settings(monkeypatch, rate=None):
+    monkeypatch.setattr(
+        request_scheduler, "get_settings", lambda: type("Settings", (), {"openrouter_rate_limit": rate})
+    )
+
+
+def test_rate_follows_quota_window(monkeypatch):
+    no_settings(monkeypatch)
+    scheduler = RequestScheduler()
+    assert scheduler.bucket.rate == RequestScheduler.DEFAULT_RATE
+
+    def observe(reset_at):
+        scheduler.observe_limits({"X-RateLimit-Limit": "60", "X-RateLimit-Reset": str(int(reset_at * 1000))})
+
+    # Длина окна известна только после смены момента сброса
+    base = time.time() + 5
+    observe(base)
+    observe(base)
+    assert scheduler.bucket.rate == RequestScheduler.DEFAULT_RATE
+
+    observe(base + 20)  # пропущено одно окно
+    assert scheduler.bucket.rate == pytest.approx(0.9 * 60 / 20)
+    observe(base + 30)
+    assert scheduler.bucket.rate == pytest.approx(0.9 * 60 / 10)
+
+
+def test_rate_follows_seconds_until_reset(monkeypatch):
+    no_settings(monkeypatch)
+    scheduler = RequestScheduler()
+
+    for seconds in ("4", "10", "7"):
+        scheduler.observe_limits({"X-RateLimit-Limit": "60", "X-RateLimit-Reset": seconds})
+
+    assert scheduler.bucket.rate == pytest.approx(0.9 * 60 / 10, rel=0.01)
+
+
+def test_explicit_rate_ignores_headers(monkeypatch):
+    no_settings(monkeypatch, 7.0)
+    assert RequestScheduler().bucket.rate == 7.0
+
+    scheduler = RequestScheduler(rate=3)
+    for reset in ("5", "10"):
+        scheduler.observe_limits({"X-RateLimit-Limit": "60", "X-RateLimit-Reset": reset})
+    assert scheduler.bucket.rate == 3
+    assert RequestScheduler(rate=0).bucket.rate is None
+
+
+def test_image_gen_learns_quota_from_fake_server(monkeypatch, tmp_path):
+    from benchmarks.fakes.openrouter_fake import FakeOpenRouterServer
+    from src.services.image_generator import ImageGen
+    from src.services.image_store import ImageStore
+
+    no_settings(monkeypatch)
+    store = ImageStore(root=tmp_path / "images", db_path=tmp_path / "store.sqlite3")
+    with FakeOpenRouterServer(latency=0.01, quota=20, quota_burst=4, max_concurrent=4) as server:
+        gen = ImageGen(api_key="test", url=server.url, max_workers=4, store=store)
+        try:
+            results = gen.create_many(str(n) for n in range(40))
+        finally:
+            gen.close()
+
+    assert all(result.ok for result in results)
+    assert gen.scheduler.bucket.rate == pytest.approx(18, rel=0.1)
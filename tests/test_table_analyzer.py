@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+from src.services.table_analyzer import CALENDAR_UNITS, TableAnalyzer, calendar_bounds
+from src.services.table_data import TableData, TableDelta, diff_tables
+
+START = np.datetime64("2023-01-01")
+DAYS = 400
+
+
+def days(*values: str) -> np.ndarray:
+    return np.array(values, dtype="datetime64[D]")
+
+
+def random_table(rng: np.random.Generator, rows: int) -> TableData:
+    dates = START + rng.integers(0, DAYS, rows).astype("timedelta64[D]")
+    dates[rng.random(rows) < 0.05] = np.datetime64("NaT", "D")
+    return TableData.from_arrays(dates, rng.integers(-50, 100, rows))
+
+
+def edit(rng: np.random.Generator, table: TableData) -> TableData:
+    """Новая версия таблицы: правки на месте, удаление хвоста и новые строки"""
+    dates, values = table.dates.copy(), table.values.copy()
+    changed = rng.random(len(values)) < 0.1
+    values[changed] = rng.integers(-50, 100, changed.sum())
+    keep = len(values) - int(rng.integers(0, 5))
+    tail = random_table(rng, int(rng.integers(0, 30)))
+    return TableData.from_arrays(
+        np.concatenate([dates[:keep], tail.dates]), np.concatenate([values[:keep], tail.values])
+    )
+
+
+def brute_sum(table: TableData, start, end) -> int:
+    valid = table.date_valid
+    dates, values = table.dates[valid], table.values[valid]
+    return int(values[(dates >= start) & (dates <= end)].sum())
+
+
+def assert_matches(analyzer: TableAnalyzer, table: TableData, rng: np.random.Generator) -> None:
+    valid_dates = table.dates[table.date_valid]
+    assert analyzer.unique_dates.tolist() == np.unique(valid_dates).tolist()
+
+    for _ in range(20):
+        start = START + np.timedelta64(int(rng.integers(-10, DAYS)), "D")
+        end = start + np.timedelta64(int(rng.integers(0, 120)), "D")
+        assert analyzer.sum_by_period(start, end) == brute_sum(table, start, end)
+
+    periods = analyzer.sum_by_calendar("month")
+    expected = [brute_sum(table, s, e) for s, e in zip(periods.starts, periods.ends)]
+    assert periods.sums.tolist() == expected
+
+
+def test_calendar_bounds_cover_range():
+    for unit in CALENDAR_UNITS:
+        starts, ends = calendar_bounds(np.datetime64("2023-02-15"), np.datetime64("2024-11-03"), unit)
+        assert starts[0] <= np.datetime64("2023-02-15") <= ends[0]
+        assert starts[-1] <= np.datetime64("2024-11-03") <= ends[-1]
+        assert (starts[1:] == ends[:-1] + np.timedelta64(1, "D")).all()
+
+
+def test_quarter_and_week_bounds():
+    starts, ends = calendar_bounds(np.datetime64("2024-05-20"), np.datetime64("2024-08-01"), "quarter")
+    assert starts.tolist() == days("2024-04-01", "2024-07-01").tolist()
+    assert ends[-1] == np.datetime64("2024-09-30")
+
+    starts, _ = calendar_bounds(np.datetime64("2024-05-22"), np.datetime64("2024-05-22"), "week")
+    assert starts[0] == np.datetime64("2024-05-20")  # понедельник
+
+
+def test_streamed_chunks_match_whole_table():
+    rng = np.random.default_rng(1)
+    table = random_table(rng, 3000)
+    analyzer = TableAnalyzer()
+    for start in range(0, len(table), 700):
+        analyzer.append(table.take(np.arange(start, min(start + 700, len(table)))))
+
+    assert_matches(analyzer, table, rng)
+
+
+@pytest.mark.parametrize("compact_min_rows", [4096, 10])
+def test_deltas_match_brute_force(monkeypatch, compact_min_rows):
+    """Цепочка инкрементальных обновлений дает те же суммы, что и полный пересчет;
+    при малом COMPACT_MIN_ROWS слой изменений сливается с основным по ходу"""
+    monkeypatch.setattr(TableAnalyzer, "COMPACT_MIN_ROWS", compact_min_rows)
+    rng = np.random.default_rng(2)
+    table = random_table(rng, 2000)
+    analyzer = TableAnalyzer(table)
+
+    for _ in range(15):
+        new_table = edit(rng, table)
+        analyzer.apply_delta(diff_tables(table, new_table))
+        table = new_table
+        assert_matches(analyzer, table, rng)
+
+
+def test_compaction_keeps_sums():
+    rng = np.random.default_rng(3)
+    table = random_table(rng, 1000)
+    analyzer = TableAnalyzer(table)
+    new_table = edit(rng, table)
+    analyzer.apply_delta(diff_tables(table, new_table))
+    before = analyzer.sum_by_calendar("week").sums.copy()
+
+    # dates сливает слой изменений с основным слоем
+    dates = analyzer.dates
+    assert (np.diff(dates.astype("int64")) >= 0).all()
+    assert analyzer.sum_by_calendar("week").sums.tolist() == before.tolist()
+    assert analyzer.values.sum() == new_table.values[new_table.date_valid].sum()
+
+
+def test_removing_unknown_row_keeps_sums_consistent():
+    analyzer = TableAnalyzer(TableData.from_arrays(days("2024-01-01", "2024-01-02"), [5, 7]))
+    analyzer.remove(TableData.from_arrays(days("2024-01-02"), [3]))
+
+    assert analyzer.sum_by_period("2024-01-01", "2024-01-31") == 9
+    analyzer.dates  # слияние
+    assert analyzer.sum_by_period("2024-01-01", "2024-01-31") == 9
+
+
+def test_full_delta_replaces_index():
+    rng = np.random.default_rng(4)
+    analyzer = TableAnalyzer(random_table(rng, 500))
+    replacement = random_table(rng, 100)
+
+    analyzer.apply_delta(TableDelta.replace(replacement))
+
+    assert_matches(analyzer, replacement, rng)
+
+
+def test_diff_tables_by_position():
+    old = TableData.from_arrays(days("2024-01-01", "2024-01-02", "2024-01-03"), [1, 2, 3])
+    new = TableData.from_arrays(days("2024-01-01", "2024-01-02", "2024-01-05", "2024-01-06"), [1, 20, 3, 4])
+
+    delta = diff_tables(old, new)
+
+    assert delta.removed.values.tolist() == [2, 3]
+    assert delta.added.values.tolist() == [20, 3, 4]
+    assert not diff_tables(new, new).changed
+
+
+def test_diff_tables_treats_nat_rows_as_equal():
+    dates = days("2024-01-01", "NaT")
+    table = TableData.from_arrays(dates, [1, 2])
+
+    assert not diff_tables(table, TableData.from_arrays(dates.copy(), [1, 2])).changed
+
+
+def test_diff_tables_with_new_columns_replaces():
+    old = TableData.from_arrays(days("2024-01-01"), [1])
+    new = TableData.from_arrays(old.dates, [1], columns=("Дата", "Сумма"))
+
+    delta = diff_tables(old, new)
+
+    assert delta.full is new
@@ -0,0 +1,121 @@
+import os
+from unittest import mock
+import numpy as np
+import pytest
+from src.services.table_cache import TableCache
+from src.services.table_data import TableData
+
+
+def make_table(values, columns=("Date", "Value")) -> TableData:
+    dates = np.datetime64("2024-01-01", "D") + np.arange(len(values))
+    return TableData.from_arrays(dates, values, columns=columns)
+
+
+def assert_same(actual: TableData, expected: TableData) -> None:
+    assert actual.columns == expected.columns
+    for name in TableCache.COLUMNS:
+        np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TableCache(cache_dir=tmp_path / "cache")
+
+
+def leftovers(cache: TableCache) -> list[str]:
+    return [name for name in os.listdir(cache.cache_dir) if name.startswith(".")]
+
+
+def test_put_and_get_roundtrip(cache):
+    table = make_table([1, 2, 3], columns=("Дата", "Сумма"))
+    cache.put("a", table)
+
+    cached = cache.get("a")
+    assert isinstance(cached.values, np.memmap)
+    assert_same(cached, table)
+    assert cache.get("b") is None
+    assert cache.get(None) is None
+
+
+def test_put_replaces_existing_entry(cache):
+    cache.put("a", make_table([1, 2, 3]))
+    old = cache.get("a")
+
+    cache.put("a", make_table([4, 5]))
+    assert_same(cache.get("a"), make_table([4, 5]))
+    # Прежний memory map продолжает читаться
+    assert old.values.tolist() == [1, 2, 3]
+    assert leftovers(cache) == []
+
+
+def test_failed_put_keeps_previous_entry(cache):
+    cache.put("a", make_table([1, 2, 3]))
+
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if ".tmp-" in str(src):
+            raise OSError("диск недоступен")
+        return real_replace(src, dst)
+
+    with mock.patch("src.services.table_cache.os.replace", side_effect=replace):
+        cache.put("a", make_table([4, 5]))
+
+    assert_same(cache.get("a"), make_table([1, 2, 3]))
+    assert leftovers(cache) == []
+
+
+def test_writer_streams_chunks(cache):
+    chunks = [make_table([1, 2]), make_table([3]), make_table([])]
+    with cache.writer("a") as writer:
+        for chunk in chunks:
+            writer.append(chunk)
+        table = writer.commit()
+
+    assert isinstance(table.values, np.memmap)
+    assert_same(table, TableData.concat(chunks))
+    assert_same(cache.get("a"), TableData.concat(chunks))
+    assert leftovers(cache) == []
+
+
+def test_writer_failure_returns_none(cache):
+    cache.put("a", make_table([1, 2, 3]))
+    writer = cache.writer("a")
+    writer.append(make_table([4, 5]))
+
+    error = OSError("нет места")
+    with mock.patch("src.services.table_cache.shutil.copyfileobj", side_effect=error):
+        assert writer.commit() is None
+
+    assert_same(cache.get("a"), make_table([1, 2, 3]))
+    assert leftovers(cache) == []
+
+
+def test_abort_discards_partial_entry(cache):
+    with cache.writer("a") as writer:
+        writer.append(make_table([1, 2]))
+
+    assert cache.get("a") is None
+    assert leftovers(cache) == []
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put("a", make_table(range(1000)))
+    entry_size = sum(f.stat().st_size for f in cache._entry_dir("a").iterdir())
+    small = TableCache(cache_dir=cache.cache_dir, max_bytes=int(entry_size * 2.5))
+
+    small.put("b", make_table(range(1000)))
+    old = small._entry_dir("a") / TableCache.META_FILE
+    os.utime(old, (1, 1))
+    small.put("c", make_table(range(1000)))
+
+    assert small.get("a") is None
+    assert small.get("b") is not None
+    assert small.get("c") is not None
+
+
+def test_clear(cache):
+    cache.put("a", make_table([1]))
+    cache.clear()
+    assert cache.get("a") is None
+    assert not cache.cache_dir.exists()
@@ -0,0 +1,55 @@
+import numpy as np
+from src.services.table_data import TableData
+
+
+def make_table(dates, values) -> TableData:
+    return TableData.from_arrays(np.array(dates, dtype="datetime64[D]"), values)
+
+
+def test_from_arrays_marks_missing_dates_invalid():
+    table = make_table(["2024-01-01", "NaT", "2024-01-03"], [1, 2, 3])
+
+    assert table.dates.dtype == np.dtype("datetime64[D]")
+    assert table.values.dtype == np.dtype("int64")
+    assert table.date_valid.tolist() == [True, False, True]
+    assert table.value_valid.all()
+
+
+def test_empty_table_and_empty_property():
+    table = TableData.empty_table(columns=("Дата", "Сумма"))
+
+    assert table.empty
+    assert len(table) == 0
+    assert table.columns == ("Дата", "Сумма")
+    assert not make_table(["2024-01-01"], [1]).empty
+
+
+def test_concat_keeps_order_and_columns():
+    first = make_table(["2024-01-02", "2024-01-01"], [2, 1])
+    second = make_table(["2024-01-03"], [3])
+
+    table = TableData.concat([first, second])
+
+    assert table.values.tolist() == [2, 1, 3]
+    assert table.dates.tolist() == first.dates.tolist() + second.dates.tolist()
+    assert table.columns == first.columns
+
+
+def test_concat_of_nothing_is_empty():
+    table = TableData.concat([])
+
+    assert table.empty
+    assert table.dates.dtype == np.dtype("datetime64[D]")
+
+
+def test_take_by_mask_and_indices():
+    table = make_table(["2024-01-01", "2024-01-02", "2024-01-03"], [1, 2, 3])
+
+    assert table.take(np.array([True, False, True])).values.tolist() == [1, 3]
+    assert table.take(np.array([2, 0])).values.tolist() == [3, 1]
+
+
+def test_nbytes_counts_all_columns():
+    table = make_table(["2024-01-01", "2024-01-02"], [1, 2])
+
+    assert table.nbytes == 2 * 8 + 2 * 8 + 2 + 2
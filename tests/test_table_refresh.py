@@ -0,0 +1,37 @@
+import openpyxl
+import pytest
+from src.controllers.app_controller import TableController
+from src.services.table_cache import TableCache
+
+
+def write_workbook(path, rows) -> None:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Date", "Value"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+@pytest.fixture
+def controller(tmp_path):
+    controller = TableController()
+    controller._table_cache = TableCache(cache_dir=tmp_path / "cache")
+    return controller
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_refresh_applies_excel_changes(tmp_path, controller, streaming):
+    path = tmp_path / "table.xlsx"
+    write_workbook(path, [["01.01.2024", 1], ["02.01.2024", 2], ["03.01.2024", 3]])
+    controller.load_from_excel(str(path), streaming=streaming)
+    assert controller.get_sum_for_period("2024-01-01", "2024-12-31") == 6
+
+    write_workbook(path, [["01.01.2024", 1], ["02.01.2024", 20], ["05.01.2024", 5], ["06.01.2024", 6]])
+    delta = controller.refresh()
+
+    assert len(delta.removed) == 2 and len(delta.added) == 3
+    assert controller.get_sum_for_period("2024-01-01", "2024-12-31") == 32
+    assert controller.get_sum_for_period("2024-01-03", "2024-01-03") == 0
+    assert not controller.refresh().changed
+